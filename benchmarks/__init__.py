@@ -0,0 +1 @@
+"""Benchmarks of data-check over synthetic tables, run locally with DuckDB"""
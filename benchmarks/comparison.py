@@ -0,0 +1,114 @@
+"""Time the comparison stages with native comparisons and fingerprints of arrays and structs, against comparisons of values casted as strings, with DuckDB.
+
+CPU time sums the time of all DuckDB threads, the closest local measure of BigQuery slot time.
+
+Usage: python -m benchmarks.comparison --rows 1000000 --columns 10 100
+"""
+import argparse
+import json
+import time
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional
+
+from data_check.models.comparison import ComparisonTolerance
+from data_check.models.table import BigQueryDataType, ColumnSchema, TableSchema
+from data_check.processors.duckdb import DuckDBProcessor
+from data_check.query.query_duckdb import QueryDuckDB
+
+from .synthetic import SyntheticTables
+
+
+def as_strings(schema: TableSchema) -> TableSchema:
+    """Schema whose columns are all compared as strings, as done before native comparisons.
+
+    Arrays are compared as sorted strings with the ignore_array_duplicates tolerance.
+    """
+    return TableSchema(
+        table_name=schema.table_name,
+        columns=[
+            ColumnSchema(name=column.name, field_type=BigQueryDataType.ANY, mode=column.mode)
+            for column in schema.columns
+        ],
+    )
+
+
+def time_stage(results: List[Dict[str, Any]], stage: str, function: Callable, **params) -> None:
+    start, start_cpu = time.perf_counter(), time.process_time()
+    function()
+    results.append(
+        {
+            **params,
+            "stage": stage,
+            "seconds": round(time.perf_counter() - start, 6),
+            "cpu_seconds": round(time.process_time() - start_cpu, 6),
+        }
+    )
+
+
+def run_benchmark(rows: int, columns: int, diff_rate: float) -> List[Dict[str, Any]]:
+    """Time the ratios and plain diff of two synthetic tables, for each comparison"""
+    client = QueryDuckDB()
+    tables = SyntheticTables(rows=rows, columns=columns, diff_rate=diff_rate)
+    tables.create(client)
+
+    processor = DuckDBProcessor(tables.table1, tables.table2, client=client)
+    common_table_schema = processor.get_common_schema_from_tables()
+    columns_names = tables.columns_names
+
+    results = []
+    for comparison, schema, tolerance in [
+        ("strings", as_strings(common_table_schema), ComparisonTolerance(ignore_array_duplicates=True)),
+        ("native", common_table_schema, ComparisonTolerance()),
+    ]:
+        processor.set_config_data(
+            primary_key="id",
+            columns_to_compare=columns_names,
+            sampling_rate=100,
+            tolerance=tolerance,
+        )
+        params = {"rows": rows, "columns": columns, "comparison": comparison}
+        time_stage(
+            results,
+            "ratios",
+            lambda: processor.get_column_diff_ratios(
+                selected_columns=columns_names, common_table_schema=schema
+            ),
+            **params,
+        )
+        time_stage(
+            results,
+            "plain diff",
+            lambda: processor.get_plain_diff(
+                selected_columns=columns_names, common_table_schema=schema
+            ),
+            **params,
+        )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--diff-rate", type=float, default=0.01, help="Fraction of rows changed in the second table")
+    parser.add_argument("--output", help="JSON file of the results, printed when omitted")
+    args = parser.parse_args(argv)
+
+    results = [
+        result
+        for rows, columns in product(args.rows, args.columns)
+        for result in run_benchmark(rows, columns, args.diff_rate)
+    ]
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        for result in results:
+            print(
+                f"{result['rows']:>10} rows {result['columns']:>5} columns  {result['comparison']:<8}"
+                f"  {result['stage']:<11}  {result['seconds']:.3f}s  cpu {result['cpu_seconds']:.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
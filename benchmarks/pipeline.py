@@ -0,0 +1,156 @@
+"""Time each stage of the diff pipeline over synthetic tables of increasing scale, with DuckDB.
+
+Usage: python -m benchmarks.pipeline --scale small --output results.json
+"""
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional
+
+import duckdb
+import sqlglot
+
+from data_check.data_formatter import highlight_diff_dataset
+from data_check.processors.duckdb import DuckDBProcessor
+from data_check.query.query_duckdb import QueryDuckDB
+
+from .synthetic import SyntheticTables
+
+# Rows and columns of the generated tables for each scale
+SCALES = {
+    "small": {"rows": [10_000, 100_000], "columns": [10, 100]},
+    "medium": {"rows": [1_000_000, 10_000_000], "columns": [10, 100, 1_000]},
+    "large": {"rows": [100_000_000], "columns": [10, 1_000, 5_000]},
+}
+
+# Rows of the diff page formatted, as displayed by the app
+PAGE_SIZE = 500
+
+
+def time_stage(results: List[Dict[str, Any]], stage: str, function: Callable, **params) -> Any:
+    start = time.perf_counter()
+    value = function()
+    results.append(
+        {**params, "stage": stage, "seconds": round(time.perf_counter() - start, 6)}
+    )
+    return value
+
+
+def run_benchmark(rows: int, columns: int, diff_rate: float) -> List[Dict[str, Any]]:
+    """Time each stage of a diff between two synthetic tables"""
+    params = {"rows": rows, "columns": columns, "diff_rate": diff_rate}
+    results = []
+
+    client = QueryDuckDB()
+    tables = SyntheticTables(rows=rows, columns=columns, diff_rate=diff_rate)
+    time_stage(results, "table generation", lambda: tables.create(client), **params)
+
+    processor = DuckDBProcessor(tables.table1, tables.table2, client=client)
+    processor.set_config_data(
+        primary_key="id", columns_to_compare=tables.columns_names, sampling_rate=100
+    )
+
+    common_table_schema = time_stage(
+        results,
+        "schema diff",
+        lambda: (
+            processor.get_diff_columns(),
+            processor.get_common_schema_from_tables(),
+        )[1],
+        **params,
+    )
+    time_stage(
+        results,
+        "query generation",
+        lambda: [
+            query.sql(dialect="duckdb")
+            for queries in processor.get_stages_queries(
+                selected_columns=tables.columns_names,
+                common_table_schema=common_table_schema,
+            ).values()
+            for query in queries
+        ],
+        **params,
+    )
+    time_stage(
+        results,
+        "health check",
+        lambda: processor.run_health_check(
+            selected_columns=tables.columns_names,
+            common_table_schema=common_table_schema,
+        ),
+        **params,
+    )
+    time_stage(
+        results,
+        "ratios",
+        lambda: processor.get_column_diff_ratios(
+            selected_columns=tables.columns_names,
+            common_table_schema=common_table_schema,
+        ),
+        **params,
+    )
+    _, plain_diff = time_stage(
+        results,
+        "plain diff",
+        lambda: processor.get_plain_diff(
+            selected_columns=tables.columns_names,
+            common_table_schema=common_table_schema,
+        ),
+        **params,
+    )
+    time_stage(
+        results,
+        "formatting",
+        lambda: highlight_diff_dataset(
+            plain_diff.head(PAGE_SIZE), columns=tables.columns_names
+        ).to_html(),
+        **params,
+    )
+    return results
+
+
+def run_benchmarks(
+    rows: List[int], columns: List[int], diff_rate: float
+) -> Dict[str, Any]:
+    results = []
+    for rows_count, columns_count in product(rows, columns):
+        results += run_benchmark(rows_count, columns_count, diff_rate)
+    return {
+        "metadata": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "duckdb": duckdb.__version__,
+            "sqlglot": sqlglot.__version__,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--rows", type=int, nargs="+", help="Overrides the rows of the scale")
+    parser.add_argument("--columns", type=int, nargs="+", help="Overrides the columns of the scale")
+    parser.add_argument("--diff-rate", type=float, default=0.01, help="Fraction of rows changed in the second table")
+    parser.add_argument("--output", help="JSON file of the results, printed when omitted")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        rows=args.rows or SCALES[args.scale]["rows"],
+        columns=args.columns or SCALES[args.scale]["columns"],
+        diff_rate=args.diff_rate,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
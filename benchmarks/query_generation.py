@@ -0,0 +1,89 @@
+"""Time the generation of the queries of each stage against the number of compared columns, without running them.
+
+Usage: python -m benchmarks.query_generation --columns 10 100 1000 5000
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from data_check.cache import QUERY_CACHE, QUERY_SQL_CACHE, get_query_sql
+from data_check.models.table import ColumnSchema, TableSchema
+from data_check.processors.bigquery import BigQueryProcessor
+from data_check.query.query_duckdb import QueryDuckDB
+
+COLUMN_TYPES = ["INTEGER", "STRING", "FLOAT", "DATE", "TIMESTAMP"]
+
+
+def get_schema(columns: int) -> TableSchema:
+    return TableSchema(
+        table_name="common",
+        columns=[
+            ColumnSchema(
+                name=f"column_{index}",
+                field_type=COLUMN_TYPES[index % len(COLUMN_TYPES)],
+                mode="REPEATED" if index % 10 == 9 else "NULLABLE",
+            )
+            for index in range(columns)
+        ],
+    )
+
+
+def generate_queries(columns: int) -> None:
+    """Build the queries of all stages and their SQL, as done on each Streamlit rerun"""
+    schema = get_schema(columns)
+    # BigQuery queries are generated without running them, the client is never used
+    processor = BigQueryProcessor(
+        "my-project.my_dataset.table1", "my-project.my_dataset.table2", client=QueryDuckDB()
+    )
+    processor.set_config_data(
+        primary_key="id", columns_to_compare=schema.columns_names, sampling_rate=10
+    )
+    for queries in processor.get_stages_queries(
+        selected_columns=schema.columns_names, common_table_schema=schema
+    ).values():
+        for query in queries:
+            get_query_sql(query, processor.dialect)
+    get_query_sql(
+        processor.get_query_plain_diff(
+            selected_columns=schema.columns_names, common_table_schema=schema
+        ),
+        processor.dialect,
+    )
+
+
+def run_benchmark(columns: int) -> List[Dict[str, Any]]:
+    """Time a first generation, then a rerun served by the memoized queries"""
+    QUERY_CACHE.clear()
+    QUERY_SQL_CACHE.clear()
+    results = []
+    for run in ["cold", "memoized"]:
+        start = time.perf_counter()
+        generate_queries(columns)
+        results.append(
+            {
+                "columns": columns,
+                "run": run,
+                "seconds": round(time.perf_counter() - start, 6),
+            }
+        )
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--columns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--output", help="JSON file of the results, printed when omitted")
+    args = parser.parse_args(argv)
+
+    results = [result for columns in args.columns for result in run_benchmark(columns)]
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        for result in results:
+            print(f"{result['columns']:>6} columns  {result['run']:<8}  {result['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from typing import List
+
+from data_check.query.query_duckdb import QueryDuckDB
+
+# Types of the generated columns, in turn: value of row `i` and its changed value in the second table
+COLUMN_TYPES = {
+    "INTEGER": ("i % 1000", "{column} + 1"),
+    "FLOAT": ("(i % 1000) / 10.0", "{column} + 0.5"),
+    "STRING": ("'value_' || cast(i % 1000 as varchar)", "{column} || '_changed'"),
+    "DATE": ("date '2020-01-01' + cast(i % 1000 as integer)", "{column} + 1"),
+    "TIMESTAMP": ("timestamp '2020-01-01' + to_seconds(i)", "{column} + interval 1 second"),
+    # REPEATED field and STRUCT with a nested array, compared by fingerprints
+    "REPEATED": ("[i % 7, i % 5]", "list_append({column}, 0)"),
+    "STRUCT": ("struct_pack(a := i % 1000, b := [i % 3])", "struct_pack(a := {column}.a + 1, b := {column}.b)"),
+}
+
+
+@dataclass
+class SyntheticTables:
+    """Pair of tables with `rows` rows and `columns` columns besides the `id` primary key.
+
+    A `diff_rate` fraction of the rows of the second table have all their columns changed.
+    """
+
+    rows: int
+    columns: int
+    diff_rate: float = 0.01
+    table1: str = "table_a"
+    table2: str = "table_b"
+
+    @property
+    def columns_names(self) -> List[str]:
+        types = list(COLUMN_TYPES)
+        return [
+            f"{types[index % len(types)].lower()}_{index}" for index in range(self.columns)
+        ]
+
+    def get_column_expressions(self, changed: bool) -> List[str]:
+        types = list(COLUMN_TYPES)
+        expressions = []
+        for index, column in enumerate(self.columns_names):
+            value, changed_value = COLUMN_TYPES[types[index % len(types)]]
+            if changed:
+                value = (
+                    f"case when hash(i) % 10000 < {int(self.diff_rate * 10_000)}"
+                    f" then {changed_value.format(column=f'({value})')} else {value} end"
+                )
+            expressions.append(f"{value} as {column}")
+        return expressions
+
+    def create(self, client: QueryDuckDB) -> None:
+        """Create both tables in the DuckDB database of the client"""
+        for table, changed in [(self.table1, False), (self.table2, True)]:
+            client.client.execute(
+                f"create or replace table {table} as"
+                f" select i as id, {', '.join(self.get_column_expressions(changed))}"
+                f" from range({self.rows}) as t(i)"
+            )
@@ -0,0 +1,298 @@
+"""Run the diffs of many table pairs listed in a manifest, without the Streamlit app.
+
+Manifest example (YAML or JSON):
+
+    max_workers: 8
+    defaults:
+      sampling_rate: 100
+    diffs:
+      - name: users
+        table1: my-project.prod.users
+        table2: my-project.staging.users
+        primary_key: user_id
+        columns: [email, created_at]
+        tolerance:
+          float_epsilon: 0.001
+          timestamp_truncation: SECOND
+
+Usage: data-check-batch manifest.yml --output-dir reports/ [--export-format parquet]
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow.dataset as pa_dataset
+
+from .data_processor import DataProcessor
+from .export import head
+from .models.comparison import ComparisonTolerance
+from .models.diff_config import DiffConfig
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of diffs run at the same time, each diff runs one query at a time
+DEFAULT_MAX_WORKERS = 4
+# Number of differing rows reported for each diff
+DEFAULT_SAMPLE_SIZE = 10
+# Formats the differing rows can be exported to, next to the reports
+EXPORT_FORMATS = ("parquet", "csv")
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """Read a JSON or YAML manifest, PyYAML is only needed for YAML files"""
+    with open(path) as file:
+        content = file.read()
+    if Path(path).suffix.lower() in (".yml", ".yaml"):
+        try:
+            import yaml
+        except ImportError as error:
+            raise ImportError(
+                "PyYAML is needed to read YAML manifests, install it or use a JSON manifest"
+            ) from error
+        return yaml.safe_load(content)
+    return json.loads(content)
+
+
+def get_diff_configs(manifest: Dict[str, Any]) -> List[DiffConfig]:
+    defaults = manifest.get("defaults", {})
+    configs = [DiffConfig.from_dict(diff, defaults) for diff in manifest["diffs"]]
+    names = [config.name for config in configs]
+    duplicated_names = sorted({name for name in names if names.count(name) > 1})
+    if duplicated_names:
+        raise ValueError(f"Diff names must be unique: {', '.join(duplicated_names)}")
+    return configs
+
+
+def get_processor(config: DiffConfig) -> DataProcessor:
+    """Each diff runs one query at a time, BigQuery jobs included, the number of diffs run at the same time bounds the number of queries"""
+    if config.engine == "duckdb":
+        from .processors.duckdb import DuckDBProcessor
+
+        return DuckDBProcessor(config.table1, config.table2, max_workers=1)
+    if config.engine == "bigquery":
+        from .processors.bigquery import BigQueryProcessor
+
+        return BigQueryProcessor(config.table1, config.table2, max_workers=1)
+    raise ValueError(f"Unknown engine {config.engine}, use bigquery or duckdb")
+
+
+def to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows of a DataFrame as JSON compatible dicts: numpy types as Python types, dates as ISO strings, NaN as None"""
+    return json.loads(
+        df.to_json(orient="records", date_format="iso", default_handler=str)
+    )
+
+
+def get_file_name(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", name)
+
+
+def run_diff(
+    config: DiffConfig,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    export_path: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """Run the health check of a table pair and sample its differing rows, errors are reported instead of raised.
+
+    With `export_path`, all the differing rows are streamed to a Parquet or CSV file, and sampled from it.
+    """
+    report = {
+        "name": config.name,
+        "table1": config.table1,
+        "table2": config.table2,
+        "primary_key": config.primary_key,
+        "status": "ok",
+    }
+    start = time.monotonic()
+    try:
+        processor = get_processor(config)
+        common_table_schema = processor.get_common_schema_from_tables()
+        unknown_columns = [
+            column for column in config.columns or [] if column not in common_table_schema.columns_names
+        ]
+        if unknown_columns:
+            raise ValueError(f"Columns not found in both tables: {', '.join(unknown_columns)}")
+        columns = config.columns or [
+            column
+            for column in common_table_schema.columns_names
+            if column not in config.primary_key_columns
+        ]
+        processor.set_config_data(
+            primary_key=config.primary_key,
+            columns_to_compare=columns,
+            sampling_rate=config.sampling_rate,
+            sampling_method=config.sampling_method,
+            tolerance=ComparisonTolerance(**config.tolerance),
+        )
+        report["columns"] = columns
+        report["warnings"] = processor.get_schema_warnings()
+
+        health_check = processor.run_health_check(
+            selected_columns=columns, common_table_schema=common_table_schema
+        )
+        report["primary_keys_unique"] = health_check.primary_keys_unique
+        report["errors"] = health_check.get_error_messages()
+        report["key_insight"] = to_records(health_check.primary_keys)[0]
+        report["column_ratios"] = to_records(health_check.column_ratios)
+
+        differing_columns = health_check.column_ratios.loc[
+            health_check.column_ratios["percentage_diff_values"] > 0, "column"
+        ].tolist()
+        report["differing_columns"] = differing_columns
+        report["sample_diff"] = []
+        if health_check.primary_keys_unique and differing_columns:
+            if export_path is not None:
+                report["exported_rows"] = processor.export_plain_diff(
+                    str(export_path),
+                    selected_columns=differing_columns,
+                    common_table_schema=common_table_schema,
+                )
+                # No file is written when no row differs
+                if report["exported_rows"]:
+                    report["export_path"] = str(export_path)
+                    sample = pa_dataset.dataset(
+                        export_path, format=export_path.suffix[1:]
+                    ).head(sample_size)
+                    report["sample_diff"] = to_records(sample.to_pandas())
+            else:
+                _, batches = processor.iter_plain_diff(
+                    selected_columns=differing_columns,
+                    common_table_schema=common_table_schema,
+                    limit=sample_size,
+                )
+                sample = head(batches, sample_size)
+                if sample is not None:
+                    report["sample_diff"] = to_records(sample.to_pandas())
+
+        report["has_differences"] = bool(
+            not health_check.primary_keys_unique
+            # The ratio is None when both tables are empty
+            or (report["key_insight"]["missing_primary_keys_ratio"] or 0) > 0
+            or differing_columns
+        )
+    except Exception as error:
+        logger.exception(f"Diff {config.name} failed")
+        report["status"] = "error"
+        report["error"] = f"{type(error).__name__}: {error}"
+
+    report["duration_seconds"] = round(time.monotonic() - start, 3)
+    return report
+
+
+def write_report(report: Dict[str, Any], output_dir: Path) -> Path:
+    """Write a report as JSON, values JSON does not support (dates, decimals, ...) are written as strings"""
+    path = output_dir / f"{get_file_name(report['name'])}.json"
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, default=str)
+    return path
+
+
+def run_batch(
+    configs: List[DiffConfig],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    output_dir: Optional[str] = None,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    export_format: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Run the diffs concurrently, at most `max_workers` at a time. Reports are returned in the order of the configs.
+
+    With `export_format`, the differing rows of each diff are exported to the output directory.
+    """
+    if export_format is not None and output_dir is None:
+        raise ValueError("output_dir is needed to export the differing rows")
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    def run_and_write(config: DiffConfig) -> Dict[str, Any]:
+        export_path = (
+            Path(output_dir) / f"{get_file_name(config.name)}.{export_format}"
+            if export_format is not None
+            else None
+        )
+        report = run_diff(config, sample_size=sample_size, export_path=export_path)
+        if output_dir is not None:
+            write_report(report, Path(output_dir))
+        logger.info(f"Diff {config.name}: {report['status']}")
+        return report
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        reports = list(executor.map(run_and_write, configs))
+
+    if output_dir is not None:
+        summary = [
+            {
+                key: report.get(key)
+                for key in ["name", "status", "has_differences", "error", "duration_seconds"]
+            }
+            for report in reports
+        ]
+        with open(Path(output_dir) / "summary.json", "w") as file:
+            json.dump(summary, file, indent=2, default=str)
+    return reports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compare many table pairs listed in a YAML or JSON manifest"
+    )
+    parser.add_argument("manifest", help="Path to the manifest")
+    parser.add_argument(
+        "--output-dir", default="data_check_reports", help="Directory of the JSON reports"
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help=f"Maximum number of diffs run at the same time (default: manifest max_workers or {DEFAULT_MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=DEFAULT_SAMPLE_SIZE,
+        help="Number of differing rows reported for each diff",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=EXPORT_FORMATS,
+        default=None,
+        help="Export all the differing rows of each diff to the output directory, in this format",
+    )
+    parser.add_argument(
+        "--fail-on-diff",
+        action="store_true",
+        help="Exit with status 1 when differences are found, not only on errors",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    manifest = load_manifest(args.manifest)
+    max_workers = args.max_workers or manifest.get("max_workers", DEFAULT_MAX_WORKERS)
+
+    reports = run_batch(
+        get_diff_configs(manifest),
+        max_workers=max_workers,
+        output_dir=args.output_dir,
+        sample_size=args.sample_size,
+        export_format=args.export_format,
+    )
+
+    failed = [report["name"] for report in reports if report["status"] == "error"]
+    different = [report["name"] for report in reports if report.get("has_differences")]
+    print(
+        f"{len(reports)} diffs, {len(failed)} failed, {len(different)} with differences."
+        f" Reports written to {args.output_dir}"
+    )
+    if failed or (args.fail_on_diff and different):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import functools
+import inspect
+import time
+from collections import OrderedDict
+from dataclasses import fields, is_dataclass
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+from sqlglot import Expression
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl_seconds`"""
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl_seconds: float = 600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._get_entry(key) is not None
+
+    def _get_entry(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _ = entry
+        if expires_at < self.clock():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._get_entry(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the cached value, computing and caching it if missing or expired"""
+        with self._lock:
+            entry = self._get_entry(key)
+        if entry is not None:
+            return entry[1]
+
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def to_cache_key(value: Any) -> Hashable:
+    """Hashable snapshot of a value, dataclasses, lists and dicts are converted to tuples"""
+    if is_dataclass(value) and not isinstance(value, type):
+        return (
+            type(value),
+            *(to_cache_key(getattr(value, field.name)) for field in fields(value)),
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(to_cache_key(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, to_cache_key(item)) for key, item in value.items()))
+    return value
+
+
+# Queries built by processors, shared by the processors created on each Streamlit rerun
+QUERY_CACHE = TTLCache(max_size=256, ttl_seconds=3600)
+# SQL generated from the memoized queries by query id, the queries are kept in the entries so that their ids are not reused
+QUERY_SQL_CACHE = TTLCache(max_size=256, ttl_seconds=3600)
+
+
+def memoize_query(method: Callable) -> Callable:
+    """Memoize a query builder of a processor, by the processor configuration and the arguments.
+
+    The same query object is returned on each call, it must not be modified in place (sqlglot builders copy it by default).
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs)
+        arguments.apply_defaults()
+        del arguments.arguments["self"]
+        key = (
+            method.__qualname__,
+            self.get_query_cache_key(),
+            to_cache_key(arguments.arguments),
+        )
+
+        def build_query() -> Expression:
+            query = method(self, *args, **kwargs)
+            # SQL by dialect and generation options, stored with the query as it is not modified
+            QUERY_SQL_CACHE.set(id(query), (query, {}))
+            return query
+
+        return QUERY_CACHE.get_or_set(key, build_query)
+
+    return wrapper
+
+
+def get_query_sql(query: Expression, dialect: str, **options) -> str:
+    """Generate the SQL of a query, memoized only for the queries built by `memoize_query`.
+
+    Other queries may be modified in place, their SQL is generated on each call.
+    """
+    entry = QUERY_SQL_CACHE.get(id(query))
+    if entry is None or entry[0] is not query:
+        return query.sql(dialect=dialect, **options)
+
+    sqls = entry[1]
+    key = (dialect, to_cache_key(options))
+    if key not in sqls:
+        sqls[key] = query.sql(dialect=dialect, **options)
+    return sqls[key]
+
+
+class StageResultStore:
+    """Outputs of the completed stages of a diff, kept across the Streamlit reruns of a session.
+
+    Results are keyed by the processor configuration and the stage parameters, and kept until their stage is invalidated.
+    """
+
+    def __init__(self, max_results_per_stage: int = 32):
+        self.max_results_per_stage = max_results_per_stage
+        self._results: Dict[str, "OrderedDict[Hashable, Any]"] = {}
+        self._lock = Lock()
+
+    def __contains__(self, stage: str) -> bool:
+        return bool(self._results.get(stage))
+
+    def get_or_run(
+        self, stage: str, config_key: Hashable, run: Callable[[], Any], **params
+    ) -> Any:
+        """Returns the stored output of the stage, running it only if it has not completed yet"""
+        key = (config_key, to_cache_key(params))
+        with self._lock:
+            results = self._results.setdefault(stage, OrderedDict())
+            if key in results:
+                results.move_to_end(key)
+                return results[key]
+
+        value = run()
+        with self._lock:
+            results = self._results.setdefault(stage, OrderedDict())
+            results[key] = value
+            while len(results) > self.max_results_per_stage:
+                results.popitem(last=False)
+        return value
+
+    def invalidate(self, *stages: str, keep: Iterable[str] = ()) -> None:
+        """Drop the outputs of the given stages, or of all stages but `keep` when none is given"""
+        with self._lock:
+            for stage in stages or list(self._results):
+                if stage not in keep:
+                    self._results.pop(stage, None)
@@ -1,42 +1,45 @@
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Union
 
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from pandas.io.formats.style import Styler
 
+# pandas Styler loads matplotlib, it is only imported when styling a table
+if TYPE_CHECKING:
+    from pandas.io.formats.style import Styler
 
-def style_percentage(data: Tuple[pd.DataFrame, Styler], columns) -> Styler:
+
+def style_percentage(data: Union[pd.DataFrame, "Styler"], columns) -> "Styler":
     if isinstance(data, pd.DataFrame):
-        return data.style.format("{:.2%}", subset=columns)
-    elif isinstance(data, Styler):
-        return data.format("{:.2%}", subset=columns)
+        data = data.style
+    return data.format("{:.2%}", subset=columns)
 
 
 def style_gradient(
-    data: Tuple[pd.DataFrame, Styler], columns, gradient_color: str = "white,red"
-) -> Styler:
-    cmap = sns.color_palette(f"blend:{gradient_color}", as_cmap=True)
+    data: Union[pd.DataFrame, "Styler"], columns, gradient_color: str = "white,red"
+) -> "Styler":
+    from matplotlib.colors import LinearSegmentedColormap
+
+    cmap = LinearSegmentedColormap.from_list("blend", gradient_color.split(","))
     if isinstance(data, pd.DataFrame):
-        return data.style.background_gradient(cmap=cmap, subset=columns)
-    elif isinstance(data, Styler):
-        return data.background_gradient(cmap=cmap, subset=columns)
+        data = data.style
+    return data.background_gradient(cmap=cmap, subset=columns)
 
 
-# Define a custom styling function
-def highlight_diff(x, columns: List[str]):
-    c1 = "background-color: #fc9fba"
+DIFF_COLOR = "background-color: #fc9fba"
 
-    # empty DataFrame of styles
-    df1 = pd.DataFrame("", index=x.index, columns=x.columns)
 
+def get_diff_styles(data: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Returns the CSS of each cell, from the `<column>__diff` flags computed by the diff query"""
+    styles = np.full(data.shape, "", dtype=object)
     for column in columns:
-        df1.loc[(x[column + "__1"].astype(str) != x[column + "__2"].astype(str)), column + "__1"] = c1
-        df1.loc[(x[column + "__1"].astype(str) != x[column + "__2"].astype(str)), column + "__2"] = c1
-
-    return df1
+        is_diff = data[f"{column}__diff"].to_numpy(dtype=bool, na_value=False)
+        for suffix in ("__1", "__2"):
+            styles[is_diff, data.columns.get_loc(column + suffix)] = DIFF_COLOR
+    return pd.DataFrame(styles, index=data.index, columns=data.columns)
 
 
-def highlight_diff_dataset(data: pd.DataFrame, columns: str) -> Styler:
-    # Apply the styling function
-    styled_df = data.style.apply(highlight_diff, columns=columns, axis=None)
-    return styled_df
+def highlight_diff_dataset(data: pd.DataFrame, columns: List[str]) -> "Styler":
+    """Highlight the differing values, the diff flags columns are not displayed"""
+    diff_flags = [f"{column}__diff" for column in columns]
+    styles = get_diff_styles(data, columns).drop(columns=diff_flags)
+    return data.drop(columns=diff_flags).style.apply(lambda _: styles, axis=None)
@@ -1,12 +1,35 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import (Any, Callable, Dict, Hashable, Iterator, List, Optional,
+                    Tuple, Union)
 
 import pandas as pd
-from sqlglot import parse_one
+import pyarrow as pa
+from sqlglot import alias, exp, func, parse_one, select
 from sqlglot.expressions import Select
 
-from .models.table import TableSchema
+from .cache import to_cache_key
+from .export import head, write_batches
+from .models.comparison import ComparisonTolerance
+from .models.diff_page import DiffPage
+from .models.health_check import HealthCheck
+from .models.partition import UNPARTITIONED_PARTITION_ID, TimePartitioning
+from .models.sampling import SamplingMethod
+from .models.table import BigQueryDataType, ColumnSchema, TableSchema
+from .query.partition_store import PartitionChecksumStore
 from .query_client import QueryClient
+from .tools import run_multithreaded
+
+# Maximum number of queries run at the same time by a processor
+DEFAULT_MAX_WORKERS = 4
+
+# Maximum number of columns compared by a single ratio query, to keep wide tables queries small
+DEFAULT_RATIO_CHUNK_SIZE = 500
+
+# Relative error tolerated between approximate distinct counts of both tables
+DEFAULT_PROFILE_DISTINCT_TOLERANCE = 0.01
+
+# Column added to both inputs for composite primary keys, an INT64 fingerprint of the key columns joined on instead of them
+PRIMARY_KEY_HASH = "primary_key__hash"
 
 
 class DataProcessor(ABC):
@@ -16,12 +39,15 @@ class DataProcessor(ABC):
         query2: str,
         dialect: str,
         client: QueryClient,
+        max_workers: int = DEFAULT_MAX_WORKERS,
     ) -> None:
         self.client = client
         self.dialect = dialect
+        self.max_workers = max_workers
 
         self.use_sql_query1 = False
         self.use_sql_query2 = False
+        self.inputs = (query1.strip(), query2.strip())
 
         if self.check_input_is_sql(query1):
             self.use_sql_query1 = True
@@ -43,20 +69,46 @@ class DataProcessor(ABC):
         self._primary_key = None
         self._columns_to_compare = None
         self._sampling_rate = None
+        self.sampling_method = SamplingMethod.HASH
+        self.tolerance = ComparisonTolerance()
 
     def set_config_data(
-        self, primary_key: str, columns_to_compare: List[str], sampling_rate: int
+        self,
+        primary_key: Union[str, List[str]],
+        columns_to_compare: List[str],
+        sampling_rate: int,
+        sampling_method: SamplingMethod = SamplingMethod.HASH,
+        tolerance: Optional[ComparisonTolerance] = None,
     ):
-        self._primary_key = primary_key
+        if isinstance(primary_key, str):
+            primary_key = [primary_key]
+        self._primary_key = list(primary_key) if primary_key else None
         self._columns_to_compare = columns_to_compare
         self._sampling_rate = sampling_rate
+        self.sampling_method = SamplingMethod(sampling_method)
+        self.tolerance = tolerance or ComparisonTolerance()
 
     @property
-    def primary_key(self) -> str:
+    def primary_key_columns(self) -> List[str]:
         if self._primary_key is None:
             raise ValueError("primary_key is not set")
         return self._primary_key
 
+    @property
+    def has_primary_key(self) -> bool:
+        return self._primary_key is not None
+
+    @property
+    def has_composite_primary_key(self) -> bool:
+        return self._primary_key is not None and len(self._primary_key) > 1
+
+    @property
+    def primary_key(self) -> str:
+        """Column the tables are joined on: the primary key column, or the fingerprint of a composite primary key"""
+        if self.has_composite_primary_key:
+            return PRIMARY_KEY_HASH
+        return self.primary_key_columns[0]
+
     @property
     def columns_to_compare(self) -> List[str]:
         if self._columns_to_compare is None:
@@ -82,10 +134,31 @@ class DataProcessor(ABC):
         return self._sampling_rate
 
     @property
-    def is_sampling_allowed(self) -> bool:
-        """Returns True if sampling is allowed"""
+    def is_table_sampling_allowed(self) -> bool:
+        """Returns True if tables can be sampled by storage blocks, only for direct tables as input"""
         return (not self.use_sql_query1) and (not self.use_sql_query2)
 
+    @property
+    def is_sampling_allowed(self) -> bool:
+        """Returns True if sampling is allowed, primary key hash sampling works for any input"""
+        return (
+            self.sampling_method == SamplingMethod.HASH
+            or self.is_table_sampling_allowed
+        )
+
+    def get_query_cache_key(self) -> Hashable:
+        """Identify the queries built by the processor: its type, inputs and diff configuration"""
+        return (
+            type(self),
+            self.dialect,
+            self.inputs,
+            to_cache_key(self._primary_key),
+            to_cache_key(self._columns_to_compare),
+            self._sampling_rate,
+            self.sampling_method,
+            self.tolerance,
+        )
+
     @abstractmethod
     def check_input_is_sql(self, value: str) -> bool:
         """Check if the input is a SQL query"""
@@ -107,7 +180,12 @@ class DataProcessor(ABC):
         pass
 
     @abstractmethod
-    def get_query_exclusive_primary_keys(self, exclusive_to: str) -> Select:
+    def get_query_exclusive_primary_keys(
+        self,
+        exclusive_to: str,
+        common_table_schema: Optional[TableSchema] = None,
+        limit: Optional[int] = 500,
+    ) -> Select:
         pass
 
     @abstractmethod
@@ -118,26 +196,126 @@ class DataProcessor(ABC):
         """Create a SQL query to get the rows where the columns values are different"""
         pass
 
+    @abstractmethod
+    def get_query_plain_diff_fingerprints(
+        self,
+        common_table_schema: TableSchema,
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, only joining the rows fingerprints"""
+        pass
+
+    @abstractmethod
+    def get_query_plain_diff_partitions(
+        self,
+        common_table_schema: TableSchema,
+        partitioning: TimePartitioning,
+        partition_ids: List[str],
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, restricted to some partitions"""
+        pass
+
+    @abstractmethod
+    def get_query_partition_checksums(
+        self,
+        common_table_schema: TableSchema,
+        partitioning: TimePartitioning,
+        partition_ids: Optional[List[str]],
+    ) -> Select:
+        """Create a SQL query to get the row count and checksum of each partition of both tables"""
+        pass
+
     @abstractmethod
     def query_ratio_common_values_per_column(
         self,
         common_table_schema: TableSchema,
     ) -> Select:
-        """Create a SQL query to get the ratio of common values for each column"""
+        """Create a SQL query to get the ratio of common values for each column, one row per column"""
+        pass
+
+    @abstractmethod
+    def get_query_page(
+        self,
+        table: str,
+        page_size: int,
+        sort_column: Optional[str] = None,
+        ascending: bool = True,
+        cursor: Optional[Tuple[Any, Any]] = None,
+        offset: int = 0,
+    ) -> Select:
+        """Create a SQL query reading one page of a table, sorted by a column then by primary key"""
+        pass
+
+    @abstractmethod
+    def get_query_health_check(
+        self,
+        common_table_schema: TableSchema,
+        sample_size: int,
+    ) -> Select:
+        """Create a SQL query checking primary keys uniqueness, comparing primary keys and computing the ratio of common values for each column, in a single scan"""
+        pass
+
+    @abstractmethod
+    def get_query_column_profile(
+        self,
+        table_name: str,
+        common_table_schema: TableSchema,
+        number_quantiles: int,
+        number_top_values: int,
+    ) -> Select:
+        """Create a SQL query profiling the columns of a table with sketches, one row per column"""
+        pass
+
+    @abstractmethod
+    def get_query_segment_checksums(
+        self,
+        common_table_schema: TableSchema,
+        modulus: int,
+        parent_modulus: int,
+        parent_segments: List[int],
+    ) -> Select:
+        """Create a SQL query to get the segments of the primary key space whose checksums are different"""
+        pass
+
+    @abstractmethod
+    def get_query_plain_diff_segments(
+        self,
+        common_table_schema: TableSchema,
+        modulus: int,
+        segments: List[int],
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, restricted to some segments"""
         pass
 
     ###### METHODS ######
+    def run_concurrently(self, jobs: List[Tuple[Callable, Dict]]) -> List:
+        """Run independent jobs at the same time, results are returned in the order of the jobs"""
+        if len(jobs) <= 1 or self.max_workers <= 1:
+            return [job(**kwargs) for job, kwargs in jobs]
+        return run_multithreaded(jobs, max_workers=self.max_workers)
+
+    def run_queries_concurrently(self, queries: List[Select]) -> List[pd.DataFrame]:
+        """Run independent queries at the same time, results are returned in the order of the queries"""
+        if not self.client.runs_queries_asynchronously:
+            return self.run_concurrently(
+                [(self.client.run_query_to_dataframe, {"query": query}) for query in queries]
+            )
+
+        # At most max_workers queries are in flight, without a thread waiting for each of them
+        return self.client.run_queries(queries, max_in_flight=self.max_workers)
+
     def get_schemas(self) -> Tuple[TableSchema, TableSchema]:
+        jobs = []
         if self.use_sql_query1:
-            schema_table_1 = self.client.get_table_schema_from_sql(self.query1)
+            jobs.append((self.client.get_table_schema_from_sql, {"query": self.query1}))
         else:
-            schema_table_1 = self.client.get_table_schema_from_table(self.table1)
+            jobs.append((self.client.get_table_schema_from_table, {"table": self.table1}))
 
         if self.use_sql_query2:
-            schema_table_2 = self.client.get_table_schema_from_sql(self.query2)
+            jobs.append((self.client.get_table_schema_from_sql, {"query": self.query2}))
         else:
-            schema_table_2 = self.client.get_table_schema_from_table(self.table2)
+            jobs.append((self.client.get_table_schema_from_table, {"table": self.table2}))
 
+        schema_table_1, schema_table_2 = self.run_concurrently(jobs)
         return schema_table_1, schema_table_2
 
     def get_table_columns(self) -> Tuple[List[str], List[str]]:
@@ -145,28 +323,28 @@ class DataProcessor(ABC):
         schema_table_1, schema_table_2 = self.get_schemas()
         return schema_table_1.columns_names, schema_table_2.columns_names
 
-    def get_schemas_with_warning(self) -> Tuple[TableSchema, TableSchema]:
-        """Get the schemas of two tables"""
+    def get_schema_warnings(self) -> List[str]:
+        """Get the warnings about the schemas of two tables, to be displayed to the user"""
         schema_table_1, schema_table_2 = self.get_schemas()
 
-        if (
-            schema_table_1.get_unsupported_fields()
-            or schema_table_2.get_unsupported_fields()
-        ):
-            import streamlit as st
-
-            st.warning(
-                f"Unsupported RECORD fields: table 1: {schema_table_1.get_unsupported_fields()} / table 2: {schema_table_2.get_unsupported_fields()}, cannot be selected"
+        warnings = []
+        columns_with_different_types = sorted(
+            column
+            for column in schema_table_1.get_common_column_names(schema_table_2)
+            if schema_table_1.get_column(column).field_type
+            != schema_table_2.get_column(column).field_type
+        )
+        if columns_with_different_types:
+            warnings.append(
+                f"Columns with different types in both tables, compared as strings: {columns_with_different_types}"
             )
-        return schema_table_1, schema_table_2
+        return warnings
 
     def get_diff_columns(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """Returns a mapping of columns that are different per table"""
         schema_table_1, schema_table_2 = self.get_schemas()
 
-        common_columns_names = schema_table_1.get_common_column_names(
-            schema_table_2, include_unsupported=True
-        )
+        common_columns_names = schema_table_1.get_common_column_names(schema_table_2)
         diff_columns_table_1 = [
             column
             for column in schema_table_1.columns
@@ -187,47 +365,92 @@ class DataProcessor(ABC):
         )
         return diff_1_table_schema.to_dataframe(), diff_2_table_schema.to_dataframe()
 
+    @staticmethod
+    def get_common_column(column1: ColumnSchema, column2: ColumnSchema) -> ColumnSchema:
+        """Columns with different types in both tables are compared as strings"""
+        if column1.field_type == column2.field_type:
+            return column1
+        return ColumnSchema(
+            name=column1.name, field_type=BigQueryDataType.ANY, mode=column1.mode
+        )
+
     def get_common_schema_from_tables(self) -> TableSchema:
         """Get the common schema of two tables"""
-        schema_table_1, schema_table_2 = self.get_schemas_with_warning()
-        common_columns = schema_table_1.get_common_column_names(
-            schema_table_2, include_unsupported=False
-        )
+        schema_table_1, schema_table_2 = self.get_schemas()
+        common_columns = schema_table_1.get_common_column_names(schema_table_2)
         common_columns = [
-            schema_table_1.get_column(column) for column in common_columns
+            self.get_common_column(
+                schema_table_1.get_column(column), schema_table_2.get_column(column)
+            )
+            for column in common_columns
         ]
         return TableSchema(table_name="common_schema", columns=common_columns)
 
-    def parse_strucutred_data(
-        self, data: pd.DataFrame, keys: List[str], column: str = "values"
-    ) -> pd.DataFrame:
-        """Parse the structured data"""
-        data = data.copy()
-        for key in keys:
-            data[key] = data[column].apply(lambda x: x[key])
-        data.drop(columns=[column], inplace=True)
-        return data
+    def get_queries_column_diff_ratios(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
+    ) -> List[Select]:
+        """Create the queries to get the ratio of common values, each one for a chunk of the columns"""
+        return [
+            self.query_ratio_common_values_per_column(
+                common_table_schema=TableSchema(
+                    table_name="filtered_columns",
+                    columns=[
+                        common_table_schema.get_column(column)
+                        for column in selected_columns[start : start + chunk_size]
+                    ],
+                )
+            )
+            for start in range(0, len(selected_columns), chunk_size)
+        ]
+
+    def get_queries_health_check(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        sample_size: int = 10,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
+    ) -> List[Select]:
+        """Create the health check query with the first chunk of the columns, then the ratio queries of the next chunks"""
+        return [
+            self.get_query_health_check(
+                common_table_schema=TableSchema(
+                    table_name="filtered_columns",
+                    columns=[
+                        common_table_schema.get_column(column)
+                        for column in selected_columns[:chunk_size]
+                    ],
+                ),
+                sample_size=sample_size,
+            ),
+            *self.get_queries_column_diff_ratios(
+                selected_columns=selected_columns[chunk_size:],
+                common_table_schema=common_table_schema,
+                chunk_size=chunk_size,
+            ),
+        ]
 
     def get_column_diff_ratios(
         self,
         selected_columns: List[str],
         common_table_schema: TableSchema,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
     ) -> pd.DataFrame:
-        """Get the ratio of common values for each column"""
-        filtered_columns = TableSchema(
-            table_name="filtered_columns",
-            columns=[
-                common_table_schema.get_column(column) for column in selected_columns
-            ],
+        """Get the ratio of common values for each column, columns chunks are computed concurrently"""
+        queries = self.get_queries_column_diff_ratios(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+            chunk_size=chunk_size,
         )
-        query = self.query_ratio_common_values_per_column(
-            common_table_schema=filtered_columns
-        )
-        df = self.client.run_query_to_dataframe(query)
-        df = df.transpose().reset_index()
-        df.columns = ["column", "values"]
+        df = pd.concat(self.run_queries_concurrently(queries), ignore_index=True)
+        df = df.rename(columns={"column_name": "column"})
+        return self.format_column_diff_ratios(df)
 
-        df = self.parse_strucutred_data(df, keys=["ratio_not_null", "ratio_equal"])
+    @staticmethod
+    def format_column_diff_ratios(df: pd.DataFrame) -> pd.DataFrame:
+        """Add the percentage of different values and sort the columns by it"""
         df["percentage_diff_values"] = 1 - df["ratio_equal"]
         df.sort_values(
             by=["percentage_diff_values", "ratio_not_null"],
@@ -236,28 +459,629 @@ class DataProcessor(ABC):
         )
         return df
 
+    def get_queries_column_profiles(
+        self,
+        table_name: str,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
+    ) -> List[Select]:
+        """Create the queries profiling the columns of a table, each one for a chunk of the columns"""
+        return [
+            self.get_query_column_profile(
+                table_name=table_name,
+                common_table_schema=TableSchema(
+                    table_name="filtered_columns",
+                    columns=[
+                        common_table_schema.get_column(column)
+                        for column in selected_columns[start : start + chunk_size]
+                    ],
+                ),
+                number_quantiles=4,
+                number_top_values=5,
+            )
+            for start in range(0, len(selected_columns), chunk_size)
+        ]
+
+    def get_column_profiles(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Profile the columns of both tables, without joining them, so it does not need a shared primary key"""
+        queries = {
+            table_name: self.get_queries_column_profiles(
+                table_name=table_name,
+                selected_columns=selected_columns,
+                common_table_schema=common_table_schema,
+                chunk_size=chunk_size,
+            )
+            for table_name in ["table1", "table2"]
+        }
+        results = self.run_queries_concurrently(queries["table1"] + queries["table2"])
+        number_queries = len(queries["table1"])
+        profile1 = pd.concat(results[:number_queries], ignore_index=True)
+        profile2 = pd.concat(results[number_queries:], ignore_index=True)
+        return profile1, profile2
+
+    @staticmethod
+    def compare_column_profiles(
+        profile1: pd.DataFrame,
+        profile2: pd.DataFrame,
+        distinct_tolerance: float = DEFAULT_PROFILE_DISTINCT_TOLERANCE,
+    ) -> pd.DataFrame:
+        """Compare the profiles of both tables, columns whose distributions look different come first.
+
+        Approximate quantiles and top values are only compared as an indication, as sketches may differ for the same data.
+        """
+        df = profile1.merge(
+            profile2, on="column_name", how="outer", suffixes=("__1", "__2")
+        ).rename(columns={"column_name": "column"})
+
+        count_distinct_max = df[["count_distinct__1", "count_distinct__2"]].max(axis=1)
+        df["distinct_diff_ratio"] = (
+            (df["count_distinct__1"] - df["count_distinct__2"]).abs()
+            / count_distinct_max.where(count_distinct_max > 0)
+        ).fillna(0)
+        df["ratio_null_diff"] = (df["ratio_null__1"] - df["ratio_null__2"]).abs()
+
+        same_min = (df["min_value__1"] == df["min_value__2"]) | (
+            df["min_value__1"].isna() & df["min_value__2"].isna()
+        )
+        same_max = (df["max_value__1"] == df["max_value__2"]) | (
+            df["max_value__1"].isna() & df["max_value__2"].isna()
+        )
+        df["same_min_max"] = same_min & same_max
+        df["same_quantiles"] = [
+            DataProcessor.parse_array(quantiles1) == DataProcessor.parse_array(quantiles2)
+            for quantiles1, quantiles2 in zip(df["quantiles__1"], df["quantiles__2"])
+        ]
+        df["top_values_overlap"] = [
+            DataProcessor.get_overlap_ratio(
+                DataProcessor.parse_array(top_values1),
+                DataProcessor.parse_array(top_values2),
+            )
+            for top_values1, top_values2 in zip(df["top_values__1"], df["top_values__2"])
+        ]
+
+        df["is_different"] = (
+            (df["distinct_diff_ratio"] > distinct_tolerance)
+            | (df["ratio_null_diff"] > 0)
+            | ~df["same_min_max"]
+        )
+        df.sort_values(
+            by=["is_different", "distinct_diff_ratio", "ratio_null_diff"],
+            ascending=False,
+            inplace=True,
+            ignore_index=True,
+        )
+        return df
+
+    @staticmethod
+    def get_overlap_ratio(values1: List[Any], values2: List[Any]) -> float:
+        """Returns the number of common values over the number of distinct values of both lists"""
+        union = set(values1) | set(values2)
+        if not union:
+            return 1.0
+        return len(set(values1) & set(values2)) / len(union)
+
+    def run_column_profiling(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        distinct_tolerance: float = DEFAULT_PROFILE_DISTINCT_TOLERANCE,
+    ) -> pd.DataFrame:
+        """Profile the columns of both tables and compare their distributions, a cheap check before a keyed diff"""
+        profile1, profile2 = self.get_column_profiles(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+        )
+        return self.compare_column_profiles(
+            profile1, profile2, distinct_tolerance=distinct_tolerance
+        )
+
+    def run_health_check(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        sample_size: int = 10,
+        chunk_size: int = DEFAULT_RATIO_CHUNK_SIZE,
+    ) -> HealthCheck:
+        """Check primary keys, compare them and compute column diff ratios with a single query, so every diff costs a single scan.
+
+        Only the first `chunk_size` columns are fused in the health check, the ratios of the next chunks are computed concurrently by the ratio queries.
+        """
+        queries = self.get_queries_health_check(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+            sample_size=sample_size,
+            chunk_size=chunk_size,
+        )
+        df, *ratios = self.run_queries_concurrently(queries)
+        result = df.iloc[0]
+
+        fused_ratios = result.get("column_ratios") or {}
+        column_ratios = pd.concat(
+            [
+                pd.DataFrame(
+                    [
+                        {"column": column, **fused_ratios[column]}
+                        for column in selected_columns[:chunk_size]
+                    ],
+                    columns=["column", "ratio_not_null", "ratio_equal"],
+                ),
+                *[df.rename(columns={"column_name": "column"}) for df in ratios],
+            ],
+            ignore_index=True,
+        )
+
+        return HealthCheck(
+            duplicated_keys_table1=int(result["duplicated_keys_table1"]),
+            duplicated_keys_sample_table1=self.parse_array(
+                result["duplicated_keys_sample_table1"]
+            ),
+            duplicated_keys_table2=int(result["duplicated_keys_table2"]),
+            duplicated_keys_sample_table2=self.parse_array(
+                result["duplicated_keys_sample_table2"]
+            ),
+            primary_keys=df[
+                [
+                    "total_rows",
+                    "missing_primary_key_in_table1",
+                    "missing_primary_key_in_table2",
+                    "missing_primary_keys_ratio",
+                ]
+            ],
+            column_ratios=self.format_column_diff_ratios(column_ratios),
+        )
+
+    @staticmethod
+    def parse_array(value) -> list:
+        """Arrays are returned as None when empty, or NaN when missing from a merge"""
+        return [] if value is None or pd.api.types.is_scalar(value) else list(value)
+
+    def get_stages_queries(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+    ) -> Dict[str, List[Select]]:
+        """Get the queries of each stage of a diff"""
+        filtered_columns = TableSchema(
+            table_name="filtered_columns",
+            columns=[
+                common_table_schema.get_column(column) for column in selected_columns
+            ],
+        )
+        return {
+            "uniqueness": [
+                self.get_query_check_primary_keys_unique(table_name=table)
+                for table in ["table1", "table2"]
+            ],
+            "profile": [
+                query
+                for table_name in ["table1", "table2"]
+                for query in self.get_queries_column_profiles(
+                    table_name=table_name,
+                    selected_columns=selected_columns,
+                    common_table_schema=common_table_schema,
+                )
+            ],
+            "key insight": [self.get_query_insight_tables_primary_keys()],
+            "ratios": self.get_queries_column_diff_ratios(
+                selected_columns=selected_columns,
+                common_table_schema=common_table_schema,
+            ),
+            "health check": self.get_queries_health_check(
+                selected_columns=selected_columns,
+                common_table_schema=common_table_schema,
+            ),
+            "plain diff": [
+                self.get_query_plain_diff_tables(common_table_schema=filtered_columns)
+            ],
+        }
+
+    def estimate_stages_bytes(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+    ) -> pd.DataFrame:
+        """Estimate the bytes scanned by each stage of a diff, without running any query.
+
+        The health check stage replaces the uniqueness, key insight and ratios stages.
+        """
+        stages_queries = self.get_stages_queries(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+        )
+        stages = [
+            (stage, query)
+            for stage, queries in stages_queries.items()
+            for query in queries
+        ]
+        estimates = self.run_concurrently(
+            [(self.client.estimate_query_bytes, {"query": query}) for _, query in stages]
+        )
+        df = pd.DataFrame(
+            {
+                "stage": [stage for stage, _ in stages],
+                "bytes_processed": pd.array(estimates, dtype="Int64"),
+            }
+        )
+        return df.groupby("stage", sort=False, as_index=False)["bytes_processed"].sum(
+            min_count=1
+        )
+
+    def get_query_plain_diff(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        use_fingerprints: bool = False,
+    ) -> Select:
+        """Create a SQL query to get the rows where the selected columns values are different.
+
+        With `use_fingerprints`, only primary keys and rows fingerprints are joined to find the differing rows, cheaper on wide tables.
+        """
+        filtered_columns = TableSchema(
+            table_name="filtered_columns",
+            columns=[
+                common_table_schema.get_column(column) for column in selected_columns
+            ],
+        )
+        if use_fingerprints:
+            return self.get_query_plain_diff_fingerprints(
+                common_table_schema=filtered_columns,
+            )
+        return self.get_query_plain_diff_tables(
+            common_table_schema=filtered_columns,
+        )
+
     def get_plain_diff(
         self,
         selected_columns: List[str],
         common_table_schema: TableSchema,
+        use_fingerprints: bool = False,
     ) -> Tuple[Select, pd.DataFrame]:
         """Get the rows where the columns values are different"""
+        query = self.get_query_plain_diff(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+            use_fingerprints=use_fingerprints,
+        )
+        df = self.client.run_query_to_dataframe(query)
+        return query, df
+
+    def get_time_partitioning(self) -> Optional[TimePartitioning]:
+        """Get the time partitioning shared by both tables, None if they are not partitioned by the same column"""
+        if self.use_sql_query1 or self.use_sql_query2:
+            return None
+        partitioning1, partitioning2 = self.run_concurrently(
+            [
+                (self.client.get_table_time_partitioning, {"table": self.table1}),
+                (self.client.get_table_time_partitioning, {"table": self.table2}),
+            ]
+        )
+        if partitioning1 is None or partitioning1 != partitioning2:
+            return None
+        return partitioning1
+
+    def get_partitions_last_modified(self) -> Dict[str, List[Optional[str]]]:
+        """Get the last modification of each partition in both tables"""
+        partitions1, partitions2 = self.run_concurrently(
+            [
+                (self.client.get_table_partitions, {"table": self.table1}),
+                (self.client.get_table_partitions, {"table": self.table2}),
+            ]
+        )
+        partitions = partitions1.merge(
+            partitions2, on="partition_id", how="outer", suffixes=("__1", "__2")
+        )
+        partitions = partitions.astype(object).where(partitions.notna(), None)
+        return {
+            row["partition_id"]: [row["last_modified_time__1"], row["last_modified_time__2"]]
+            for row in partitions.to_dict("records")
+        }
+
+    def get_partition_checksums(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        store: PartitionChecksumStore,
+    ) -> Tuple[pd.DataFrame, List[str]]:
+        """Get the row counts and checksums of each partition of both tables, only scanning the partitions modified since the last run.
+
+        Returns the partitions and the ids of the partitions scanned by this run.
+        """
+        partitioning = self.get_time_partitioning()
+        if partitioning is None:
+            raise ValueError(
+                "Incremental diffs need two tables partitioned by the same time column"
+            )
+        filtered_columns = TableSchema(
+            table_name="filtered_columns",
+            columns=[
+                common_table_schema.get_column(column) for column in selected_columns
+            ],
+        )
+
+        key = store.get_key(
+            table1=self.table1,
+            table2=self.table2,
+            primary_key=self.primary_key_columns[0]
+            if len(self.primary_key_columns) == 1
+            else self.primary_key_columns,
+            columns=sorted(selected_columns),
+            partitioning=partitioning,
+            tolerance=self.tolerance,
+        )
+        last_modified = self.get_partitions_last_modified()
+        stored_partitions = {
+            partition_id: partition
+            for partition_id, partition in store.get(key).items()
+            if partition_id in last_modified
+        }
+        modified_partitions = [
+            partition_id
+            for partition_id, partition_last_modified in last_modified.items()
+            if stored_partitions.get(partition_id, {}).get("last_modified")
+            != partition_last_modified
+        ]
+
+        # Rows of the streaming buffer can belong to any partition, all partitions are scanned again
+        if UNPARTITIONED_PARTITION_ID in modified_partitions:
+            stored_partitions = {}
+            query = self.get_query_partition_checksums(
+                common_table_schema=filtered_columns,
+                partitioning=partitioning,
+                partition_ids=None,
+            )
+        elif modified_partitions:
+            query = self.get_query_partition_checksums(
+                common_table_schema=filtered_columns,
+                partitioning=partitioning,
+                partition_ids=modified_partitions,
+            )
+        else:
+            query = None
+
+        if query is not None:
+            for partition_id in modified_partitions:
+                stored_partitions.pop(partition_id, None)
+            checksums = self.client.run_query_to_dataframe(query)
+            checksums = checksums.astype(object).where(checksums.notna(), None)
+            for row in checksums.to_dict("records"):
+                partition_id = row.pop("partition_id")
+                stored_partitions[partition_id] = {
+                    **row,
+                    "last_modified": last_modified.get(partition_id),
+                }
+            # Partitions without rows anymore are stored too, not to scan them again
+            for partition_id in modified_partitions:
+                if partition_id != UNPARTITIONED_PARTITION_ID:
+                    stored_partitions.setdefault(
+                        partition_id,
+                        {
+                            "row_count_table1": None,
+                            "row_count_table2": None,
+                            "checksum_table1": None,
+                            "checksum_table2": None,
+                            "last_modified": last_modified[partition_id],
+                        },
+                    )
+            store.set(key, stored_partitions)
+
+        df = pd.DataFrame(
+            [
+                {
+                    "partition_id": partition_id,
+                    "row_count_table1": partition["row_count_table1"],
+                    "row_count_table2": partition["row_count_table2"],
+                    "checksum_table1": partition["checksum_table1"],
+                    "checksum_table2": partition["checksum_table2"],
+                    "is_different": partition["row_count_table1"]
+                    != partition["row_count_table2"]
+                    or partition["checksum_table1"] != partition["checksum_table2"],
+                }
+                for partition_id, partition in sorted(stored_partitions.items())
+            ],
+            columns=[
+                "partition_id",
+                "row_count_table1",
+                "row_count_table2",
+                "checksum_table1",
+                "checksum_table2",
+                "is_different",
+            ],
+        )
+        return df, modified_partitions
+
+    def materialize_query(self, query: Select) -> str:
+        """Store the result of a query in a table, so that it can be paginated without running the query again"""
+        return self.client.materialize_query(query)
+
+    def count_rows(self, table: str) -> int:
+        """Get the number of rows of a table"""
+        query = select(alias(func("count", exp.Star()), "total_rows")).from_(
+            exp.to_table(table, dialect=self.dialect)
+        )
+        df = self.client.run_query_to_dataframe(query)
+        return int(df["total_rows"].iloc[0])
+
+    def get_sort_columns(self, table: str) -> List[str]:
+        """Get the columns a page of a table can be sorted by: neither diff flags, arrays nor structs"""
+        schema = self.client.get_table_schema_from_table(table)
+        return [
+            column.name
+            for column in schema.columns
+            if not column.name.endswith("__diff")
+            and column.name != PRIMARY_KEY_HASH
+            and not column.is_repeated
+            and not column.is_struct
+        ]
+
+    def get_page(
+        self,
+        table: str,
+        page_size: int,
+        sort_column: Optional[str] = None,
+        ascending: bool = True,
+        cursor: Optional[Tuple[Any, Any]] = None,
+        offset: int = 0,
+    ) -> DiffPage:
+        """Read one page of a table sorted by a column then by primary key.
+
+        Pages are read after `cursor`, the next_cursor of the previous page, or at `offset` when unknown.
+        """
+        query = self.get_query_page(
+            table=table,
+            page_size=page_size,
+            sort_column=sort_column,
+            ascending=ascending,
+            cursor=cursor,
+            offset=offset,
+        )
+        df = self.client.run_query_to_dataframe(query)
+
+        next_cursor = None
+        if len(df) == page_size:
+            last_row = df.iloc[-1]
+            next_cursor = (
+                last_row[sort_column] if sort_column is not None else None,
+                last_row[self.primary_key],
+            )
+        return DiffPage(rows=df, next_cursor=next_cursor)
+
+    def iter_plain_diff(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        limit: Optional[int] = None,
+    ) -> Tuple[Select, Iterator[pa.RecordBatch]]:
+        """Stream the rows where the columns values are different as Arrow record batches"""
+        query = self.get_query_plain_diff(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+        )
+        if limit is not None:
+            query = query.limit(limit)
+        return query, self.client.run_query_to_arrow_batches(query)
+
+    def export_plain_diff(
+        self,
+        path: str,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+    ) -> int:
+        """Write the rows where the columns values are different to a Parquet or CSV file, with bounded memory"""
+        _, batches = self.iter_plain_diff(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+        )
+        return write_batches(batches, path)
+
+    def get_differing_segments(
+        self,
+        common_table_schema: TableSchema,
+        segments_per_level: int = 16,
+        max_depth: int = 8,
+        max_rows: int = 100_000,
+        max_segments: int = 1_000,
+    ) -> Tuple[int, pd.DataFrame]:
+        """Bisect the primary key space, only recursing into segments whose checksums are different.
+
+        Returns the modulus of the last level and the differing segments with their row counts.
+        """
+        modulus = 1
+        segments = pd.DataFrame(
+            {"segment": [0], "row_count_table1": [None], "row_count_table2": [None]}
+        )
+
+        for _ in range(max_depth):
+            query = self.get_query_segment_checksums(
+                common_table_schema=common_table_schema,
+                modulus=modulus * segments_per_level,
+                parent_modulus=modulus,
+                parent_segments=segments["segment"].tolist(),
+            )
+            segments = self.client.run_query_to_dataframe(query)
+            modulus = modulus * segments_per_level
+
+            if segments.empty:
+                break
+
+            rows_to_compare = (
+                segments[["row_count_table1", "row_count_table2"]]
+                .fillna(0)
+                .max(axis=1)
+                .sum()
+            )
+            if (
+                rows_to_compare <= max_rows
+                or len(segments) * segments_per_level > max_segments
+            ):
+                break
+
+        return modulus, segments
+
+    def get_query_bisection_diff(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        segments_per_level: int = 16,
+        max_depth: int = 8,
+        max_rows: int = 100_000,
+    ) -> Tuple[Select, pd.DataFrame]:
+        """Run the checksum queries, then create a SQL query to get the rows where the columns values are different, restricted to the differing segments.
+
+        Returns the query and the differing segments.
+        """
         filtered_columns = TableSchema(
             table_name="filtered_columns",
             columns=[
                 common_table_schema.get_column(column) for column in selected_columns
             ],
         )
-        query = self.get_query_plain_diff_tables(
+        modulus, segments = self.get_differing_segments(
             common_table_schema=filtered_columns,
+            segments_per_level=segments_per_level,
+            max_depth=max_depth,
+            max_rows=max_rows,
         )
+        query = self.get_query_plain_diff_segments(
+            common_table_schema=filtered_columns,
+            modulus=modulus,
+            segments=segments["segment"].tolist(),
+        )
+        return query, segments
+
+    def get_bisection_diff(
+        self,
+        selected_columns: List[str],
+        common_table_schema: TableSchema,
+        segments_per_level: int = 16,
+        max_depth: int = 8,
+        max_rows: int = 100_000,
+    ) -> Tuple[Select, pd.DataFrame]:
+        """Get the rows where the columns values are different, only joining the segments whose checksums differ"""
+        query, segments = self.get_query_bisection_diff(
+            selected_columns=selected_columns,
+            common_table_schema=common_table_schema,
+            segments_per_level=segments_per_level,
+            max_depth=max_depth,
+            max_rows=max_rows,
+        )
+
+        if segments.empty:
+            return query, pd.DataFrame(columns=[self.primary_key])
+
         df = self.client.run_query_to_dataframe(query)
         return query, df
-    
+
     def run_query_check_primary_keys_unique(self, table: str) -> Tuple[bool, str]:
         """Check if the primary keys are unique for a given row"""
         query = self.get_query_check_primary_keys_unique(table_name=table)
-        df = self.client.run_query_to_dataframe(query)
+        # A single duplicated key is enough to fail the check
+        df = self.client.run_query_to_dataframe(query.limit(1))
 
         if not df.empty:
             error_message = f"Primary key is not unique for {table}: . You can use the query: {query.sql()} to check it."
@@ -271,15 +1095,50 @@ class DataProcessor(ABC):
         df = self.client.run_query_to_dataframe(query)
         return df
 
-    def run_query_exclusive_primary_keys(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        """Get the rows where the primary keys are exclusive to one table"""
-        df_exclusive_table1 = self.client.run_query_to_dataframe(
-            self.get_query_exclusive_primary_keys(exclusive_to="table1")
-        )
-        df_exclusive_table1.set_index(self.primary_key, inplace=True)
+    def run_query_exclusive_primary_keys(
+        self, limit: int = 500
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Get the first rows where the primary keys are exclusive to one table, only `limit` rows are fetched"""
+        common_table_schema = self.get_common_schema_from_tables()
+
+        def get_exclusive_rows(exclusive_to: str) -> pd.DataFrame:
+            table = head(
+                self.iter_exclusive_primary_keys(
+                    exclusive_to=exclusive_to,
+                    common_table_schema=common_table_schema,
+                    limit=limit,
+                ),
+                limit,
+            )
+            if table is None:
+                query = self.get_query_exclusive_primary_keys(
+                    exclusive_to=exclusive_to,
+                    common_table_schema=common_table_schema,
+                    limit=limit,
+                )
+                return pd.DataFrame(columns=query.named_selects)
+            return table.to_pandas()
 
-        df_exclusive_table2 = self.client.run_query_to_dataframe(
-            self.get_query_exclusive_primary_keys(exclusive_to="table2")
+        df_exclusive_table1, df_exclusive_table2 = self.run_concurrently(
+            [
+                (get_exclusive_rows, {"exclusive_to": exclusive_to})
+                for exclusive_to in ["table1", "table2"]
+            ]
         )
-        df_exclusive_table2.set_index(self.primary_key, inplace=True)
+        df_exclusive_table1.set_index(self.primary_key_columns, inplace=True)
+        df_exclusive_table2.set_index(self.primary_key_columns, inplace=True)
         return df_exclusive_table1, df_exclusive_table2
+
+    def iter_exclusive_primary_keys(
+        self,
+        exclusive_to: str,
+        common_table_schema: Optional[TableSchema] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[pa.RecordBatch]:
+        """Stream the rows whose primary key is exclusive to one table as Arrow record batches"""
+        query = self.get_query_exclusive_primary_keys(
+            exclusive_to=exclusive_to,
+            common_table_schema=common_table_schema,
+            limit=limit,
+        )
+        return self.client.run_query_to_arrow_batches(query)
@@ -0,0 +1,53 @@
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+
+def write_batches(batches: Iterable[pa.RecordBatch], path: str) -> int:
+    """Write record batches to a Parquet or CSV file as they arrive, returns the number of rows written.
+
+    No file is written when there is no batch.
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix not in [".parquet", ".csv"]:
+        raise ValueError(f"Unsupported export format {suffix}, expected .parquet or .csv")
+
+    writer = None
+    total_rows = 0
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = (
+                    pq.ParquetWriter(path, batch.schema)
+                    if suffix == ".parquet"
+                    else pa_csv.CSVWriter(path, batch.schema)
+                )
+            writer.write_batch(batch)
+            total_rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return total_rows
+
+
+def head(batches: Iterable[pa.RecordBatch], num_rows: int) -> Optional[pa.Table]:
+    """First rows of record batches, the next batches are not fetched. None when there is no batch"""
+    iterator = iter(batches)
+    head_batches = []
+    total_rows = 0
+    try:
+        for batch in iterator:
+            head_batches.append(batch.slice(0, num_rows - total_rows))
+            total_rows += head_batches[-1].num_rows
+            if total_rows >= num_rows:
+                break
+    finally:
+        # Release the result of a generator stopped early, e.g. the lock of a DuckDB connection
+        if hasattr(iterator, "close"):
+            iterator.close()
+    if not head_batches:
+        return None
+    return pa.Table.from_batches(head_batches)
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Optional
+
+# Parts timestamps, datetimes and times can be truncated to before comparing them
+TIMESTAMP_TRUNCATION_PARTS = ("MICROSECOND", "MILLISECOND", "SECOND", "MINUTE", "HOUR")
+
+
+@dataclass(frozen=True)
+class ComparisonTolerance:
+    """Differences ignored when comparing the values of both tables, values are compared exactly by default"""
+
+    # Floats whose absolute difference is lower or equal are equal
+    float_epsilon: float = 0
+    # Timestamps, datetimes and times are truncated to this part, e.g. SECOND
+    timestamp_truncation: Optional[str] = None
+    case_insensitive_strings: bool = False
+    # Arrays are compared as sets of values, by sorting their distinct values, instead of by fingerprint
+    ignore_array_duplicates: bool = False
+
+    def __post_init__(self):
+        if self.float_epsilon < 0:
+            raise ValueError("float_epsilon must be positive")
+        if self.timestamp_truncation is not None:
+            part = self.timestamp_truncation.upper()
+            if part not in TIMESTAMP_TRUNCATION_PARTS:
+                raise ValueError(
+                    f"timestamp_truncation must be one of {', '.join(TIMESTAMP_TRUNCATION_PARTS)}"
+                )
+            object.__setattr__(self, "timestamp_truncation", part)
@@ -0,0 +1,42 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+from .sampling import SamplingMethod
+
+
+@dataclass
+class DiffConfig:
+    """Configuration of a diff between two tables, as listed in a batch manifest"""
+
+    name: str
+    table1: str
+    table2: str
+    # One column, or the columns of a composite primary key
+    primary_key: Union[str, List[str]]
+    # All common columns when empty
+    columns: List[str] = field(default_factory=list)
+    sampling_rate: int = 100
+    sampling_method: SamplingMethod = SamplingMethod.HASH
+    # bigquery or duckdb
+    engine: str = "bigquery"
+    # Arguments of ComparisonTolerance, e.g. {"float_epsilon": 0.001}
+    tolerance: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def primary_key_columns(self) -> List[str]:
+        if isinstance(self.primary_key, str):
+            return [self.primary_key]
+        return list(self.primary_key)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None):
+        """Create a config from a manifest entry, missing keys are read from `defaults`"""
+        values = {**(defaults or {}), **data}
+        values.setdefault("name", f"{values.get('table1')} vs {values.get('table2')}")
+        fields = cls.__dataclass_fields__
+        unknown_keys = set(values) - set(fields)
+        if unknown_keys:
+            raise ValueError(
+                f"Unknown keys for diff {values['name']}: {', '.join(sorted(unknown_keys))}"
+            )
+        return cls(**values)
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+import pandas as pd
+
+
+@dataclass
+class DiffPage:
+    """A page of a diff result, read from the warehouse"""
+
+    rows: pd.DataFrame
+    # Values of the sort column and primary key of the last row, to read the next page.
+    # None when this is the last page
+    next_cursor: Optional[Tuple[Any, Any]]
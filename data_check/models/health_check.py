@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import List
+
+import pandas as pd
+
+
+@dataclass
+class HealthCheck:
+    """Pre-diff checks of two tables, computed with a single query, and one more query per extra chunk of columns of wide schemas"""
+
+    duplicated_keys_table1: int
+    duplicated_keys_sample_table1: List[str]
+    duplicated_keys_table2: int
+    duplicated_keys_sample_table2: List[str]
+    # Same format as DataProcessor.run_query_compare_primary_keys
+    primary_keys: pd.DataFrame
+    # Same format as DataProcessor.get_column_diff_ratios
+    column_ratios: pd.DataFrame
+
+    @property
+    def primary_keys_unique(self) -> bool:
+        return self.duplicated_keys_table1 == 0 and self.duplicated_keys_table2 == 0
+
+    def get_error_messages(self) -> List[str]:
+        """Returns a message for each table whose primary keys are not unique"""
+        error_messages = []
+        for table, duplicated_keys, sample in [
+            ("table1", self.duplicated_keys_table1, self.duplicated_keys_sample_table1),
+            ("table2", self.duplicated_keys_table2, self.duplicated_keys_sample_table2),
+        ]:
+            if duplicated_keys > 0:
+                error_messages.append(
+                    f"Primary key is not unique for {table}: {duplicated_keys} duplicated keys, for instance: {', '.join(sample)}"
+                )
+        return error_messages
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List
+
+from .table import BigQueryDataType
+
+# Format of BigQuery partition ids for each time partitioning type
+PARTITION_ID_FORMATS = {
+    "HOUR": "%Y%m%d%H",
+    "DAY": "%Y%m%d",
+    "MONTH": "%Y%m",
+    "YEAR": "%Y",
+}
+
+# Partition of the rows whose partitioning column is null
+NULL_PARTITION_ID = "__NULL__"
+# Rows of the streaming buffer, not yet assigned to a partition
+UNPARTITIONED_PARTITION_ID = "__UNPARTITIONED__"
+
+
+@dataclass
+class TimePartitioning:
+    """Time partitioning of a table by a column"""
+
+    column: str
+    # HOUR, DAY, MONTH or YEAR
+    partition_type: str
+    field_type: BigQueryDataType
+
+    def get_query_partition_id(self, prefix: str = "") -> str:
+        """Returns SQL computing the BigQuery partition id of each row"""
+        return (
+            f"coalesce(format_timestamp('{PARTITION_ID_FORMATS[self.partition_type]}'"
+            f", cast({prefix}{self.column} as timestamp)), '{NULL_PARTITION_ID}')"
+        )
+
+    def get_partition_bounds(self, partition_id: str):
+        """Returns the first time of a partition and the first time of the next one"""
+        start = datetime.strptime(
+            partition_id, PARTITION_ID_FORMATS[self.partition_type]
+        )
+        if self.partition_type == "HOUR":
+            return start, start + timedelta(hours=1)
+        if self.partition_type == "DAY":
+            return start, start + timedelta(days=1)
+        if self.partition_type == "MONTH":
+            return start, start.replace(
+                year=start.year + start.month // 12, month=start.month % 12 + 1
+            )
+        return start, start.replace(year=start.year + 1)
+
+    def get_query_literal(self, value: datetime) -> str:
+        if self.field_type == BigQueryDataType.DATE:
+            return f"date '{value:%Y-%m-%d}'"
+        if self.field_type == BigQueryDataType.DATETIME:
+            return f"datetime '{value:%Y-%m-%d %H:%M:%S}'"
+        return f"timestamp '{value:%Y-%m-%d %H:%M:%S}'"
+
+    def get_query_partitions_filter(
+        self, partition_ids: List[str], prefix: str = ""
+    ) -> str:
+        """Returns a SQL condition keeping only the rows of the given partitions, as ranges of the column so that BigQuery prunes the other partitions"""
+        column = f"{prefix}{self.column}"
+        conditions = []
+        for partition_id in sorted(partition_ids):
+            if partition_id == NULL_PARTITION_ID:
+                conditions.append(f"{column} is null")
+                continue
+            start, end = self.get_partition_bounds(partition_id)
+            conditions.append(
+                f"({column} >= {self.get_query_literal(start)} and {column} < {self.get_query_literal(end)})"
+            )
+        if not conditions:
+            return "false"
+        return " or ".join(conditions)
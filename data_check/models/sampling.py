@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class SamplingMethod(str, Enum):
+    # Keep the rows whose primary key hash falls in the sample, the same keys are kept on both sides
+    HASH = "hash"
+    # Sample storage blocks of each table independently, cheaper but only for direct tables as input
+    TABLESAMPLE = "tablesample"
@@ -1,9 +1,14 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
 import pandas as pd
-from google.cloud import bigquery
+from sqlglot import exp, parse_one
+
+from .comparison import ComparisonTolerance
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
 
 
 class BigQueryDataType(str, Enum):
@@ -32,6 +37,82 @@ class BigQueryDataType(str, Enum):
 
 class BigQueryDataMode(str, Enum):
     REPEATED = "REPEATED"
+    NULLABLE = "NULLABLE"
+
+
+# Map DuckDB type ids to their closest BigQuery data type
+DUCKDB_DATA_TYPES = {
+    "varchar": BigQueryDataType.STRING,
+    "tinyint": BigQueryDataType.INTEGER,
+    "smallint": BigQueryDataType.INTEGER,
+    "integer": BigQueryDataType.INTEGER,
+    "bigint": BigQueryDataType.INTEGER,
+    "hugeint": BigQueryDataType.INTEGER,
+    "utinyint": BigQueryDataType.INTEGER,
+    "usmallint": BigQueryDataType.INTEGER,
+    "uinteger": BigQueryDataType.INTEGER,
+    "ubigint": BigQueryDataType.INTEGER,
+    "float": BigQueryDataType.FLOAT,
+    "double": BigQueryDataType.FLOAT,
+    "decimal": BigQueryDataType.NUMERIC,
+    "boolean": BigQueryDataType.BOOLEAN,
+    "timestamp with time zone": BigQueryDataType.TIMESTAMP,
+    "timestamp": BigQueryDataType.DATETIME,
+    "timestamp_s": BigQueryDataType.DATETIME,
+    "timestamp_ms": BigQueryDataType.DATETIME,
+    "timestamp_ns": BigQueryDataType.DATETIME,
+    "date": BigQueryDataType.DATE,
+    "time": BigQueryDataType.TIME,
+    "blob": BigQueryDataType.BYTES,
+    "struct": BigQueryDataType.RECORD,
+    "map": BigQueryDataType.RECORD,
+    "json": BigQueryDataType.JSON,
+}
+
+
+# Values of a REPEATED column as a string, whatever the order of the elements
+ARRAY_AS_STRING = parse_one(
+    "array_to_string((select array_agg(distinct x order by x asc) from unnest(:column) as x), ',')",
+    dialect="bigquery",
+)
+
+# Fingerprint of the values of a REPEATED column whatever the order of the elements, without sorting them:
+# the sum of the fingerprints of the elements, NULL for empty arrays
+ARRAY_FINGERPRINT = parse_one(
+    "(select sum(cast(farm_fingerprint(to_json_string(x)) as numeric(29))) from unnest(:column) as x)",
+    dialect="bigquery",
+)
+
+# Fingerprint of a STRUCT value, from its JSON with the fields in the order of the schema
+STRUCT_FINGERPRINT = parse_one("farm_fingerprint(to_json_string(:column))", dialect="bigquery")
+
+
+# Types compared with their native equality, values of other types are casted as strings
+NATIVE_COMPARISON_TYPES = (
+    BigQueryDataType.STRING,
+    BigQueryDataType.INTEGER,
+    BigQueryDataType.INT64,
+    BigQueryDataType.FLOAT,
+    BigQueryDataType.FLOAT64,
+    BigQueryDataType.NUMERIC,
+    BigQueryDataType.BIGNUMERIC,
+    BigQueryDataType.BOOLEAN,
+    BigQueryDataType.BOOL,
+    BigQueryDataType.TIMESTAMP,
+    BigQueryDataType.DATE,
+    BigQueryDataType.TIME,
+    BigQueryDataType.DATETIME,
+    BigQueryDataType.BYTES,
+)
+
+FLOAT_DATA_TYPES = (BigQueryDataType.FLOAT, BigQueryDataType.FLOAT64)
+
+# Functions truncating time values to a part, for the timestamp_truncation tolerance
+TIME_TRUNCATE_FUNCTIONS = {
+    BigQueryDataType.TIMESTAMP: "timestamp_trunc",
+    BigQueryDataType.DATETIME: "datetime_trunc",
+    BigQueryDataType.TIME: "time_trunc",
+}
 
 
 @dataclass
@@ -40,6 +121,88 @@ class ColumnSchema:
     field_type: BigQueryDataType
     mode: BigQueryDataMode
 
+    @property
+    def is_repeated(self) -> bool:
+        return (
+            self.field_type == BigQueryDataType.ARRAY
+            or self.mode == BigQueryDataMode.REPEATED
+        )
+
+    @property
+    def is_struct(self) -> bool:
+        return self.field_type in (BigQueryDataType.RECORD, BigQueryDataType.STRUCT)
+
+    def get_comparable_expression(
+        self, field: exp.Expression, tolerance: ComparisonTolerance
+    ) -> exp.Expression:
+        """Returns the value of the column as compared, normalized by the tolerance.
+
+        Arrays and structs are compared by fingerprints, arrays nested in structs are compared in order.
+        """
+        if self.is_repeated and not self.is_struct and tolerance.ignore_array_duplicates:
+            array_as_string = ARRAY_AS_STRING.copy()
+            array_as_string.find(exp.Placeholder).replace(field)
+            return array_as_string
+
+        if self.is_repeated or self.is_struct:
+            fingerprint = (ARRAY_FINGERPRINT if self.is_repeated else STRUCT_FINGERPRINT).copy()
+            fingerprint.find(exp.Placeholder).replace(field)
+            return fingerprint
+
+        if self.field_type == BigQueryDataType.JSON:
+            return exp.func("to_json_string", field, dialect="bigquery", copy=False)
+
+        if self.field_type not in NATIVE_COMPARISON_TYPES:
+            return exp.cast(field, exp.DataType.Type.TEXT, copy=False)
+
+        if self.field_type == BigQueryDataType.STRING and tolerance.case_insensitive_strings:
+            return exp.Lower(this=field)
+
+        if self.field_type in TIME_TRUNCATE_FUNCTIONS and tolerance.timestamp_truncation:
+            truncated = parse_one(
+                f"{TIME_TRUNCATE_FUNCTIONS[self.field_type]}(:column, {tolerance.timestamp_truncation})",
+                dialect="bigquery",
+            )
+            truncated.find(exp.Placeholder).replace(field)
+            return truncated
+
+        return field
+
+    def get_diff_flag_expression(
+        self,
+        value1: exp.Expression,
+        value2: exp.Expression,
+        tolerance: ComparisonTolerance,
+    ) -> exp.Expression:
+        """Returns a condition true when two comparable values are different, NULL is only equal to NULL"""
+        is_distinct = exp.NullSafeNEQ(this=value1, expression=value2)
+        if self.field_type in FLOAT_DATA_TYPES and tolerance.float_epsilon:
+            # The difference is NULL when a value is NULL
+            return exp.func(
+                "coalesce",
+                exp.GT(
+                    this=exp.Abs(this=exp.Sub(this=value1.copy(), expression=value2.copy())),
+                    expression=exp.Literal.number(tolerance.float_epsilon),
+                ),
+                is_distinct,
+                copy=False,
+            )
+        return is_distinct
+
+    def get_equal_flag_expression(
+        self,
+        value1: exp.Expression,
+        value2: exp.Expression,
+        tolerance: ComparisonTolerance,
+    ) -> exp.Expression:
+        """Returns a condition true when two comparable values are equal, and NULL when one of them is NULL"""
+        if self.field_type in FLOAT_DATA_TYPES and tolerance.float_epsilon:
+            return exp.LTE(
+                this=exp.Abs(this=exp.Sub(this=value1, expression=value2)),
+                expression=exp.Literal.number(tolerance.float_epsilon),
+            )
+        return exp.EQ(this=value1, expression=value2)
+
 
 @dataclass
 class TableSchema:
@@ -50,70 +213,108 @@ class TableSchema:
     def columns_names(self) -> list:
         return [column.name for column in self.columns]
 
-    def get_unsupported_fields(self) -> List[str]:
-        """Returns a list of unsupported fields"""
-        unsupported_fields = []
-        for column in self.columns:
-            if column.field_type == BigQueryDataType.RECORD:
-                unsupported_fields.append(column.name)
-        return unsupported_fields
-
     def get_column(self, column_name: str) -> ColumnSchema:
         return next(column for column in self.columns if column.name == column_name)
 
-    def get_common_column_names(
-        self, other, include_unsupported: bool = True
-    ) -> List[str]:
+    def get_common_column_names(self, other) -> List[str]:
         """Returns a list of common columns"""
-        common_columns_names = list(
-            set(self.columns_names).intersection(other.columns_names)
-        )
+        return list(set(self.columns_names).intersection(other.columns_names))
 
-        if include_unsupported:
-            return common_columns_names
+    def get_comparable_expressions(
+        self,
+        table: Optional[str] = None,
+        column_name_suffix: str = "",
+        tolerance: Optional[ComparisonTolerance] = None,
+    ) -> List[exp.Expression]:
+        """Returns the values compared for each column, native values are compared instead of strings"""
+        tolerance = tolerance or ComparisonTolerance()
+        return [
+            column.get_comparable_expression(
+                exp.column(f"{column.name}{column_name_suffix}", table=table),
+                tolerance,
+            )
+            for column in self.columns
+        ]
 
-        unsupported_fields = set(
-            self.get_unsupported_fields() + other.get_unsupported_fields()
-        )
+    def get_diff_flag_expressions(
+        self,
+        values1: List[exp.Expression],
+        values2: List[exp.Expression],
+        tolerance: Optional[ComparisonTolerance] = None,
+    ) -> List[exp.Expression]:
+        """Returns for each column a condition true when its values in both tables are different"""
+        tolerance = tolerance or ComparisonTolerance()
         return [
-            column
-            for column in common_columns_names
-            if column not in unsupported_fields
+            column.get_diff_flag_expression(value1, value2, tolerance)
+            for column, value1, value2 in zip(self.columns, values1, values2)
         ]
 
-    def get_query_cast_schema_as_string(
-        self, prefix="", column_name_suffix=""
-    ) -> List[str]:
-        """Returns SQL to query table schema as string, need to support arrays and strucs so leverage array_to_string and struct_to_string"""
-        query_parts = []
+    def get_equal_flag_expressions(
+        self,
+        values1: List[exp.Expression],
+        values2: List[exp.Expression],
+        tolerance: Optional[ComparisonTolerance] = None,
+    ) -> List[exp.Expression]:
+        """Returns for each column a condition true when its values in both tables are not null and equal"""
+        tolerance = tolerance or ComparisonTolerance()
+        return [
+            column.get_equal_flag_expression(value1, value2, tolerance)
+            for column, value1, value2 in zip(self.columns, values1, values2)
+        ]
+
+    def get_cast_schema_as_string_expressions(
+        self, table: Optional[str] = None, column_name_suffix: str = ""
+    ) -> List[exp.Expression]:
+        """Returns the expressions casting each column as a string, arrays are sorted and nested structs are skipped"""
+        expressions = []
         for column in self.columns:
+            field = exp.column(f"{column.name}{column_name_suffix}", table=table)
             if (
-                column.field_type == BigQueryDataType.STRING
-                and column.mode != BigQueryDataMode.REPEATED
-            ):
-                query_parts.append(f"{prefix}{column.name}{column_name_suffix}")
-
-            elif (
                 column.field_type == BigQueryDataType.ARRAY
                 or column.mode == BigQueryDataMode.REPEATED
             ):
-                query_parts.append(
-                    f"array_to_string((select array_agg(distinct x order by x asc) FROM UNNEST({prefix}{column.name}{column_name_suffix}) AS x), ',')"
-                )
+                array_as_string = ARRAY_AS_STRING.copy()
+                array_as_string.find(exp.Placeholder).replace(field)
+                expressions.append(array_as_string)
 
-            elif column.field_type == BigQueryDataType.RECORD:
+            elif column.field_type in (
+                BigQueryDataType.RECORD,
+                BigQueryDataType.STRUCT,
+            ):
                 # For now we don't support nested structs
                 pass
 
-            elif column.field_type == BigQueryDataType.STRUCT:
-                # For now we don't support nested structs
-                pass
+            elif column.field_type == BigQueryDataType.STRING:
+                expressions.append(field)
 
             else:
-                query_parts.append(
-                    f"cast({prefix}{column.name}{column_name_suffix} as string)"
-                )
-        return query_parts
+                expressions.append(exp.cast(field, exp.DataType.Type.TEXT, copy=False))
+        return expressions
+
+    def get_row_fingerprint_expression(
+        self,
+        table: Optional[str] = None,
+        column_name_suffix: str = "",
+        tolerance: Optional[ComparisonTolerance] = None,
+    ) -> exp.Expression:
+        """Returns a 64-bit fingerprint of the row, based on the same values used to compare rows.
+
+        Floats within the tolerance may have different fingerprints, the rows are then compared with the tolerance.
+        """
+        values = self.get_comparable_expressions(
+            table=table, column_name_suffix=column_name_suffix, tolerance=tolerance
+        )
+        struct = exp.Struct(
+            expressions=[
+                exp.PropertyEQ(this=exp.to_identifier(column.name), expression=value)
+                for value, column in zip(values, self.columns)
+            ]
+        )
+        return exp.func(
+            "farm_fingerprint",
+            exp.func("to_json_string", struct, dialect="bigquery", copy=False),
+            copy=False,
+        )
 
     def to_dataframe(self) -> pd.DataFrame:
         """Returns a dataframe of the table schema"""
@@ -123,7 +324,7 @@ class TableSchema:
         )
 
     @classmethod
-    def from_bq_table(cls, table: bigquery.Table):
+    def from_bq_table(cls, table: "bigquery.Table"):
         columns = []
         for field in table.schema:
             columns.append(
@@ -134,7 +335,7 @@ class TableSchema:
         return TableSchema(table_name=table.table_id, columns=columns)
 
     @classmethod
-    def from_bq_query_job(cls, query_job: bigquery.QueryJob):
+    def from_bq_query_job(cls, query_job: "bigquery.QueryJob"):
         columns = []
         for field in query_job.schema:
             columns.append(
@@ -143,3 +344,22 @@ class TableSchema:
                 )
             )
         return TableSchema(table_name="query_result", columns=columns)
+
+    @classmethod
+    def from_duckdb_relation(cls, relation, table_name: str):
+        columns = []
+        for name, data_type in zip(relation.columns, relation.types):
+            mode = BigQueryDataMode.NULLABLE
+            if data_type.id == "list":
+                mode = BigQueryDataMode.REPEATED
+                data_type = data_type.child
+            columns.append(
+                ColumnSchema(
+                    name=name,
+                    field_type=DUCKDB_DATA_TYPES.get(
+                        data_type.id, BigQueryDataType.STRING
+                    ).value,
+                    mode=mode.value,
+                )
+            )
+        return TableSchema(table_name=table_name, columns=columns)
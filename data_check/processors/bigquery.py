@@ -1,48 +1,204 @@
-from sqlglot import alias, column, condition, func, parse_one, select
+from typing import Any, List, Optional, Tuple, Union
+
+import pandas as pd
+from sqlglot import alias, column, condition, exp, func, parse_one, select
 from sqlglot.expressions import Select
 
-from data_check.data_processor import DataProcessor
-from data_check.models.table import TableSchema
-from data_check.query.query_bq import QueryBigQuery
+from data_check.cache import memoize_query
+from data_check.data_processor import (DEFAULT_MAX_WORKERS, PRIMARY_KEY_HASH,
+                                       DataProcessor)
+from data_check.models.partition import TimePartitioning
+from data_check.models.sampling import SamplingMethod
+from data_check.models.table import BigQueryDataMode, BigQueryDataType, TableSchema
+from data_check.query_client import QueryClient
+
+from .utils import (
+    add_suffix_to_column_names,
+    fill_template,
+    is_not_null,
+    is_null,
+    to_sql_literal,
+    to_struct,
+    unnest_structs,
+)
+
+# Number of primary key hash buckets used to sample, allowing sampling rates down to 0.01 percent
+SAMPLING_MODULUS = 10_000
+
+# Readable value of a composite primary key, for the samples of duplicated keys
+PRIMARY_KEY_VALUE = "primary_key__value"
 
-from .utils import add_suffix_to_column_names
+# Data types for which min, max and quantiles are profiled
+ORDERABLE_DATA_TYPES = {
+    BigQueryDataType.STRING,
+    BigQueryDataType.INTEGER,
+    BigQueryDataType.INT64,
+    BigQueryDataType.FLOAT,
+    BigQueryDataType.FLOAT64,
+    BigQueryDataType.NUMERIC,
+    BigQueryDataType.BIGNUMERIC,
+    BigQueryDataType.DATE,
+    BigQueryDataType.DATETIME,
+    BigQueryDataType.TIMESTAMP,
+    BigQueryDataType.TIME,
+}
 
 
 class BigQueryProcessor(DataProcessor):
-    def __init__(self, query1: str, query2: str) -> None:
-        super().__init__(query1, query2, dialect="bigquery", client=QueryBigQuery())
+    def __init__(
+        self,
+        query1: str,
+        query2: str,
+        client: Optional[QueryClient] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
+        if client is None:
+            # Imported here so that processors can be imported without the BigQuery client library
+            from data_check.query.query_bq import QueryBigQuery
+
+            client = QueryBigQuery()
+        super().__init__(
+            query1,
+            query2,
+            dialect="bigquery",
+            client=client,
+            max_workers=max_workers,
+        )
 
     @property
     def with_statement_query(self) -> Select:
         return (
-            select().with_("table1", as_=self.query1).with_("table2", as_=self.query2)
+            select()
+            .with_("table1", as_=self.add_primary_key_hash(self.query1))
+            .with_("table2", as_=self.add_primary_key_hash(self.query2))
+        )
+
+    def get_query_primary_key_value(self) -> exp.Expression:
+        """Returns a composite primary key as a string, null values and types included"""
+        return func(
+            "to_json_string",
+            to_struct([(col, column(col)) for col in self.primary_key_columns]),
+            dialect=self.dialect,
+            copy=False,
         )
 
+    def add_primary_key_hash(self, query: Select) -> Select:
+        """Add the INT64 fingerprint of a composite primary key to an input, so that tables are joined on a single column"""
+        if not self.has_composite_primary_key:
+            return query
+        return select(
+            "*",
+            alias(
+                func("farm_fingerprint", self.get_query_primary_key_value(), copy=False),
+                PRIMARY_KEY_HASH,
+                copy=False,
+            ),
+            copy=False,
+        ).from_(query.subquery())
+
+    def get_primary_key_columns(self, table: str) -> List[exp.Column]:
+        """Columns of the primary key, with the fingerprint of a composite key to sort the results by"""
+        columns = self.primary_key_columns
+        if self.has_composite_primary_key:
+            columns = columns + [PRIMARY_KEY_HASH]
+        return [column(col, table=table) for col in columns]
+
     @property
     def with_statement_query_sampled(self) -> Select:
+        if self.sampling_rate >= 100:
+            return self.with_statement_query
+
         if (
-            self._table1 is not None
-            and self._table2 is not None
-            and self.sampling_rate < 100
+            self.sampling_method == SamplingMethod.TABLESAMPLE
+            and self.is_table_sampling_allowed
         ):
             return (
                 select()
                 .with_(
                     "table1",
-                    as_=select("*").from_(
-                        f"{self.table1} tablesample system ({self.sampling_rate} percent)",
-                        dialect=self.dialect,
+                    as_=self.add_primary_key_hash(
+                        select("*").from_(
+                            f"{self.table1} tablesample system ({self.sampling_rate} percent)",
+                            dialect=self.dialect,
+                        )
                     ),
                 )
                 .with_(
                     "table2",
-                    as_=select("*").from_(
-                        f"{self.table2} tablesample system ({self.sampling_rate} percent)",
-                        dialect=self.dialect,
+                    as_=self.add_primary_key_hash(
+                        select("*").from_(
+                            f"{self.table2} tablesample system ({self.sampling_rate} percent)",
+                            dialect=self.dialect,
+                        )
                     ),
                 )
             )
-        return self.with_statement_query
+
+        if not self.has_primary_key:
+            # Keep the same rows on both sides, e.g. to profile the columns before choosing a primary key
+            return (
+                select()
+                .with_(
+                    "table1",
+                    as_=select("*")
+                    .from_(self.query1.subquery("row1"))
+                    .where(self.get_query_row_sample_filter("row1"), dialect=self.dialect),
+                )
+                .with_(
+                    "table2",
+                    as_=select("*")
+                    .from_(self.query2.subquery("row2"))
+                    .where(self.get_query_row_sample_filter("row2"), dialect=self.dialect),
+                )
+            )
+
+        # Keep the same primary keys on both sides, so that sampled tables can be compared
+        return self.get_with_statement_query_filtered(self.get_query_sample_filter())
+
+    def get_with_statement_query_filtered(
+        self, condition: Union[str, exp.Expression]
+    ) -> Select:
+        """Same as with_statement_query, keeping only the rows of both inputs matching a condition"""
+        return (
+            select()
+            .with_(
+                "table1",
+                as_=select("*")
+                .from_(self.add_primary_key_hash(self.query1).subquery())
+                .where(condition, dialect=self.dialect),
+            )
+            .with_(
+                "table2",
+                as_=select("*")
+                .from_(self.add_primary_key_hash(self.query2).subquery())
+                .where(condition, dialect=self.dialect),
+            )
+        )
+
+    def get_with_statement_query_partitions(
+        self,
+        partitioning: TimePartitioning,
+        partition_ids: Optional[List[str]] = None,
+    ) -> Select:
+        """Same as with_statement_query, without sampling, keeping only some partitions of both tables when given"""
+        if partition_ids is None:
+            return self.with_statement_query
+        return self.get_with_statement_query_filtered(
+            partitioning.get_query_partitions_filter(partition_ids)
+        )
+
+    def get_query_sample_filter(self) -> exp.Expression:
+        """Returns a condition keeping `sampling_rate` percent of the primary keys, using a hash of the key"""
+        threshold = int(self.sampling_rate * SAMPLING_MODULUS / 100)
+        return exp.LT(
+            this=self.get_query_segment(SAMPLING_MODULUS),
+            expression=exp.convert(threshold),
+        )
+
+    def get_query_row_sample_filter(self, row: str) -> str:
+        """Returns a SQL condition keeping `sampling_rate` percent of the rows, using a hash of all the values of the row"""
+        threshold = int(self.sampling_rate * SAMPLING_MODULUS / 100)
+        return f"abs(mod(farm_fingerprint(to_json_string({row})), {SAMPLING_MODULUS})) < {threshold}"
 
     def check_input_is_sql(self, value: str) -> bool:
         """Check if the input is a SQL query"""
@@ -51,7 +207,31 @@ class BigQueryProcessor(DataProcessor):
     def get_sql_exp_from_tablename(self, tablename: str) -> Select:
         return select("*").from_(tablename, dialect=self.dialect)
 
+    def get_query_segment(self, modulus: int) -> exp.Expression:
+        """Returns an expression assigning each primary key to one of `modulus` segments, using a hash of the key"""
+        key_hash: exp.Expression = column(self.primary_key)
+        if not self.has_composite_primary_key:
+            key_hash = func(
+                "farm_fingerprint",
+                exp.cast(key_hash, exp.DataType.Type.TEXT, copy=False),
+                copy=False,
+            )
+        return func(
+            "abs",
+            func("mod", key_hash, exp.convert(modulus), dialect=self.dialect, copy=False),
+            copy=False,
+        )
+
+    def get_query_segment_filter(
+        self, modulus: int, segments: List[int]
+    ) -> exp.Expression:
+        """Returns a condition keeping only the rows of the given segments"""
+        if not segments:
+            return exp.false()
+        return self.get_query_segment(modulus).isin(*segments, copy=False)
+
     # Create a query to compare two tables common and exlusive primary keys for two tables
+    @memoize_query
     def get_query_insight_tables_primary_keys(self) -> Select:
         """Compare the primary keys of two tables"""
 
@@ -91,6 +271,7 @@ class BigQueryProcessor(DataProcessor):
 
         return query
 
+    @memoize_query
     def get_query_check_primary_keys_unique(self, table_name: str) -> Select:
         """Check if the primary keys are unique for a given row"""
         return (
@@ -102,9 +283,15 @@ class BigQueryProcessor(DataProcessor):
         )
 
     def get_query_exclusive_primary_keys(
-        self, exclusive_to: str, limit: int = 500
+        self,
+        exclusive_to: str,
+        common_table_schema: Optional[TableSchema] = None,
+        limit: Optional[int] = 500,
     ) -> Select:
-        common_table_schema = self.get_common_schema_from_tables()
+        if common_table_schema is None:
+            common_table_schema = self.get_common_schema_from_tables()
+
+        query = None
 
         if exclusive_to == "table1":
             table1_columns_renamed = add_suffix_to_column_names(
@@ -113,14 +300,14 @@ class BigQueryProcessor(DataProcessor):
                 suffix="__1",
             )
 
-            return (
+            query = (
                 self.with_statement_query_sampled.select(
-                    column(self.primary_key, table="table1"), *table1_columns_renamed
+                    *[column(col, table="table1") for col in self.primary_key_columns],
+                    *table1_columns_renamed,
                 )
                 .from_("table1")
                 .join("table2", join_type="left", using=self.primary_key)
                 .where(f"table2.{self.primary_key} is null")
-                .limit(limit)
             )
 
         if exclusive_to == "table2":
@@ -130,124 +317,873 @@ class BigQueryProcessor(DataProcessor):
                 suffix="__2",
             )
 
-            return (
+            query = (
                 self.with_statement_query_sampled.select(
-                    column(self.primary_key, table="table2"), *table1_columns_renamed
+                    *[column(col, table="table2") for col in self.primary_key_columns],
+                    *table1_columns_renamed,
                 )
                 .from_("table2")
                 .join("table1", join_type="left", using=self.primary_key)
                 .where(f"table1.{self.primary_key} is null")
-                .limit(limit)
             )
 
+        if query is not None and limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @memoize_query
     def get_query_plain_diff_tables(
         self,
         common_table_schema: TableSchema,
     ) -> Select:
         """Create a SQL query to get the rows where the columns values are different"""
-        cast_fields_1 = common_table_schema.get_query_cast_schema_as_string(
-            prefix="", column_name_suffix="__1"
+        return self._get_query_plain_diff(common_table_schema=common_table_schema)
+
+    @memoize_query
+    def get_query_plain_diff_segments(
+        self,
+        common_table_schema: TableSchema,
+        modulus: int,
+        segments: List[int],
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, restricted to some segments"""
+        return self._get_query_plain_diff(
+            common_table_schema=common_table_schema,
+            key_filter=self.get_query_segment_filter(modulus, segments),
         )
-        cast_fields_2 = common_table_schema.get_query_cast_schema_as_string(
-            prefix="", column_name_suffix="__2"
+
+    @memoize_query
+    def get_query_plain_diff_fingerprints(
+        self,
+        common_table_schema: TableSchema,
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, only joining the rows fingerprints.
+
+        Full rows are joined for the mismatching primary keys only.
+        """
+        fingerprints = {
+            table_name: select(
+                self.primary_key,
+                alias(
+                    common_table_schema.get_row_fingerprint_expression(
+                        tolerance=self.tolerance
+                    ),
+                    "fingerprint",
+                    copy=False,
+                ),
+                copy=False,
+            ).from_(table_name, copy=False)
+            for table_name in ["table1", "table2"]
+        }
+
+        mismatched_keys = (
+            select(self.primary_key, copy=False)
+            .from_("fingerprints1", copy=False)
+            .join("fingerprints2", join_type="inner", using=self.primary_key, copy=False)
+            .where(
+                exp.NEQ(
+                    this=column("fingerprint", table="fingerprints1"),
+                    expression=column("fingerprint", table="fingerprints2"),
+                ),
+                copy=False,
+            )
         )
 
-        inner_merged = parse_one(
-            f"""
-            select
-                table1.{self.primary_key}
-                , {', '.join(
-                    [
-                        (
-                            f"table1.{col} as {col}__1"
-                            f", table2.{col} as {col}__2"
-                        )
-                        for col in common_table_schema.columns_names
-                    ]
-                )}
-            from table1
-            inner join table2
-                using ({self.primary_key})
-            """,
-            dialect=self.dialect,
+        base_query = (
+            self.with_statement_query_sampled.with_(
+                "fingerprints1", as_=fingerprints["table1"], copy=False
+            )
+            .with_("fingerprints2", as_=fingerprints["table2"], copy=False)
+            .with_("mismatched_keys", as_=mismatched_keys, copy=False)
         )
 
-        final_result = parse_one(
-            f"""
-            select *
-            from inner_merged
-            where {' or '.join([f'coalesce({cast_fields_1[index]}, "none") <> coalesce({cast_fields_2[index]}, "none")' for index in range(len(common_table_schema.columns_names))])}
-            """,
-            dialect=self.dialect,
+        return self._get_query_plain_diff(
+            common_table_schema=common_table_schema,
+            key_filter=column(self.primary_key).isin(
+                query=select(self.primary_key, copy=False).from_("mismatched_keys", copy=False),
+                copy=False,
+            ),
+            base_query=base_query,
         )
 
-        query = (
-            self.with_statement_query_sampled.with_(
-                "inner_merged", as_=inner_merged, dialect=self.dialect
+    @memoize_query
+    def get_query_plain_diff_partitions(
+        self,
+        common_table_schema: TableSchema,
+        partitioning: TimePartitioning,
+        partition_ids: List[str],
+    ) -> Select:
+        """Create a SQL query to get the rows where the columns values are different, restricted to some partitions"""
+        return self._get_query_plain_diff(
+            common_table_schema=common_table_schema,
+            base_query=self.get_with_statement_query_partitions(
+                partitioning, partition_ids
+            ),
+        )
+
+    def _get_query_plain_diff(
+        self,
+        common_table_schema: TableSchema,
+        key_filter: Optional[exp.Expression] = None,
+        base_query: Optional[Select] = None,
+    ) -> Select:
+        """Queries are built as expressions, without parsing SQL, since they grow with the number of columns.
+
+        `key_filter` is a condition on the primary key, applied to both tables before the wide join.
+        `base_query` is modified in place, it must be built for this query only.
+        """
+        columns_names = common_table_schema.columns_names
+        tables = [
+            select("*", copy=False)
+            .from_(table_name, copy=False)
+            .where(key_filter.copy(), copy=False)
+            .subquery(table_name, copy=False)
+            if key_filter is not None
+            else table_name
+            for table_name in ["table1", "table2"]
+        ]
+
+        inner_merged = select(
+            *self.get_primary_key_columns("table1"),
+            *[
+                alias(column(col, table=table_name), f"{col}{suffix}", copy=False)
+                for col in columns_names
+                for table_name, suffix in [("table1", "__1"), ("table2", "__2")]
+            ],
+            copy=False,
+        ).from_(tables[0], copy=False).join(
+            tables[1], join_type="inner", using=self.primary_key, copy=False
+        )
+
+        # Flag the differing columns with the same expressions used to filter the rows
+        def get_diff_flags() -> List[exp.Expression]:
+            return common_table_schema.get_diff_flag_expressions(
+                common_table_schema.get_comparable_expressions(
+                    column_name_suffix="__1", tolerance=self.tolerance
+                ),
+                common_table_schema.get_comparable_expressions(
+                    column_name_suffix="__2", tolerance=self.tolerance
+                ),
+                tolerance=self.tolerance,
+            )
+
+        diff_flags = get_diff_flags()
+        final_result = (
+            select(
+                "*",
+                *[
+                    alias(diff_flag, f"{col}__diff", copy=False)
+                    for diff_flag, col in zip(get_diff_flags(), columns_names)
+                ],
+                copy=False,
             )
-            .with_("final_result", as_=final_result)
-            .select("*")
-            .from_("final_result")
+            .from_("inner_merged", copy=False)
+            .where(
+                exp.or_(*diff_flags, copy=False) if diff_flags else exp.false(),
+                copy=False,
+            )
+        )
+
+        if base_query is None:
+            base_query = self.with_statement_query_sampled
+
+        query = (
+            base_query.with_("inner_merged", as_=inner_merged, copy=False)
+            .with_("final_result", as_=final_result, copy=False)
+            .select("*", copy=False)
+            .from_("final_result", copy=False)
         )
 
         return query
 
+    @memoize_query
     def query_ratio_common_values_per_column(
         self, common_table_schema: TableSchema
     ) -> Select:
-        """Create a SQL query to get the ratio of common values for each column"""
+        """Create a SQL query to get the ratio of common values for each column, one row per column"""
+        columns_names = common_table_schema.columns_names
+        values1 = common_table_schema.get_comparable_expressions(
+            table="table1", tolerance=self.tolerance
+        )
+        values2 = common_table_schema.get_comparable_expressions(
+            table="table2", tolerance=self.tolerance
+        )
+        # NULL values are neither counted as equal nor as not null
+        equal_flags = common_table_schema.get_equal_flag_expressions(
+            [value.copy() for value in values1],
+            [value.copy() for value in values2],
+            tolerance=self.tolerance,
+        )
+
+        counts = [
+            alias(
+                func("count", column(self.primary_key), copy=False),
+                "count_common",
+                copy=False,
+            )
+        ]
+        for col, value1, value2, equal_flag in zip(
+            columns_names, values1, values2, equal_flags
+        ):
+            counts += [
+                alias(
+                    func(
+                        "countif",
+                        is_not_null(func("coalesce", value1, value2, copy=False)),
+                        copy=False,
+                    ),
+                    f"{col}_count_not_null",
+                    copy=False,
+                ),
+                alias(func("countif", equal_flag, copy=False), col, copy=False),
+            ]
 
-        cast_fields_1 = common_table_schema.get_query_cast_schema_as_string(
-            prefix="table1."
+        count_diff = (
+            select(*counts, copy=False)
+            .from_("table1", copy=False)
+            .join("table2", join_type="inner", using=self.primary_key, copy=False)
         )
-        cast_fields_2 = common_table_schema.get_query_cast_schema_as_string(
-            prefix="table2."
+
+        # One row per column, unnesting the ratios so that the counts are computed once
+        ratios = [
+            to_struct(
+                [
+                    ("column_name", exp.Literal.string(col)),
+                    (
+                        "ratio_not_null",
+                        func(
+                            "safe_divide",
+                            column(f"{col}_count_not_null"),
+                            column("count_common"),
+                            copy=False,
+                        ),
+                    ),
+                    (
+                        "ratio_equal",
+                        func(
+                            "safe_divide", column(col), column(f"{col}_count_not_null"),
+                            copy=False,
+                        ),
+                    ),
+                ]
+            )
+            for col in columns_names
+        ]
+        final_result = (
+            select("ratios.*", copy=False)
+            .from_("count_diff", copy=False)
+            .join(unnest_structs(ratios, "ratios"), join_type="cross", copy=False)
         )
 
-        count_diff = parse_one(
-            f"""
-            select
-                count({self.primary_key}) as count_common
-                , {', '.join(
+        query = (
+            self.with_statement_query_sampled.with_(
+                "count_diff", as_=count_diff, copy=False
+            )
+            .with_("final_result", as_=final_result, copy=False)
+            .select("*", copy=False)
+            .from_("final_result", copy=False)
+        )
+
+        return query
+
+    def get_query_checksums(
+        self,
+        common_table_schema: TableSchema,
+        key: exp.Expression,
+        key_name: str,
+        table_name: str,
+        condition: Optional[exp.Expression] = None,
+    ) -> Select:
+        """Create a SQL query to get the row count and checksum of the rows of a table for each key value"""
+        query = (
+            select(
+                alias(key, key_name, copy=False),
+                alias(func("count", exp.Star(), copy=False), "row_count", copy=False),
+                alias(
+                    func(
+                        "bit_xor",
+                        common_table_schema.get_row_fingerprint_expression(
+                            tolerance=self.tolerance
+                        ),
+                        copy=False,
+                    ),
+                    "checksum",
+                    copy=False,
+                ),
+                copy=False,
+            )
+            .from_(table_name, copy=False)
+            .group_by(key_name, copy=False)
+        )
+        if condition:
+            query = query.where(condition, dialect=self.dialect, copy=False)
+        return query
+
+    @memoize_query
+    def get_query_segment_checksums(
+        self,
+        common_table_schema: TableSchema,
+        modulus: int,
+        parent_modulus: int,
+        parent_segments: List[int],
+    ) -> Select:
+        """Create a SQL query to get the segments of the primary key space whose checksums are different"""
+        checksums = {
+            table_name: self.get_query_checksums(
+                common_table_schema,
+                key=self.get_query_segment(modulus),
+                key_name="segment",
+                table_name=table_name,
+                condition=(
+                    self.get_query_segment_filter(parent_modulus, parent_segments)
+                    if parent_modulus > 1
+                    else None
+                ),
+            )
+            for table_name in ["table1", "table2"]
+        }
+
+        query = (
+            self.with_statement_query_sampled.with_(
+                "checksums1", as_=checksums["table1"], copy=False
+            )
+            .with_("checksums2", as_=checksums["table2"], copy=False)
+            .select(
+                "segment",
+                alias(column("row_count", table="checksums1"), "row_count_table1"),
+                alias(column("row_count", table="checksums2"), "row_count_table2"),
+                copy=False,
+            )
+            .from_("checksums1", copy=False)
+            .join("checksums2", join_type="full outer", using="segment", copy=False)
+            .where(
+                "checksums1.checksum is distinct from checksums2.checksum"
+                " or checksums1.row_count is distinct from checksums2.row_count",
+                dialect=self.dialect,
+                copy=False,
+            )
+            .order_by("segment", copy=False)
+        )
+
+        return query
+
+    @memoize_query
+    def get_query_partition_checksums(
+        self,
+        common_table_schema: TableSchema,
+        partitioning: TimePartitioning,
+        partition_ids: Optional[List[str]] = None,
+    ) -> Select:
+        """Create a SQL query to get the row count and checksum of each partition of both tables, all partitions when `partition_ids` is None"""
+        checksums = {
+            table_name: self.get_query_checksums(
+                common_table_schema,
+                key=parse_one(
+                    partitioning.get_query_partition_id(), dialect=self.dialect
+                ),
+                key_name="partition_id",
+                table_name=table_name,
+            )
+            for table_name in ["table1", "table2"]
+        }
+
+        query = (
+            self.get_with_statement_query_partitions(partitioning, partition_ids)
+            .with_("checksums1", as_=checksums["table1"], copy=False)
+            .with_("checksums2", as_=checksums["table2"], copy=False)
+            .select(
+                "partition_id",
+                "checksums1.row_count as row_count_table1",
+                "checksums2.row_count as row_count_table2",
+                "checksums1.checksum as checksum_table1",
+                "checksums2.checksum as checksum_table2",
+                dialect=self.dialect,
+                copy=False,
+            )
+            .from_("checksums1", copy=False)
+            .join("checksums2", using="partition_id", join_type="full outer", copy=False)
+            .order_by("partition_id", copy=False)
+        )
+
+        return query
+
+    def get_query_array_agg_sample(
+        self, expression: exp.Expression, limit: int
+    ) -> exp.Expression:
+        """Returns an expression aggregating up to `limit` non null values of an expression in an array"""
+        return fill_template(
+            f"array_agg(:value ignore nulls limit {limit})",
+            self.dialect,
+            value=expression,
+        )
+
+    def get_query_approx_quantiles(
+        self, expression: exp.Expression, number: int
+    ) -> exp.Expression:
+        """Returns an expression computing the approximate quantiles boundaries of an expression, as an array of strings"""
+        return fill_template(
+            f"array(select cast(quantile as string) from unnest(approx_quantiles(:value, {number}))"
+            " as quantile with offset as position order by position)",
+            self.dialect,
+            value=expression,
+        )
+
+    def get_query_approx_top_values(
+        self, expression: exp.Expression, number: int
+    ) -> exp.Expression:
+        """Returns an expression computing the approximate most frequent non null values of an expression, as an array of strings"""
+        return fill_template(
+            f"array(select cast(top.value as string) from unnest(approx_top_count(:value, {number}))"
+            " as top where top.value is not null)",
+            self.dialect,
+            value=expression,
+        )
+
+    @memoize_query
+    def get_query_column_profile(
+        self,
+        table_name: str,
+        common_table_schema: TableSchema,
+        number_quantiles: int = 4,
+        number_top_values: int = 5,
+    ) -> Select:
+        """Create a SQL query profiling the columns of a table with sketches, one row per column.
+
+        The table is scanned once, without joining it to the other table.
+        """
+        columns = [
+            column
+            for column in common_table_schema.columns
+            if column.mode == BigQueryDataMode.REPEATED
+            or column.field_type
+            not in (BigQueryDataType.RECORD, BigQueryDataType.STRUCT)
+        ]
+        cast_fields = TableSchema(
+            table_name=table_name, columns=columns
+        ).get_cast_schema_as_string_expressions()
+
+        aggregates = [alias(func("count", exp.Star(), copy=False), "count_rows", copy=False)]
+        for schema_column, cast_field in zip(columns, cast_fields):
+            col = schema_column.name
+            aggregates += [
+                alias(
+                    func("approx_count_distinct", cast_field, copy=False),
+                    f"{col}__count_distinct",
+                    copy=False,
+                ),
+                alias(
+                    func("countif", is_null(column(col)), copy=False),
+                    f"{col}__count_null",
+                    copy=False,
+                ),
+                alias(
+                    self.get_query_approx_top_values(
+                        cast_field.copy(), number_top_values
+                    ),
+                    f"{col}__top_values",
+                    copy=False,
+                ),
+            ]
+            if (
+                schema_column.field_type in ORDERABLE_DATA_TYPES
+                and schema_column.mode != BigQueryDataMode.REPEATED
+            ):
+                aggregates += [
+                    alias(
+                        exp.cast(
+                            func("min", column(col), copy=False),
+                            exp.DataType.Type.TEXT,
+                            copy=False,
+                        ),
+                        f"{col}__min_value",
+                        copy=False,
+                    ),
+                    alias(
+                        exp.cast(
+                            func("max", column(col), copy=False),
+                            exp.DataType.Type.TEXT,
+                            copy=False,
+                        ),
+                        f"{col}__max_value",
+                        copy=False,
+                    ),
+                    alias(
+                        self.get_query_approx_quantiles(column(col), number_quantiles),
+                        f"{col}__quantiles",
+                        copy=False,
+                    ),
+                ]
+            else:
+                aggregates += [
+                    alias(
+                        exp.cast(exp.null(), exp.DataType.Type.TEXT),
+                        f"{col}__min_value",
+                        copy=False,
+                    ),
+                    alias(
+                        exp.cast(exp.null(), exp.DataType.Type.TEXT),
+                        f"{col}__max_value",
+                        copy=False,
+                    ),
+                    alias(
+                        exp.cast(exp.null(), "array<string>", dialect=self.dialect),
+                        f"{col}__quantiles",
+                        copy=False,
+                    ),
+                ]
+
+        profile_counts = select(*aggregates, copy=False).from_(table_name, copy=False)
+
+        profiles = [
+            to_struct(
+                [
+                    ("column_name", exp.Literal.string(schema_column.name)),
+                    ("count_rows", column("count_rows")),
+                    ("count_distinct", column(f"{schema_column.name}__count_distinct")),
+                    (
+                        "ratio_null",
+                        func(
+                            "safe_divide",
+                            column(f"{schema_column.name}__count_null"),
+                            column("count_rows"),
+                            copy=False,
+                        ),
+                    ),
+                    ("min_value", column(f"{schema_column.name}__min_value")),
+                    ("max_value", column(f"{schema_column.name}__max_value")),
+                    ("quantiles", column(f"{schema_column.name}__quantiles")),
+                    ("top_values", column(f"{schema_column.name}__top_values")),
+                ]
+            )
+            for schema_column in columns
+        ]
+        final_result = (
+            select("profiles.*", copy=False)
+            .from_("profile_counts", copy=False)
+            .join(unnest_structs(profiles, "profiles"), join_type="cross", copy=False)
+        )
+
+        query = (
+            self.with_statement_query_sampled.with_(
+                "profile_counts", as_=profile_counts, copy=False
+            )
+            .with_("final_result", as_=final_result, copy=False)
+            .select("*", copy=False)
+            .from_("final_result", copy=False)
+        )
+
+        return query
+
+    @memoize_query
+    def get_query_health_check(
+        self,
+        common_table_schema: TableSchema,
+        sample_size: int = 10,
+    ) -> Select:
+        """Create a SQL query checking primary keys uniqueness, comparing primary keys and computing the ratio of common values for each column, in a single scan.
+
+        The columns are a single chunk of the compared columns, so that the query does not grow with wider schemas.
+        """
+        columns_names = common_table_schema.columns_names
+        values1 = common_table_schema.get_comparable_expressions(
+            column_name_suffix="__1", tolerance=self.tolerance
+        )
+        values2 = common_table_schema.get_comparable_expressions(
+            column_name_suffix="__2", tolerance=self.tolerance
+        )
+        equal_flags = common_table_schema.get_equal_flag_expressions(
+            [value.copy() for value in values1],
+            [value.copy() for value in values2],
+            tolerance=self.tolerance,
+        )
+
+        # Composite keys are joined on their fingerprint, their value is kept for the samples of duplicated keys
+        key_values = (
+            [
+                alias(
+                    func("any_value", self.get_query_primary_key_value(), copy=False),
+                    PRIMARY_KEY_VALUE,
+                    copy=False,
+                )
+            ]
+            if self.has_composite_primary_key
+            else []
+        )
+
+        # One row per primary key, so that duplicated keys do not multiply rows in the join
+        keys = {
+            table_name: select(
+                self.primary_key,
+                *key_values,
+                alias(func("count", exp.Star(), copy=False), "row_count", copy=False),
+                *[
+                    alias(func("any_value", column(col), copy=False), col, copy=False)
+                    for col in columns_names
+                ],
+                dialect=self.dialect,
+                copy=False,
+            )
+            .from_(table_name, copy=False)
+            .group_by(self.primary_key, copy=False)
+            for table_name in ["table1", "table2"]
+        }
+
+        joined = (
+            select(
+                self.primary_key,
+                *(
                     [
-                        (
-                            f"countif(coalesce({cast_fields_1[index]}, {cast_fields_2[index]}) is not null) AS {common_table_schema.columns_names[index]}_count_not_null"
-                            f", countif(coalesce({cast_fields_1[index]}, 'none') = coalesce({cast_fields_2[index]}, 'non')) AS {common_table_schema.columns_names[index]}"
+                        alias(
+                            func(
+                                "coalesce",
+                                column(PRIMARY_KEY_VALUE, table="keys1"),
+                                column(PRIMARY_KEY_VALUE, table="keys2"),
+                                copy=False,
+                            ),
+                            PRIMARY_KEY_VALUE,
+                            copy=False,
                         )
-                        for index in range(len(cast_fields_1))
                     ]
-                )}
-            from table1
-            inner join table2
-                using ({self.primary_key})""",
-            dialect=self.dialect,
+                    if self.has_composite_primary_key
+                    else []
+                ),
+                alias(column("row_count", table="keys1"), "row_count_table1", copy=False),
+                alias(column("row_count", table="keys2"), "row_count_table2", copy=False),
+                *[
+                    alias(column(col, table=table_name), f"{col}{suffix}", copy=False)
+                    for col in columns_names
+                    for table_name, suffix in [("keys1", "__1"), ("keys2", "__2")]
+                ],
+                dialect=self.dialect,
+                copy=False,
+            )
+            .from_("keys1", copy=False)
+            .join("keys2", join_type="full outer", using=self.primary_key, copy=False)
         )
 
-        final_result = parse_one(
-            f"""
-            select
-            {', '.join(
+        def is_common() -> List[exp.Expression]:
+            return [
+                is_not_null(column("row_count_table1")),
+                is_not_null(column("row_count_table2")),
+            ]
+
+        def get_duplicated_keys_sample(row_count: str) -> exp.Expression:
+            return self.get_query_array_agg_sample(
+                func(
+                    "if",
+                    exp.GT(this=column(row_count), expression=exp.convert(1)),
+                    column(PRIMARY_KEY_VALUE)
+                    if self.has_composite_primary_key
+                    else exp.cast(column(self.primary_key), exp.DataType.Type.TEXT),
+                    exp.null(),
+                    copy=False,
+                ),
+                sample_size,
+            )
+
+        def count_rows(condition: exp.Expression) -> exp.Expression:
+            # Counts over no rows are NULL on some engines, e.g. DuckDB, for empty tables
+            return func(
+                "coalesce",
+                func("countif", condition, copy=False),
+                exp.convert(0),
+                copy=False,
+            )
+
+        count_checks = select(
+            alias(
+                count_rows(
+                    exp.GT(this=column("row_count_table1"), expression=exp.convert(1))
+                ),
+                "duplicated_keys_table1",
+                copy=False,
+            ),
+            alias(
+                get_duplicated_keys_sample("row_count_table1"),
+                "duplicated_keys_sample_table1",
+                copy=False,
+            ),
+            alias(
+                count_rows(
+                    exp.GT(this=column("row_count_table2"), expression=exp.convert(1))
+                ),
+                "duplicated_keys_table2",
+                copy=False,
+            ),
+            alias(
+                get_duplicated_keys_sample("row_count_table2"),
+                "duplicated_keys_sample_table2",
+                copy=False,
+            ),
+            alias(func("count", exp.Star(), copy=False), "total_rows", copy=False),
+            alias(
+                count_rows(is_null(column("row_count_table1"))),
+                "missing_primary_key_in_table1",
+                copy=False,
+            ),
+            alias(
+                count_rows(is_null(column("row_count_table2"))),
+                "missing_primary_key_in_table2",
+                copy=False,
+            ),
+            alias(
+                func("countif", exp.and_(*is_common(), copy=False), copy=False),
+                "count_common",
+                copy=False,
+            ),
+            *[
+                expression
+                for schema_column, value1, value2, equal_flag in zip(
+                    common_table_schema.columns, values1, values2, equal_flags
+                )
+                for expression in [
+                    alias(
+                        func(
+                            "countif",
+                            exp.and_(
+                                *is_common(),
+                                is_not_null(
+                                    func("coalesce", value1, value2, copy=False)
+                                ),
+                                copy=False,
+                            ),
+                            copy=False,
+                        ),
+                        f"{schema_column.name}__count_not_null",
+                        copy=False,
+                    ),
+                    alias(
+                        func(
+                            "countif",
+                            exp.and_(*is_common(), equal_flag, copy=False),
+                            copy=False,
+                        ),
+                        f"{schema_column.name}__count_equal",
+                        copy=False,
+                    ),
+                ]
+            ],
+            dialect=self.dialect,
+            copy=False,
+        ).from_("joined", copy=False)
+
+        final_result = select(
+            "duplicated_keys_table1",
+            "duplicated_keys_sample_table1",
+            "duplicated_keys_table2",
+            "duplicated_keys_sample_table2",
+            "total_rows",
+            "missing_primary_key_in_table1",
+            "missing_primary_key_in_table2",
+            alias(
+                func(
+                    "safe_divide",
+                    exp.Add(
+                        this=column("missing_primary_key_in_table2"),
+                        expression=column("missing_primary_key_in_table1"),
+                    ),
+                    column("total_rows"),
+                    copy=False,
+                ),
+                "missing_primary_keys_ratio",
+                copy=False,
+            ),
+            copy=False,
+        ).from_("count_checks", copy=False)
+        if columns_names:
+            column_ratios = to_struct(
                 [
                     (
-                        f"struct("
-                            f"safe_divide({col}_count_not_null, count_common) as ratio_not_null"
-                            f", safe_divide({col}, {col}_count_not_null) as ratio_equal"
-                        f") AS {col}"
+                        col,
+                        to_struct(
+                            [
+                                (
+                                    "ratio_not_null",
+                                    func(
+                                        "safe_divide",
+                                        column(f"{col}__count_not_null"),
+                                        column("count_common"),
+                                        copy=False,
+                                    ),
+                                ),
+                                (
+                                    "ratio_equal",
+                                    func(
+                                        "safe_divide",
+                                        column(f"{col}__count_equal"),
+                                        column(f"{col}__count_not_null"),
+                                        copy=False,
+                                    ),
+                                ),
+                            ]
+                        ),
                     )
-                    for col in common_table_schema.columns_names
-                ])
-            }
-            from count_diff""",
-            dialect=self.dialect,
-        )
+                    for col in columns_names
+                ]
+            )
+            final_result = final_result.select(
+                alias(column_ratios, "column_ratios", copy=False), copy=False
+            )
 
         query = (
-            self.with_statement_query_sampled.with_(
-                "count_diff", as_=count_diff, dialect=self.dialect
-            )
-            .with_("final_result", as_=final_result)
-            .select("*")
-            .from_("final_result")
+            self.with_statement_query_sampled.with_("keys1", as_=keys["table1"], copy=False)
+            .with_("keys2", as_=keys["table2"], copy=False)
+            .with_("joined", as_=joined, copy=False)
+            .with_("count_checks", as_=count_checks, copy=False)
+            .with_("final_result", as_=final_result, copy=False)
+            .select("*", copy=False)
+            .from_("final_result", copy=False)
         )
 
         return query
+
+    def get_query_page(
+        self,
+        table: str,
+        page_size: int,
+        sort_column: Optional[str] = None,
+        ascending: bool = True,
+        cursor: Optional[Tuple[Any, Any]] = None,
+        offset: int = 0,
+    ) -> Select:
+        """Create a SQL query reading one page of a table, sorted by a column then by primary key.
+
+        Rows after the cursor are read using the sort, rows with a null sort value come last.
+        """
+        direction = "asc" if ascending else "desc"
+        comparison = ">" if ascending else "<"
+        if sort_column == self.primary_key:
+            sort_column = None
+
+        order_by = [f"{self.primary_key} {direction}"]
+        if sort_column is not None:
+            order_by = [
+                f"{sort_column} is null",
+                f"{sort_column} {direction}",
+            ] + order_by
+
+        query = (
+            select("*")
+            .from_(exp.to_table(table, dialect=self.dialect))
+            .order_by(*order_by, dialect=self.dialect)
+            .limit(page_size)
+        )
+
+        if cursor is None:
+            return query.offset(offset) if offset else query
+
+        sort_value, key_value = cursor
+        key_condition = f"{self.primary_key} {comparison} {to_sql_literal(key_value).sql(dialect=self.dialect)}"
+        if sort_column is None:
+            condition_after_cursor = key_condition
+        elif sort_value is None or pd.isna(sort_value):
+            condition_after_cursor = f"{sort_column} is null and {key_condition}"
+        else:
+            sort_literal = to_sql_literal(sort_value).sql(dialect=self.dialect)
+            condition_after_cursor = (
+                f"{sort_column} {comparison} {sort_literal}"
+                f" or ({sort_column} = {sort_literal} and {key_condition})"
+                f" or {sort_column} is null"
+            )
+
+        return query.where(condition_after_cursor, dialect=self.dialect)
@@ -0,0 +1,70 @@
+from typing import Optional
+
+from sqlglot import exp
+
+from data_check.data_processor import DEFAULT_MAX_WORKERS
+from data_check.processors.bigquery import BigQueryProcessor
+from data_check.processors.utils import fill_template
+from data_check.query.query_duckdb import QueryDuckDB
+
+
+class DuckDBProcessor(BigQueryProcessor):
+    """Build the same queries as BigQueryProcessor, run them locally with DuckDB.
+
+    Queries are generated with the BigQuery dialect and transpiled to DuckDB by the client.
+    Inputs can be table / view names, SQL queries or paths to Parquet / CSV files.
+    """
+
+    def __init__(
+        self,
+        query1: str,
+        query2: str,
+        client: Optional[QueryDuckDB] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
+        client = client if client is not None else QueryDuckDB()
+        super().__init__(
+            self.register_input(client, query1),
+            self.register_input(client, query2),
+            client=client,
+            max_workers=max_workers,
+        )
+
+    @staticmethod
+    def register_input(client: QueryDuckDB, value: str) -> str:
+        """Replace paths to local files by the name of a view reading them"""
+        value = value.strip().strip("\r\n")
+        if client.is_file(value):
+            return client.register_file(value)
+        return value
+
+    def get_query_array_agg_sample(
+        self, expression: exp.Expression, limit: int
+    ) -> exp.Expression:
+        """DuckDB does not support `ignore nulls` and `limit` in array_agg"""
+        return fill_template(
+            f"list_slice(list_distinct(array_agg(:value)), 1, {limit})",
+            self.dialect,
+            value=expression,
+        )
+
+    def get_query_approx_quantiles(
+        self, expression: exp.Expression, number: int
+    ) -> exp.Expression:
+        """DuckDB approximate quantiles do not support strings, exact quantiles are cheap locally"""
+        fractions = ", ".join(str(index / number) for index in range(number + 1))
+        return fill_template(
+            f"cast(quantile_disc(:value, [{fractions}]) as array<string>)",
+            self.dialect,
+            value=expression,
+        )
+
+    def get_query_approx_top_values(
+        self, expression: exp.Expression, number: int
+    ) -> exp.Expression:
+        """DuckDB approx_top_k returns the values without their counts, ignoring nulls"""
+        return fill_template(
+            f"cast(approx_top_k(:value, {number}) as array<string>)",
+            self.dialect,
+            value=expression,
+        )
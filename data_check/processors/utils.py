@@ -1,6 +1,8 @@
-from typing import List
+from functools import lru_cache
+from typing import Any, List, Tuple
 
-from sqlglot import alias, column
+import pandas as pd
+from sqlglot import alias, column, exp, parse_one
 from sqlglot.expressions import Alias
 
 
@@ -11,3 +13,58 @@ def add_suffix_to_column_names(
     return [
         alias(column(col, table=table_name), f"{col}{suffix}") for col in column_names
     ]
+
+
+def to_sql_literal(value: Any) -> exp.Expression:
+    """Convert a value read from a DataFrame to a SQL literal"""
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return exp.null()
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    elif hasattr(value, "item"):
+        # numpy scalars
+        value = value.item()
+    return exp.convert(value)
+
+
+def is_null(expression: exp.Expression) -> exp.Is:
+    """Build `expression is null`, without copying the expression"""
+    return exp.Is(this=expression, expression=exp.null())
+
+
+def is_not_null(expression: exp.Expression) -> exp.Not:
+    """Build `not expression is null`, without copying the expression"""
+    return exp.not_(is_null(expression), copy=False)
+
+
+def to_struct(fields: List[Tuple[str, exp.Expression]]) -> exp.Struct:
+    """Build `struct(value as name, ...)` from (name, value) pairs"""
+    return exp.Struct(
+        expressions=[
+            exp.PropertyEQ(this=exp.to_identifier(name), expression=value)
+            for name, value in fields
+        ]
+    )
+
+
+def unnest_structs(structs: List[exp.Expression], name: str) -> exp.Unnest:
+    """Build `unnest([struct(...), ...]) as name`, one row per struct"""
+    return exp.Unnest(
+        expressions=[exp.Array(expressions=structs)],
+        alias=exp.TableAlias(columns=[exp.to_identifier(name)]),
+        # The fields of the structs are the columns, as parsed from BigQuery SQL
+        explode_array=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def parse_template(sql: str, dialect: str) -> exp.Expression:
+    return parse_one(sql, dialect=dialect)
+
+
+def fill_template(sql: str, dialect: str, **values: Any) -> exp.Expression:
+    """Parse a SQL template once, then replace its `:name` placeholders by expressions or literals"""
+    expression = parse_template(sql, dialect).copy()
+    for placeholder in list(expression.find_all(exp.Placeholder)):
+        placeholder.replace(exp.convert(values[placeholder.name], copy=False))
+    return expression
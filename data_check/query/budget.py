@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
+
+
+class BudgetExceededError(Exception):
+    """Raised when a query would scan more bytes than allowed"""
+
+
+def format_bytes(value: float) -> str:
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if abs(value) < 1024 or unit == "TB":
+            return f"{value:.1f} {unit}"
+        value /= 1024
+
+
+@dataclass
+class BytesBudget:
+    """Maximum bytes scanned by a single query and by all the queries of a diff"""
+
+    max_bytes_per_query: Optional[int] = None
+    max_bytes_per_diff: Optional[int] = None
+    # Estimated bytes of the queries allowed so far
+    bytes_spent: int = 0
+
+    def __post_init__(self):
+        self._lock = Lock()
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.max_bytes_per_query is not None or self.max_bytes_per_diff is not None
+
+    def check(self, estimated_bytes: int, total_estimated_bytes: int = None) -> None:
+        """Raise if a query, or a set of queries, would exceed the budget"""
+        if total_estimated_bytes is None:
+            total_estimated_bytes = estimated_bytes
+
+        if (
+            self.max_bytes_per_query is not None
+            and estimated_bytes > self.max_bytes_per_query
+        ):
+            raise BudgetExceededError(
+                f"Query would scan {format_bytes(estimated_bytes)}, above the {format_bytes(self.max_bytes_per_query)} limit per query"
+            )
+
+        if (
+            self.max_bytes_per_diff is not None
+            and self.bytes_spent + total_estimated_bytes > self.max_bytes_per_diff
+        ):
+            raise BudgetExceededError(
+                f"Diff would scan {format_bytes(self.bytes_spent + total_estimated_bytes)}, above the {format_bytes(self.max_bytes_per_diff)} limit per diff"
+            )
+
+    def spend(self, estimated_bytes: int) -> None:
+        """Check a query against the budget, and record its bytes if allowed"""
+        with self._lock:
+            self.check(estimated_bytes)
+            self.bytes_spent += estimated_bytes
+
+    def reset(self) -> None:
+        with self._lock:
+            self.bytes_spent = 0
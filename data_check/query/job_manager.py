@@ -0,0 +1,279 @@
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass
+from threading import Condition, Thread
+from typing import Callable, Deque, Hashable, List, Optional
+
+from google.api_core import exceptions
+from google.cloud import bigquery
+from google.cloud.bigquery.job import QueryJob
+
+# Reasons of the BigQuery errors worth running the job again for
+TRANSIENT_ERROR_REASONS = {
+    "backendError",
+    "internalError",
+    "jobBackendError",
+    "jobInternalError",
+    "rateLimitExceeded",
+}
+
+TRANSIENT_ERROR_TYPES = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    ConnectionError,
+)
+
+# HTTP status of the reasons of BigQuery job errors, to raise the same exceptions as the API
+ERROR_REASON_STATUS_CODES = {
+    "accessDenied": 403,
+    "backendError": 500,
+    "badRequest": 400,
+    "blocked": 403,
+    "duplicate": 409,
+    "internalError": 500,
+    "invalid": 400,
+    "invalidQuery": 400,
+    "jobBackendError": 500,
+    "jobInternalError": 500,
+    "notFound": 404,
+    "notImplemented": 501,
+    "quotaExceeded": 403,
+    "rateLimitExceeded": 403,
+    "resourceInUse": 400,
+    "resourcesExceeded": 400,
+    "responseTooLarge": 403,
+    "tableUnavailable": 400,
+}
+
+
+def get_job_error(error_result: dict, errors: Optional[list]) -> exceptions.GoogleAPICallError:
+    """Returns the exception of a failed job, from its error result"""
+    return exceptions.from_http_status(
+        ERROR_REASON_STATUS_CODES.get(error_result.get("reason"), 500),
+        error_result.get("message", "BigQuery job failed"),
+        errors=errors or [error_result],
+    )
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Returns True for errors of the API or of a job which may not happen again"""
+    if isinstance(error, TRANSIENT_ERROR_TYPES):
+        return True
+    if isinstance(error, exceptions.GoogleAPICallError):
+        return any(
+            item.get("reason") in TRANSIENT_ERROR_REASONS for item in error.errors or []
+        )
+    return False
+
+
+@dataclass
+class ManagedJob:
+    """A query submitted to the manager, possibly started several times when it fails with transient errors"""
+
+    sql: str
+    job_config: Optional[bigquery.QueryJobConfig]
+    future: Future
+    deadline: Optional[float]
+    # Who the job runs for, (session id, processor configuration) for the app
+    scope: Optional[Hashable] = None
+    attempts: int = 0
+    query_job: Optional[QueryJob] = None
+    start_at: float = 0
+    is_cancelled: bool = False
+
+
+@dataclass
+class CancelledJob:
+    """A job cancelled before it finished, its slot time was spent for nothing"""
+
+    job_id: str
+    scope: Optional[Hashable]
+    reason: str
+    slot_millis: int
+
+
+class BigQueryJobManager:
+    """Run BigQuery query jobs from a single poller thread, instead of a thread waiting for each job.
+
+    Jobs are started without waiting for them, their futures resolve to the finished QueryJob.
+    Jobs are cancelled past their deadline, and started again with exponential backoff when they fail with transient errors.
+    """
+
+    def __init__(
+        self,
+        client: bigquery.Client,
+        poll_interval_seconds: float = 0.5,
+        max_attempts: int = 3,
+        backoff_seconds: float = 1,
+        max_backoff_seconds: float = 32,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.clock = clock
+        self._jobs: List[ManagedJob] = []
+        self.cancelled_jobs: Deque[CancelledJob] = deque(maxlen=1000)
+        self._condition = Condition()
+        self._thread: Optional[Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def count_jobs(self, is_in_scope: Callable[[Optional[Hashable]], bool]) -> int:
+        """Count the running jobs whose scope matches, e.g. the jobs of a session"""
+        with self._condition:
+            return sum(
+                1 for job in self._jobs if not job.future.done() and is_in_scope(job.scope)
+            )
+
+    def submit(
+        self,
+        sql: str,
+        job_config: Optional[bigquery.QueryJobConfig] = None,
+        timeout_seconds: Optional[float] = None,
+        deadline: Optional[float] = None,
+        scope: Optional[Hashable] = None,
+    ) -> "Future[QueryJob]":
+        """Start a query job, the job is cancelled after `timeout_seconds` or at the `deadline` of the clock"""
+        if timeout_seconds is not None:
+            job_deadline = self.clock() + timeout_seconds
+            deadline = job_deadline if deadline is None else min(deadline, job_deadline)
+
+        job = ManagedJob(
+            sql=sql, job_config=job_config, future=Future(), deadline=deadline, scope=scope
+        )
+        self.start(job)
+        with self._condition:
+            self._jobs.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self.run, name="bigquery-job-manager", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job.future
+
+    def get_backoff_seconds(self, attempts: int) -> float:
+        return min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+
+    def retry_or_fail(self, job: ManagedJob, error: BaseException) -> None:
+        if is_transient_error(error) and job.attempts < self.max_attempts:
+            job.query_job = None
+            job.start_at = self.clock() + self.get_backoff_seconds(job.attempts)
+        else:
+            self.set_exception(job, error)
+
+    def start(self, job: ManagedJob) -> None:
+        job.attempts += 1
+        try:
+            job.query_job = self.client.query(job.sql, job_config=job.job_config)
+        except Exception as error:
+            self.retry_or_fail(job, error)
+
+    def cancel(self, job: ManagedJob, reason: str) -> None:
+        with self._condition:
+            if job.is_cancelled or job.query_job is None:
+                return
+            job.is_cancelled = True
+        query_job = job.query_job
+        try:
+            # The job returned by the API has the statistics at the time it is cancelled
+            query_job = self.client.cancel_job(query_job.job_id, location=query_job.location) or query_job
+        except Exception:
+            # The job finished in the meantime, or the API is unavailable: cancelling is best effort
+            pass
+        self.cancelled_jobs.append(
+            CancelledJob(
+                job_id=job.query_job.job_id,
+                scope=job.scope,
+                reason=reason,
+                slot_millis=getattr(query_job, "slot_millis", None) or 0,
+            )
+        )
+
+    def cancel_jobs(self, is_superseded: Callable[[Optional[Hashable]], bool]) -> None:
+        """Cancel the running jobs whose scope is superseded, their results will not be used"""
+        with self._condition:
+            jobs = [job for job in self._jobs if is_superseded(job.scope)]
+        for job in jobs:
+            if job.future.cancel():
+                self.cancel(job, reason="superseded")
+
+    def get_cancelled_jobs(self, is_in_scope: Callable[[Optional[Hashable]], bool]) -> List[CancelledJob]:
+        return [job for job in list(self.cancelled_jobs) if is_in_scope(job.scope)]
+
+    @staticmethod
+    def set_result(job: ManagedJob, query_job: QueryJob) -> None:
+        try:
+            job.future.set_result(query_job)
+        except InvalidStateError:
+            # Cancelled by the caller in the meantime
+            pass
+
+    @staticmethod
+    def set_exception(job: ManagedJob, error: BaseException) -> None:
+        try:
+            job.future.set_exception(error)
+        except InvalidStateError:
+            pass
+
+    def poll_job(self, job: ManagedJob) -> None:
+        if job.future.cancelled():
+            self.cancel(job, reason="cancelled")
+            return
+
+        if job.deadline is not None and self.clock() >= job.deadline:
+            self.cancel(job, reason="timeout")
+            self.set_exception(
+                job, TimeoutError("BigQuery query took too long to execute, job cancelled.")
+            )
+            return
+
+        if job.query_job is None:
+            if self.clock() >= job.start_at:
+                self.start(job)
+            return
+
+        try:
+            if not job.query_job.done():
+                return
+        except Exception as error:
+            if not is_transient_error(error):
+                self.set_exception(job, error)
+            # Otherwise the job is checked again at the next poll
+            return
+
+        if job.query_job.error_result:
+            self.retry_or_fail(
+                job,
+                get_job_error(job.query_job.error_result, job.query_job.errors),
+            )
+        else:
+            self.set_result(job, job.query_job)
+
+    def poll(self) -> None:
+        """Check all the running jobs once, and resolve the futures of the finished ones"""
+        with self._condition:
+            jobs = list(self._jobs)
+        for job in jobs:
+            try:
+                self.poll_job(job)
+            except Exception as error:
+                # Fail this job only, the poller thread keeps running for the others
+                self.set_exception(job, error)
+        with self._condition:
+            self._jobs = [job for job in self._jobs if not job.future.done()]
+
+    def run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+            self.poll()
+            with self._condition:
+                self._condition.wait(timeout=self.poll_interval_seconds)
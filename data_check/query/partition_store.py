@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict
+
+
+class PartitionChecksumStore:
+    """Checksums of the partitions of past diffs, stored in a local JSON file.
+
+    Each diff configuration maps partition ids to the last modification of the partition in both tables, their row counts and checksums.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.lock = Lock()
+
+    @staticmethod
+    def get_key(**config) -> str:
+        """Hash of a diff configuration: tables, primary key, compared columns, ..."""
+        payload = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def get(self, key: str) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return self.load().get(key, {})
+
+    def set(self, key: str, partitions: Dict[str, Dict[str, Any]]) -> None:
+        with self.lock:
+            data = self.load()
+            data[key] = partitions
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+            with open(temp_path, "w") as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.path)
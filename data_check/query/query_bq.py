@@ -1,86 +1,292 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from os import getenv
-from threading import Thread
+from typing import Hashable, Iterator, List, Optional
 
 import pandas as pd
-import streamlit as st
+import pyarrow as pa
 from google.cloud import bigquery
 from google.cloud.bigquery.job import QueryJob
 from google.oauth2 import service_account
+from sqlglot import alias, column, exp, select
 from sqlglot.expressions import Select
 
+from data_check.cache import TTLCache, get_query_sql
+from data_check.models.partition import TimePartitioning
 from data_check.models.table import TableSchema
+from data_check.query.budget import BytesBudget
+from data_check.query.job_manager import BigQueryJobManager, CancelledJob
 from data_check.query_client import QueryClient
+from data_check.tools import then
 
 USE_STREAMLIT_SECRET = getenv("USE_STREAMLIT_SECRET", False)
 TIMEOUT_BIGQUERY = 900 # 15 * 60 = 15 minutes
 
+# Schemas are shared by all clients of the process, so that Streamlit reruns do not fetch them again
+SCHEMA_CACHE_TTL = int(getenv("SCHEMA_CACHE_TTL", 600)) # 10 minutes
+SCHEMA_CACHE = TTLCache(max_size=256, ttl_seconds=SCHEMA_CACHE_TTL)
+
+# Bytes scanned limits, queries are dry run and refused above them (no limit by default)
+MAX_BYTES_PER_QUERY = getenv("MAX_BYTES_PER_QUERY")
+MAX_BYTES_PER_DIFF = getenv("MAX_BYTES_PER_DIFF")
+
+# Deadline of all the queries of a diff in seconds, from the start of the diff (no limit by default)
+DIFF_TIMEOUT = getenv("DIFF_TIMEOUT")
+
+# Threads downloading the results of finished jobs, the jobs themselves are polled by a single thread
+DOWNLOAD_WORKERS = int(getenv("DOWNLOAD_WORKERS", 8))
+
+
+def get_diff_budget() -> BytesBudget:
+    """Budget of the bytes scanned by the queries of a diff, from the environment"""
+    return BytesBudget(
+        max_bytes_per_query=int(MAX_BYTES_PER_QUERY) if MAX_BYTES_PER_QUERY else None,
+        max_bytes_per_diff=int(MAX_BYTES_PER_DIFF) if MAX_BYTES_PER_DIFF else None,
+    )
+
+
+# Clients are shared by all QueryBigQuery instances of the process, so that Streamlit reruns do not create them again
+@lru_cache(maxsize=None)
+def get_streamlit_secret_credentials() -> service_account.Credentials:
+    # Imported here so that the client can be used without Streamlit
+    import streamlit as st
+
+    # Create API client from Streamlit Secret
+    return service_account.Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"]
+    )
+
+
+@lru_cache(maxsize=None)
+def get_bigquery_client(use_streamlit_secret: bool) -> bigquery.Client:
+    if not use_streamlit_secret:
+        return bigquery.Client()
+    return bigquery.Client(credentials=get_streamlit_secret_credentials())
+
+
+@lru_cache(maxsize=None)
+def get_job_manager(client: bigquery.Client) -> BigQueryJobManager:
+    return BigQueryJobManager(client)
+
+
+@lru_cache(maxsize=None)
+def get_download_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="bigquery-download")
+
+
+@lru_cache(maxsize=None)
+def get_bqstorage_client(use_streamlit_secret: bool):
+    try:
+        from google.cloud import bigquery_storage
+    except ImportError:
+        return None
+    # Same credentials as the BigQuery client, the default credentials without Streamlit secret
+    if not use_streamlit_secret:
+        return bigquery_storage.BigQueryReadClient()
+    return bigquery_storage.BigQueryReadClient(credentials=get_streamlit_secret_credentials())
+
+
 class QueryBigQuery(QueryClient):
-    def __init__(self):
+    runs_queries_asynchronously = True
+
+    def __init__(
+        self,
+        schema_cache: Optional[TTLCache] = None,
+        budget: Optional[BytesBudget] = None,
+        job_manager: Optional[BigQueryJobManager] = None,
+        diff_timeout_seconds: Optional[float] = None,
+        diff_started_at: Optional[float] = None,
+    ):
         self.client = self.init_client()
+        self.job_manager = job_manager if job_manager is not None else get_job_manager(self.client)
+        if diff_timeout_seconds is None and DIFF_TIMEOUT:
+            diff_timeout_seconds = float(DIFF_TIMEOUT)
+        # The clock time the diff started at, shared by the clients of all the Streamlit reruns of the diff
+        if diff_started_at is None:
+            diff_started_at = self.job_manager.clock()
+        self.diff_deadline = (
+            diff_started_at + diff_timeout_seconds
+            if diff_timeout_seconds is not None
+            else None
+        )
+        # Jobs are tagged with the session and the processor configuration they run for, see set_job_scope
+        self.job_scope: Optional[Hashable] = None
         self.dialect = "bigquery"
+        self.schema_cache = schema_cache if schema_cache is not None else SCHEMA_CACHE
+        self.budget = budget if budget is not None else get_diff_budget()
 
-    @st.cache_resource
-    def get_credentials(_self):
-        # Create API client from Streamlit Secret
-        credentials = service_account.Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"]
-        )
-        return credentials
+    def get_credentials(self):
+        return get_streamlit_secret_credentials()
+
+    def init_client(self) -> bigquery.Client:
+        return get_bigquery_client(bool(USE_STREAMLIT_SECRET))
 
-    @st.cache_resource
-    def init_client(_self) -> bigquery.Client:
-        if not USE_STREAMLIT_SECRET:
-            return bigquery.Client()
-        credentials = _self.get_credentials()
-        return bigquery.Client(credentials=credentials)
+    def init_bqstorage_client(self):
+        """BigQuery Storage Read API client, None when google-cloud-bigquery-storage is not installed"""
+        return get_bqstorage_client(bool(USE_STREAMLIT_SECRET))
 
     def get_table(self, table: str) -> bigquery.Table:
         return self.client.get_table(table)
 
-    def run_query_job_with_timeout(self, query: str, timeout_seconds,):
-        # Container for the result
-        result = [None]
+    def get_table_last_modified(self, table: str) -> Optional[str]:
+        """Get the last modification of a table, None for views as it does not reflect changes of the tables they read"""
+        table_bq = self.get_table(table)
+        if table_bq.table_type != "TABLE" or table_bq.modified is None:
+            return None
+        return table_bq.modified.isoformat()
 
-        query_job = self.client.query(query)
+    def get_table_time_partitioning(self, table: str) -> Optional[TimePartitioning]:
+        """Get the time partitioning of a table, None if it is not partitioned or partitioned by ingestion time"""
+        table_bq = self.get_table(table)
+        time_partitioning = table_bq.time_partitioning
+        if time_partitioning is None or time_partitioning.field is None:
+            return None
+        field_type = next(
+            field.field_type
+            for field in table_bq.schema
+            if field.name == time_partitioning.field
+        )
+        return TimePartitioning(
+            column=time_partitioning.field,
+            partition_type=time_partitioning.type_,
+            field_type=field_type,
+        )
+
+    def get_table_partitions(self, table: str) -> Optional[pd.DataFrame]:
+        """Get the last modification of each partition of a table, from INFORMATION_SCHEMA.PARTITIONS"""
+        table_bq = self.get_table(table)
+        partitions = exp.Table(
+            this=exp.to_identifier("PARTITIONS"),
+            db=exp.to_identifier("INFORMATION_SCHEMA"),
+            catalog=exp.Dot(
+                this=exp.to_identifier(table_bq.project, quoted=True),
+                expression=exp.to_identifier(table_bq.dataset_id),
+            ),
+        )
+        query = (
+            select(
+                "partition_id",
+                alias(
+                    exp.cast(column("last_modified_time"), exp.DataType.Type.TEXT),
+                    "last_modified_time",
+                    copy=False,
+                ),
+                copy=False,
+            )
+            .from_(partitions, copy=False)
+            .where(
+                column("table_name").eq(exp.Literal.string(table_bq.table_id)),
+                copy=False,
+            )
+        )
+        # Like the diff queries, it is counted in the budget and tagged with the job scope
+        return self.run_query_to_dataframe(query)
 
-        thread = Thread(target=self.get_query_job_result, args=(query_job, result))
-        thread.start()
-        thread.join(timeout=timeout_seconds)
+    def submit_query_job(self, query: str, timeout_seconds: int = TIMEOUT_BIGQUERY) -> "Future[QueryJob]":
+        """Start a query job, cancelled after the timeout or at the deadline of the diff"""
+        return self.job_manager.submit(
+            query,
+            timeout_seconds=timeout_seconds,
+            deadline=self.diff_deadline,
+            scope=self.job_scope,
+        )
+
+    def run_query_job_with_timeout(self, query: str, timeout_seconds: int = TIMEOUT_BIGQUERY):
+        [query_job] = self.wait_for_queries([self.submit_query_job(query, timeout_seconds=timeout_seconds)])
+        return query_job.result()
+
+    def set_job_scope(self, session_id: str, config_key: Hashable) -> None:
+        """Tag the next jobs with the session and the processor configuration.
+
+        The running jobs of the session for another configuration are cancelled, their results cannot be displayed anymore.
+        """
+        self.job_scope = (session_id, config_key)
+        self.job_manager.cancel_jobs(
+            lambda scope: scope is not None and scope[0] == session_id and scope[1] != config_key
+        )
 
-        if thread.is_alive():
-            self.client.cancel_job(job_id=query_job.job_id)
-            raise TimeoutError("BigQuery query took too long to execute, job cancelled.")
+    def count_running_jobs(self, session_id: str) -> int:
+        """Count the running jobs of the session, the job manager is shared by all the sessions"""
+        return self.job_manager.count_jobs(
+            lambda scope: scope is not None and scope[0] == session_id
+        )
 
-        return result[0]
+    def get_cancelled_jobs(self, session_id: str) -> List[CancelledJob]:
+        """Get the jobs of the session cancelled before they finished"""
+        return self.job_manager.get_cancelled_jobs(
+            lambda scope: scope is not None and scope[0] == session_id
+        )
 
     def _run_query_to_dataframe(_self, query: str, timeout_seconds: int = TIMEOUT_BIGQUERY) -> pd.DataFrame:
         return _self.run_query_job_with_timeout(query, timeout_seconds=timeout_seconds).to_dataframe()
 
+    def check_budget(self, query: Select) -> None:
+        """Refuse the query before it runs if it would exceed the budget"""
+        if self.budget.is_enabled:
+            self.budget.spend(self.estimate_query_bytes(query))
+
     def run_query_to_dataframe(self, query: Select, timeout_seconds: int = TIMEOUT_BIGQUERY) -> pd.DataFrame:
-        return self._run_query_to_dataframe(query.sql(dialect=self.dialect), timeout_seconds=timeout_seconds)
+        self.check_budget(query)
+        return self._run_query_to_dataframe(get_query_sql(query, self.dialect), timeout_seconds=timeout_seconds)
+
+    def submit_query(self, query: Select, timeout_seconds: int = TIMEOUT_BIGQUERY) -> "Future[pd.DataFrame]":
+        """Start a query without waiting for it, its result is downloaded once the job is finished"""
+        self.check_budget(query)
+        return then(
+            self.submit_query_job(get_query_sql(query, self.dialect), timeout_seconds=timeout_seconds),
+            lambda query_job: query_job.to_dataframe(),
+            get_download_executor(),
+        )
+
+    def run_query_to_arrow_batches(self, query: Select, timeout_seconds: int = TIMEOUT_BIGQUERY) -> Iterator[pa.RecordBatch]:
+        """Run a query and stream its result as Arrow record batches, using the Storage Read API when available"""
+        self.check_budget(query)
+        rows = self.run_query_job_with_timeout(get_query_sql(query, self.dialect), timeout_seconds=timeout_seconds)
+        return rows.to_arrow_iterable(bqstorage_client=self.init_bqstorage_client())
 
-    @staticmethod
-    def get_query_job_result(query_job: QueryJob, result):
-        result[0] = query_job.result()
-        return result
+    def _estimate_query_bytes(_self, query: str) -> int:
+        """Dry run a query, which is free, to get the number of bytes it would scan"""
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        query_job = _self.client.query(query, job_config=job_config)
+        return query_job.total_bytes_processed or 0
+
+    def estimate_query_bytes(self, query: Select) -> int:
+        """Get the number of bytes a query would scan"""
+        return self._estimate_query_bytes(get_query_sql(query, self.dialect))
+
+    def materialize_query(self, query: Select, timeout_seconds: int = TIMEOUT_BIGQUERY) -> str:
+        """Run a query and return its destination table, BigQuery keeps anonymous results tables for 24 hours"""
+        self.check_budget(query)
+        [query_job] = self.wait_for_queries(
+            [self.submit_query_job(get_query_sql(query, self.dialect), timeout_seconds=timeout_seconds)]
+        )
+        destination = query_job.destination
+        return f"{destination.project}.{destination.dataset_id}.{destination.table_id}"
 
     def run_query_job(_self, query: str) -> bigquery.QueryJob:
         query_job = _self.client.query(query)
         return query_job.result()
 
-    def get_table_schema_from_table(_self, table: str) -> TableSchema:
+    def _get_table_schema_from_table(_self, table: str) -> TableSchema:
         """Get the schema of a table"""
         table_bq = _self.client.get_table(table)
         return TableSchema.from_bq_table(table=table_bq)
 
+    def get_table_schema_from_table(self, table: str) -> TableSchema:
+        """Get the schema of a table, cached by table id"""
+        return self.schema_cache.get_or_set(
+            ("table", table), lambda: self._get_table_schema_from_table(table)
+        )
+
     def _get_table_schema_from_sql(_self, query: str) -> TableSchema:
-        """Get the schema of a table from a query"""
-        query_job = _self.run_query_job(query)
+        """Get the schema of a table from a query, using a dry run which is free and does not execute the query"""
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        query_job = _self.client.query(query, job_config=job_config)
         return TableSchema.from_bq_query_job(query_job)
 
     def get_table_schema_from_sql(self, query: Select) -> TableSchema:
-        """Get the schema of a table from a query"""
-        query_with_limit = query.limit(50)
-        return self._get_table_schema_from_sql(
-            query_with_limit.sql(dialect=self.dialect)
+        """Get the schema of a table from a query, cached by normalized SQL"""
+        sql = get_query_sql(query, self.dialect)
+        return self.schema_cache.get_or_set(
+            ("sql", sql), lambda: self._get_table_schema_from_sql(sql)
         )
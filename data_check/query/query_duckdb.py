@@ -0,0 +1,131 @@
+import hashlib
+import re
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, Optional
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from sqlglot.expressions import Select
+
+from data_check.cache import get_query_sql
+from data_check.models.table import TableSchema
+from data_check.query_client import QueryClient
+
+# BigQuery functions used by the processors which have no DuckDB equivalent
+MACROS = [
+    # DuckDB hash is an unsigned 64-bit integer, shift it to fit in a BIGINT
+    "create or replace macro farm_fingerprint(x) as (hash(x)::hugeint - 9223372036854775808)::bigint",
+]
+
+DEFAULT_BATCH_SIZE = 100_000
+
+FILE_READERS = {
+    ".parquet": "read_parquet",
+    ".csv": "read_csv_auto",
+}
+
+
+class QueryDuckDB(QueryClient):
+    """Run queries in an in-process DuckDB engine, over local files or registered DataFrames"""
+
+    def __init__(self, database: str = ":memory:"):
+        self.database = database
+        self.client = self.init_client()
+        self.dialect = "duckdb"
+        self.registered_files: Dict[str, str] = {}
+        # A DuckDB connection cannot be used by several threads at the same time,
+        # DuckDB already parallelizes each query
+        self.lock = Lock()
+
+    def get_credentials(self):
+        # Local engine, no credentials needed
+        return None
+
+    def init_client(self) -> duckdb.DuckDBPyConnection:
+        connection = duckdb.connect(self.database)
+        for macro in MACROS:
+            connection.execute(macro)
+        return connection
+
+    def register_dataframe(self, name: str, data: pd.DataFrame) -> str:
+        """Expose a DataFrame as a table, without copying it"""
+        with self.lock:
+            self.client.register(name, data)
+        return name
+
+    def register_file(self, path: str, name: Optional[str] = None) -> str:
+        """Expose a Parquet or CSV file as a view, returns the view name"""
+        path = str(path)
+        if path in self.registered_files:
+            return self.registered_files[path]
+
+        file_path = Path(path)
+        reader = FILE_READERS.get(file_path.suffix.lower())
+        if reader is None:
+            raise ValueError(
+                f"Unsupported file format {file_path.suffix}, expected one of {list(FILE_READERS)}"
+            )
+
+        if name is None:
+            name = re.sub(r"\W", "_", file_path.stem)
+            while name in self.registered_files.values():
+                name = f"{name}_"
+
+        escaped_path = path.replace("'", "''")
+        with self.lock:
+            self.client.execute(
+                f"create or replace view {name} as select * from {reader}('{escaped_path}')"
+            )
+        self.registered_files[path] = name
+        return name
+
+    def is_file(self, value: str) -> bool:
+        """Check if the input is a path to a supported local file"""
+        return Path(value).suffix.lower() in FILE_READERS and Path(value).is_file()
+
+    def get_table(self, table: str) -> duckdb.DuckDBPyRelation:
+        return self.client.table(table)
+
+    def run_query_to_dataframe(self, query: Select) -> pd.DataFrame:
+        with self.lock:
+            return self.client.execute(get_query_sql(query, self.dialect)).df()
+
+    def materialize_query(self, query: Select) -> str:
+        """Store the result of a query in a temporary table and return its name"""
+        sql = get_query_sql(query, self.dialect)
+        name = f"materialized_{hashlib.sha1(sql.encode()).hexdigest()[:16]}"
+        with self.lock:
+            self.client.execute(f"create temp table if not exists {name} as {sql}")
+        return name
+
+    def run_query_to_arrow_batches(
+        self, query: Select, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[pa.RecordBatch]:
+        """Run a query and stream its result as Arrow record batches.
+
+        The connection is locked until the batches are consumed.
+        """
+        with self.lock:
+            result = self.client.execute(get_query_sql(query, self.dialect))
+            # fetch_record_batch is deprecated since DuckDB 1.4
+            if hasattr(result, "to_arrow_reader"):
+                yield from result.to_arrow_reader(batch_size)
+            else:
+                yield from result.fetch_record_batch(batch_size)
+
+    def get_table_schema_from_table(self, table: str) -> TableSchema:
+        """Get the schema from an existing table or view"""
+        with self.lock:
+            return TableSchema.from_duckdb_relation(
+                self.get_table(table), table_name=table
+            )
+
+    def get_table_schema_from_sql(self, query: Select) -> TableSchema:
+        """Get the schema of a table from a query, the query is not executed"""
+        with self.lock:
+            relation = self.client.sql(get_query_sql(query, self.dialect))
+            return TableSchema.from_duckdb_relation(
+                relation, table_name="query_result"
+            )
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import Future
+from os import getenv
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from sqlglot import exp
+from sqlglot.expressions import Select
+
+from data_check.cache import TTLCache, get_query_sql
+from data_check.models.partition import TimePartitioning
+from data_check.models.table import TableSchema
+from data_check.query_client import QueryClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE_BYTES = 1024**3  # 1 GB
+
+# Last modifications of tables are shared by all clients of the process, so that each query does not fetch them again.
+# A result can be served from the cache for this long after one of its tables changed.
+LAST_MODIFIED_CACHE_TTL = int(getenv("LAST_MODIFIED_CACHE_TTL", 30))
+LAST_MODIFIED_CACHE = TTLCache(max_size=1024, ttl_seconds=LAST_MODIFIED_CACHE_TTL)
+
+# Functions whose result changes between runs of the same query
+NON_DETERMINISTIC_EXPRESSIONS = (
+    exp.CurrentDate,
+    exp.CurrentDatetime,
+    exp.CurrentTime,
+    exp.CurrentTimestamp,
+    exp.CurrentUser,
+    exp.Rand,
+    exp.Randn,
+    exp.Uuid,
+    # Blocks sampled by TABLESAMPLE SYSTEM differ between runs
+    exp.TableSample,
+)
+NON_DETERMINISTIC_FUNCTIONS = {"NOW", "SESSION_USER", "GEN_RANDOM_UUID"}
+
+
+def get_referenced_tables(query: Select) -> List[str]:
+    """Returns the tables read by a query, excluding CTEs"""
+    cte_names = {cte.alias for cte in query.find_all(exp.CTE)}
+    tables = {
+        ".".join(part.name for part in table.parts)
+        for table in query.find_all(exp.Table)
+        if table.name and (table.db or table.name not in cte_names)
+    }
+    return sorted(tables)
+
+
+def is_deterministic(query: Select) -> bool:
+    """Returns False when running the query twice over the same tables may return different results"""
+    for node in query.find_all(exp.Anonymous, *NON_DETERMINISTIC_EXPRESSIONS):
+        if not isinstance(node, exp.Anonymous) or node.name.upper() in NON_DETERMINISTIC_FUNCTIONS:
+            return False
+    return True
+
+
+class ResultCache:
+    """Query results stored on disk as Parquet files, evicted by least recent use above `max_size_bytes`.
+
+    Files are written atomically, so the directory can be shared by several processes or replicas.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+
+    @staticmethod
+    def get_key(sql: str, tables_last_modified: Dict[str, str]) -> str:
+        """Hash of the SQL and of the last modification of each table it reads"""
+        payload = json.dumps(
+            {"sql": sql, "tables": tables_last_modified}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / f"{key}.parquet"
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.get_path(key)
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            logger.warning(f"Could not read cached result {path}: {error}")
+            return None
+
+        # Mark the entry as recently used, modification time drives the eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return df
+
+    def set(self, key: str, df: pd.DataFrame) -> None:
+        path = self.get_path(key)
+        temp_path = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            df.to_parquet(temp_path, index=False)
+            os.replace(temp_path, path)
+        except Exception as error:
+            # Some types cannot be stored as Parquet, the result is just not cached
+            logger.warning(f"Could not cache result {path}: {error}")
+            temp_path.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until the cache fits in `max_size_bytes`"""
+        entries = []
+        for path in self.directory.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.parquet"):
+            path.unlink(missing_ok=True)
+
+
+class CachedQueryClient(QueryClient):
+    """Wrap a client to serve query results from a ResultCache while the tables they read are unchanged.
+
+    Queries reading tables without a known last modification (views, files, ...) or calling
+    non-deterministic functions (current_date, rand, ...) are not cached.
+    """
+
+    def __init__(
+        self,
+        client: QueryClient,
+        cache: ResultCache,
+        last_modified_cache: Optional[TTLCache] = None,
+    ):
+        self.wrapped_client = client
+        self.cache = cache
+        self.last_modified_cache = (
+            last_modified_cache if last_modified_cache is not None else LAST_MODIFIED_CACHE
+        )
+
+    def __getattr__(self, name: str):
+        # Expose the wrapped client attributes (dialect, budget, ...)
+        if name == "wrapped_client":
+            raise AttributeError(name)
+        return getattr(self.wrapped_client, name)
+
+    @property
+    def runs_queries_asynchronously(self) -> bool:
+        return self.wrapped_client.runs_queries_asynchronously
+
+    @property
+    def on_wait(self) -> Optional[Callable[[], None]]:
+        return self.wrapped_client.on_wait
+
+    def get_credentials(self):
+        return self.wrapped_client.get_credentials()
+
+    def wait_for_queries(self, futures: List[Future]) -> List:
+        return self.wrapped_client.wait_for_queries(futures)
+
+    def init_client(self):
+        return self.wrapped_client.init_client()
+
+    def get_table(self, table: str):
+        return self.wrapped_client.get_table(table)
+
+    def get_table_last_modified(self, table: str) -> Optional[str]:
+        """Last modification of a table, memoized for a short time since it is fetched for every query"""
+        return self.last_modified_cache.get_or_set(
+            (self.wrapped_client.dialect, table),
+            lambda: self.wrapped_client.get_table_last_modified(table),
+        )
+
+    def get_table_schema_from_table(self, table: str) -> TableSchema:
+        return self.wrapped_client.get_table_schema_from_table(table)
+
+    def get_table_schema_from_sql(self, query: Select) -> TableSchema:
+        return self.wrapped_client.get_table_schema_from_sql(query)
+
+    def get_table_time_partitioning(self, table: str) -> Optional[TimePartitioning]:
+        return self.wrapped_client.get_table_time_partitioning(table)
+
+    def get_table_partitions(self, table: str) -> Optional[pd.DataFrame]:
+        return self.wrapped_client.get_table_partitions(table)
+
+    def estimate_query_bytes(self, query: Select) -> Optional[int]:
+        return self.wrapped_client.estimate_query_bytes(query)
+
+    def materialize_query(self, query: Select) -> str:
+        return self.wrapped_client.materialize_query(query)
+
+    def run_query_to_arrow_batches(self, query: Select) -> Iterator[pa.RecordBatch]:
+        # Streamed results are meant to be larger than what is worth caching
+        return self.wrapped_client.run_query_to_arrow_batches(query)
+
+    def get_cache_key(self, query: Select) -> Optional[str]:
+        """Returns None when the query is not deterministic or the freshness of a table it reads is unknown"""
+        if not is_deterministic(query):
+            return None
+
+        tables_last_modified = {}
+        for table in get_referenced_tables(query):
+            last_modified = self.get_table_last_modified(table)
+            if last_modified is None:
+                return None
+            tables_last_modified[table] = last_modified
+
+        return self.cache.get_key(
+            get_query_sql(query, self.wrapped_client.dialect), tables_last_modified
+        )
+
+    def run_query_to_dataframe(self, query: Select) -> pd.DataFrame:
+        key = self.get_cache_key(query)
+        if key is None:
+            return self.wrapped_client.run_query_to_dataframe(query)
+
+        df = self.cache.get(key)
+        if df is not None:
+            return df
+
+        df = self.wrapped_client.run_query_to_dataframe(query)
+        self.cache.set(key, df)
+        return df
+
+    def submit_query(self, query: Select) -> "Future[pd.DataFrame]":
+        key = self.get_cache_key(query)
+        if key is None:
+            return self.wrapped_client.submit_query(query)
+
+        df = self.cache.get(key)
+        if df is not None:
+            future = Future()
+            future.set_result(df)
+            return future
+
+        def cache_result(done: Future) -> None:
+            if not done.cancelled() and done.exception() is None:
+                self.cache.set(key, done.result())
+
+        future = self.wrapped_client.submit_query(query)
+        future.add_done_callback(cache_result)
+        return future
@@ -1,12 +1,22 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Callable, Iterator, List, Optional
 
 import pandas as pd
+import pyarrow as pa
 from sqlglot.expressions import Select
 
+from .models.partition import TimePartitioning
 from .models.table import TableSchema
+from .tools import wait_for_results, wait_for_submitted_results
 
 
 class QueryClient(ABC):
+    # True when submit_query returns before the query is finished, instead of running it at once
+    runs_queries_asynchronously = False
+    # Called regularly while waiting for queries, raising interrupts the wait and cancels the queries
+    on_wait: Optional[Callable[[], None]] = None
+
     ###### ABSTRACT METHODS ######
     @abstractmethod
     def get_credentials(self):
@@ -33,3 +43,55 @@ class QueryClient(ABC):
     def get_table_schema_from_sql(self, query: Select) -> TableSchema:
         """Get the schema of a table from a query"""
         pass
+
+    @abstractmethod
+    def materialize_query(self, query: Select) -> str:
+        """Store the result of a query in a table and return the table name"""
+        pass
+
+    ###### METHODS ######
+    def run_query_to_arrow_batches(self, query: Select) -> Iterator[pa.RecordBatch]:
+        """Run a query and return its result as Arrow record batches.
+
+        The result is fetched at once, clients able to stream results override it.
+        """
+        df = self.run_query_to_dataframe(query)
+        yield from pa.Table.from_pandas(df, preserve_index=False).to_batches()
+
+    def submit_query(self, query: Select) -> "Future[pd.DataFrame]":
+        """Start a query and return the future of its result.
+
+        The query is run before returning, unless the client runs queries asynchronously.
+        """
+        future = Future()
+        try:
+            future.set_result(self.run_query_to_dataframe(query))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def wait_for_queries(self, futures: List[Future]) -> List:
+        """Wait for the results of submitted queries, in order"""
+        return wait_for_results(futures, on_wait=self.on_wait)
+
+    def run_queries(self, queries: List[Select], max_in_flight: int) -> List[pd.DataFrame]:
+        """Submit queries with at most `max_in_flight` running at a time, results are returned in the order of the queries"""
+        return wait_for_submitted_results(
+            self.submit_query, queries, max_in_flight=max_in_flight, on_wait=self.on_wait
+        )
+
+    def estimate_query_bytes(self, query: Select) -> Optional[int]:
+        """Get the number of bytes a query would scan, None if the engine cannot estimate it"""
+        return None
+
+    def get_table_last_modified(self, table: str) -> Optional[str]:
+        """Get the last modification of a table, None if unknown"""
+        return None
+
+    def get_table_time_partitioning(self, table: str) -> Optional[TimePartitioning]:
+        """Get the time partitioning of a table, None if it is not partitioned by a column"""
+        return None
+
+    def get_table_partitions(self, table: str) -> Optional[pd.DataFrame]:
+        """Get the partition_id and last_modified_time of each partition of a table, None if unknown"""
+        return None
@@ -1,9 +1,55 @@
+import time
+from functools import partial
+from os import getenv
+from typing import Any, Callable, List, Optional, Tuple
+
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
+from data_check.cache import StageResultStore, get_query_sql
 from data_check.data_formatter import (highlight_diff_dataset, style_gradient,
                                        style_percentage)
+from data_check.data_processor import DEFAULT_MAX_WORKERS
+from data_check.models.comparison import (TIMESTAMP_TRUNCATION_PARTS,
+                                          ComparisonTolerance)
+from data_check.models.diff_page import DiffPage
+from data_check.models.sampling import SamplingMethod
+from data_check.models.table import TableSchema
 from data_check.processors.bigquery import BigQueryProcessor
+from data_check.query.budget import BudgetExceededError, format_bytes
+from data_check.query.partition_store import PartitionChecksumStore
+from data_check.query.query_bq import QueryBigQuery, get_diff_budget
+from data_check.query.result_cache import CachedQueryClient, ResultCache
+
+# Maximum number of BigQuery queries run at the same time for a diff
+MAX_WORKERS = int(getenv("MAX_WORKERS", DEFAULT_MAX_WORKERS))
+
+# Directory where query results are cached, shared by sessions and replicas mounting it (disabled by default)
+RESULT_CACHE_DIR = getenv("RESULT_CACHE_DIR")
+RESULT_CACHE_MAX_SIZE = int(getenv("RESULT_CACHE_MAX_SIZE", 1024**3))  # 1 GB
+
+# File storing the checksums of the partitions of past diffs, so that only modified partitions are scanned again
+PARTITION_CHECKSUMS_PATH = getenv(
+    "PARTITION_CHECKSUMS_PATH", ".data_check/partition_checksums.json"
+)
+
+# Stages only depending on the input tables, kept when the primary key, columns or sampling change
+TABLES_STAGES = ("schemas", "time partitioning")
+
+# Session state of the diff configuration, a new diff starts when one of them changes
+DIFF_CONFIG_KEYS = (
+    "table1",
+    "table2",
+    "primary_key",
+    "columns_to_compare",
+    "sampling_rate",
+    "sampling_method",
+    "float_epsilon",
+    "timestamp_truncation",
+    "case_insensitive_strings",
+    "ignore_array_duplicates",
+)
 
 
 class DataDiff:
@@ -11,21 +57,88 @@ class DataDiff:
         self.df1: pd.DataFrame = None
         self.df2: pd.DataFrame = None
 
-        self.primary_key: str = None
+        self.primary_key: List[str] = None
         self.columns_to_compare: str = None
 
         self.processor: BigQueryProcessor = None
 
         st.set_page_config(layout="wide")
         st.title("data-check 🔍")
+        self.run_summary = st.sidebar.container()
+        self.waiting_status = st.sidebar.empty()
 
         self.init_from_query_params()
 
     @staticmethod
-    @st.cache_data(show_spinner=False)
-    def split_frame(input_df, rows) -> pd.DataFrame:
-        df = [input_df.loc[i : i + rows - 1, :] for i in range(0, len(input_df), rows)]
-        return df
+    def get_stage_results() -> StageResultStore:
+        return st.session_state.setdefault("stage_results", StageResultStore())
+
+    @classmethod
+    def run_stage(
+        cls,
+        processor: BigQueryProcessor,
+        stage: str,
+        run: Callable[..., Any],
+        **params,
+    ) -> Any:
+        """Run a stage of the diff with the parameters, once per processor configuration.
+
+        UI interactions rerun the script, they read the stored outputs instead of querying the tables again.
+        """
+        config_key = (
+            processor.inputs
+            if stage in TABLES_STAGES
+            else processor.get_query_cache_key()
+        )
+        return cls.get_stage_results().get_or_run(
+            stage, config_key, lambda: run(**params), **params
+        )
+
+    @classmethod
+    def materialize_diff(cls, processor: BigQueryProcessor, query) -> Tuple[str, int]:
+        """Store the diff query result in a table once, and count its rows"""
+
+        def materialize(sql: str) -> Tuple[str, int]:
+            table = processor.materialize_query(query)
+            return table, processor.count_rows(table)
+
+        return cls.run_stage(
+            processor,
+            "materialized diff",
+            materialize,
+            sql=get_query_sql(query, processor.dialect),
+        )
+
+    @classmethod
+    def get_diff_page(
+        cls,
+        processor: BigQueryProcessor,
+        table: str,
+        page_number: int,
+        page_size: int,
+        sort_column: Optional[str],
+        ascending: bool,
+    ) -> DiffPage:
+        """Read a page of the materialized diff, seeking from the cursor of the previous page when it is known"""
+        page_cursors = st.session_state.setdefault("page_cursors", {})
+        cursors = page_cursors.setdefault(
+            (table, page_size, sort_column, ascending), {}
+        )
+        cursor = cursors.get(page_number - 1)
+        page = cls.run_stage(
+            processor,
+            "diff page",
+            processor.get_page,
+            table=table,
+            page_size=page_size,
+            sort_column=sort_column,
+            ascending=ascending,
+            cursor=cursor,
+            offset=0 if cursor is not None else (page_number - 1) * page_size,
+        )
+        if page.next_cursor is not None:
+            cursors[page_number] = page.next_cursor
+        return page
 
     def set_session_state_from_query_params(
         self, key: str, default_value: str, cast_as: str = None
@@ -35,6 +148,8 @@ class DataDiff:
             print(f"Setting {key} to {value_to_set}")
             if cast_as == "int":
                 st.session_state[key] = int(value_to_set)
+            elif cast_as == "float":
+                st.session_state[key] = float(value_to_set)
             elif cast_as == "list":
                 st.session_state[key] = value_to_set.split(",") if value_to_set else []
             elif cast_as == "bool":
@@ -60,7 +175,16 @@ class DataDiff:
         """,
         )
         self.set_session_state_from_query_params("sampling_rate", "100", cast_as="int")
-        self.set_session_state_from_query_params("primary_key", "user_id")
+        self.set_session_state_from_query_params("sampling_method", SamplingMethod.HASH.value)
+        self.set_session_state_from_query_params("primary_key", "user_id", cast_as="list")
+        self.set_session_state_from_query_params("float_epsilon", "0", cast_as="float")
+        self.set_session_state_from_query_params("timestamp_truncation", None)
+        self.set_session_state_from_query_params(
+            "case_insensitive_strings", "False", cast_as="bool"
+        )
+        self.set_session_state_from_query_params(
+            "ignore_array_duplicates", "False", cast_as="bool"
+        )
 
         self.set_session_state_from_query_params(
             "columns_to_compare", None, cast_as="list"
@@ -85,11 +209,72 @@ class DataDiff:
         st.session_state.columns_to_compare = None
 
         st.session_state.loaded_tables = False
+        st.session_state.cost_confirmed = False
+        self.get_stage_results().invalidate()
+
+    def show_waiting_queries(self, client: QueryBigQuery, session_id: str) -> None:
+        """Show the running jobs while waiting for them.
+
+        Streamlit only stops a script for a rerun or the end of the session at a Streamlit command,
+        the wait is then interrupted and the jobs whose results cannot be displayed anymore are cancelled.
+        """
+        self.waiting_status.caption(
+            f"Waiting for BigQuery, {client.count_running_jobs(session_id)} jobs running ⏳"
+        )
+
+    def show_run_summary(self, client: QueryBigQuery) -> None:
+        """Show the jobs of the session cancelled before they finished, and the slot time they used"""
+        cancelled_jobs = client.get_cancelled_jobs(get_script_run_ctx().session_id)
+        if not cancelled_jobs:
+            return
+        reasons = pd.Series([job.reason for job in cancelled_jobs]).value_counts()
+        slot_seconds = sum(job.slot_millis for job in cancelled_jobs) / 1000
+        self.run_summary.write("**Run summary**")
+        self.run_summary.caption(
+            f"{len(cancelled_jobs)} BigQuery jobs cancelled before they finished "
+            f"({', '.join(f'{count} {reason}' for reason, count in reasons.items())}), "
+            f"{slot_seconds:,.1f} slot seconds wasted"
+        )
+
+    @staticmethod
+    def get_diff_state() -> dict:
+        """State of the diff configured in the session, kept by all the reruns until the configuration changes.
+
+        The bytes budget and the deadline of the diff are shared by the clients of all its reruns.
+        """
+        diff_key = tuple(
+            tuple(value) if isinstance(value, list) else value
+            for value in (st.session_state.get(key) for key in DIFF_CONFIG_KEYS)
+        )
+        diff_state = st.session_state.get("diff_state")
+        if diff_state is None or diff_state["key"] != diff_key:
+            # Same clock as the job manager, the deadline of the diff is not pushed back by reruns
+            diff_state = st.session_state.diff_state = {
+                "key": diff_key,
+                "started_at": time.monotonic(),
+                "budget": get_diff_budget(),
+            }
+        return diff_state
 
     def get_processor(self) -> BigQueryProcessor:
+        diff_state = self.get_diff_state()
+        client = QueryBigQuery(
+            budget=diff_state["budget"], diff_started_at=diff_state["started_at"]
+        )
+        # The session is read from the script thread, queries may be waited for from other threads
+        session_id = get_script_run_ctx().session_id
+        client.on_wait = lambda: self.show_waiting_queries(client, session_id)
+        if RESULT_CACHE_DIR:
+            client = CachedQueryClient(
+                client,
+                ResultCache(RESULT_CACHE_DIR, max_size_bytes=RESULT_CACHE_MAX_SIZE),
+            )
+
         return BigQueryProcessor(
             query1=st.session_state.table1,
             query2=st.session_state.table2,
+            client=client,
+            max_workers=MAX_WORKERS,
         )
 
     def first_step(self):
@@ -113,6 +298,15 @@ class DataDiff:
         st.session_state.is_select_all = st.session_state.temp_is_select_all
         st.session_state.primary_key = st.session_state.temp_primary_key
         st.session_state.sampling_rate = st.session_state.temp_sampling_rate
+        st.session_state.sampling_method = st.session_state.temp_sampling_method
+        st.session_state.float_epsilon = st.session_state.temp_float_epsilon
+        st.session_state.timestamp_truncation = st.session_state.temp_timestamp_truncation
+        st.session_state.case_insensitive_strings = (
+            st.session_state.temp_case_insensitive_strings
+        )
+        st.session_state.ignore_array_duplicates = (
+            st.session_state.temp_ignore_array_duplicates
+        )
 
         if st.session_state.is_select_all:
             st.session_state.columns_to_compare = (
@@ -124,39 +318,57 @@ class DataDiff:
             )
 
         st.query_params["sampling_rate"] = st.session_state.sampling_rate
-        st.query_params["primary_key"] = st.session_state.primary_key
+        st.query_params["sampling_method"] = st.session_state.sampling_method
+        st.query_params["float_epsilon"] = st.session_state.float_epsilon
+        if st.session_state.timestamp_truncation:
+            st.query_params["timestamp_truncation"] = st.session_state.timestamp_truncation
+        else:
+            st.query_params.pop("timestamp_truncation", None)
+        st.query_params["case_insensitive_strings"] = st.session_state.case_insensitive_strings
+        st.query_params["ignore_array_duplicates"] = st.session_state.ignore_array_duplicates
+        st.query_params["primary_key"] = ",".join(st.session_state.primary_key)
         st.query_params["columns_to_compare"] = ",".join(st.session_state.columns_to_compare)
         st.query_params["select_all"] = st.session_state.is_select_all
         st.query_params["table1"] = st.session_state.table1
         st.query_params["table2"] = st.session_state.table2
 
         st.session_state.loaded_tables = True
+        st.session_state.cost_confirmed = False
+        self.get_stage_results().invalidate(keep=TABLES_STAGES)
 
     def second_step(self):
         """Second step of the app: select primary key and columns to compare"""
         processor = self.get_processor()
 
-        common_table_schema = processor.get_common_schema_from_tables()
+        common_table_schema, warnings, (diff_columns1, diff_columns2) = self.run_stage(
+            processor,
+            "schemas",
+            lambda: (
+                processor.get_common_schema_from_tables(),
+                processor.get_schema_warnings(),
+                processor.get_diff_columns(),
+            ),
+        )
         st.session_state.common_table_schema = common_table_schema
 
-        diff_columns1, diff_columns2 = processor.get_diff_columns()
+        for warning in warnings:
+            st.warning(warning)
 
         st.write("Columns exclusive to table 1 :")
         st.dataframe(diff_columns1, width=1400)
         st.write("Columns exclusive to table 2 :")
         st.dataframe(diff_columns2, width=1400)
 
-        primary_key_select_index = (
-            common_table_schema.columns_names.index(st.session_state.primary_key)
-            if st.session_state.primary_key in common_table_schema.columns_names
-            else None
-        )
-
-        st.selectbox(
-            "Select primary key (must be unique for a given row):",
+        st.multiselect(
+            "Select primary key columns (must be unique for a given row):",
             common_table_schema.columns_names,
             key="temp_primary_key",
-            index=primary_key_select_index,
+            default=[
+                column
+                for column in st.session_state.primary_key
+                if column in common_table_schema.columns_names
+            ],
+            help="Composite primary keys are joined on a fingerprint of their columns",
         )
 
         st.multiselect(
@@ -172,20 +384,104 @@ class DataDiff:
             value=str(st.session_state.is_select_all).lower() == "true",
         )
 
+        sampling_methods = [SamplingMethod.HASH.value]
+        if processor.is_table_sampling_allowed:
+            sampling_methods.append(SamplingMethod.TABLESAMPLE.value)
+
         st.slider(
-            "Data sampling (only available for direct tables as input)",
-            min_value=10,
+            "Data sampling (percentage of primary keys)",
+            min_value=1,
             max_value=100,
             step=1,
             key="temp_sampling_rate",
-            value=100
-            if not processor.is_sampling_allowed
-            else st.session_state.sampling_rate,
-            disabled=(not processor.is_sampling_allowed),
+            value=st.session_state.sampling_rate,
+        )
+
+        st.radio(
+            "Sampling method",
+            options=sampling_methods,
+            format_func=lambda method: {
+                SamplingMethod.HASH.value: "Primary key hash",
+                SamplingMethod.TABLESAMPLE.value: "Table sample",
+            }[method],
+            horizontal=True,
+            key="temp_sampling_method",
+            index=sampling_methods.index(st.session_state.sampling_method)
+            if st.session_state.sampling_method in sampling_methods
+            else 0,
+            help="Primary key hash keeps the same keys on both sides, for any input. "
+            "Table sample reads fewer bytes, but samples each table independently so most keys are missing from the other side (only for direct tables as input)",
         )
 
+        with st.expander("Comparison tolerances"):
+            st.number_input(
+                "Float epsilon",
+                min_value=0.0,
+                format="%g",
+                key="temp_float_epsilon",
+                value=st.session_state.float_epsilon,
+                help="Floats whose absolute difference is lower or equal are equal",
+            )
+            timestamp_truncations = [None, *TIMESTAMP_TRUNCATION_PARTS]
+            st.selectbox(
+                "Truncate timestamps, datetimes and times to",
+                options=timestamp_truncations,
+                format_func=lambda part: part or "No truncation",
+                key="temp_timestamp_truncation",
+                index=timestamp_truncations.index(st.session_state.timestamp_truncation)
+                if st.session_state.timestamp_truncation in timestamp_truncations
+                else 0,
+            )
+            st.checkbox(
+                "Case-insensitive strings",
+                key="temp_case_insensitive_strings",
+                value=st.session_state.case_insensitive_strings,
+            )
+            st.checkbox(
+                "Ignore duplicated array values",
+                key="temp_ignore_array_duplicates",
+                value=st.session_state.ignore_array_duplicates,
+                help="Arrays are compared as sets of values by sorting them, slower than the default comparison of their elements in any order",
+            )
+
         st.form_submit_button(label="OK", on_click=self.update_second_step)
 
+    def confirm_cost(self, processor: BigQueryProcessor):
+        """Show the bytes the diff would scan, estimated with free dry runs, and wait for the user to confirm"""
+        stages_bytes = self.run_stage(
+            processor,
+            "cost estimate",
+            processor.estimate_stages_bytes,
+            selected_columns=st.session_state.columns_to_compare,
+            common_table_schema=st.session_state.common_table_schema,
+        ).copy()
+        stages_bytes["estimate"] = stages_bytes["bytes_processed"].apply(
+            lambda value: format_bytes(value) if pd.notna(value) else "unknown"
+        )
+
+        st.write("Estimated bytes scanned per stage:")
+        st.dataframe(stages_bytes, hide_index=True)
+
+        # The app runs the health check, then the plain diff
+        diff_bytes = (
+            stages_bytes.set_index("stage")
+            .loc[["health check", "plain diff"], "bytes_processed"]
+            .fillna(0)
+        )
+        try:
+            processor.client.budget.check(
+                int(diff_bytes.max()), total_estimated_bytes=int(diff_bytes.sum())
+            )
+        except BudgetExceededError as error:
+            st.error(f"{error}, please use sampling or fewer columns.")
+            st.stop()
+
+        st.button(
+            f"Run diff (up to {format_bytes(diff_bytes.sum())} scanned)",
+            on_click=lambda: st.session_state.update(cost_confirmed=True),
+        )
+        st.stop()
+
     def window(self):
         # Parse query params from URL
         self.init_from_query_params()
@@ -202,25 +498,93 @@ class DataDiff:
             primary_key=st.session_state.primary_key,
             columns_to_compare=st.session_state.columns_to_compare,
             sampling_rate=st.session_state.sampling_rate,
+            sampling_method=st.session_state.sampling_method,
+            tolerance=ComparisonTolerance(
+                float_epsilon=st.session_state.float_epsilon,
+                timestamp_truncation=st.session_state.timestamp_truncation,
+                case_insensitive_strings=st.session_state.case_insensitive_strings,
+                ignore_array_duplicates=st.session_state.ignore_array_duplicates,
+            ),
         )
+        # Jobs still running for a previous configuration of the session are cancelled
+        processor.client.set_job_scope(
+            get_script_run_ctx().session_id, processor.get_query_cache_key()
+        )
+        self.show_run_summary(processor.client)
 
         if st.session_state.loaded_tables:
 
-            st.write("Checking primary keys are unique for a given row...")
+            if not st.session_state.get("cost_confirmed", False):
+                self.confirm_cost(processor)
+
+            if st.toggle(
+                "Compare column profiles",
+                help="Approximate distinct counts, null ratios, min / max, quantiles and top values of each table, without joining them. Cheap check of whether a keyed diff is worth running",
+            ):
+                column_profiles = self.run_stage(
+                    processor,
+                    "column profiles",
+                    processor.run_column_profiling,
+                    selected_columns=st.session_state.columns_to_compare,
+                    common_table_schema=st.session_state.common_table_schema,
+                )
+                st.dataframe(
+                    style_percentage(
+                        column_profiles,
+                        columns=[
+                            "ratio_null__1",
+                            "ratio_null__2",
+                            "distinct_diff_ratio",
+                            "ratio_null_diff",
+                            "top_values_overlap",
+                        ],
+                    ),
+                    hide_index=True,
+                )
+
+            partitioning = self.run_stage(
+                processor, "time partitioning", processor.get_time_partitioning
+            )
+            if partitioning is not None and st.toggle(
+                "Check partitions incrementally",
+                help=f"Row counts and checksums of each {partitioning.partition_type.lower()} partition of column {partitioning.column}. "
+                "They are stored locally and only partitions modified since the last check are scanned again",
+            ):
+                partitions, scanned_partitions = self.run_stage(
+                    processor,
+                    "partition checksums",
+                    partial(
+                        processor.get_partition_checksums,
+                        store=PartitionChecksumStore(PARTITION_CHECKSUMS_PATH),
+                    ),
+                    selected_columns=st.session_state.columns_to_compare,
+                    common_table_schema=st.session_state.common_table_schema,
+                )
+                st.write(
+                    f"{len(scanned_partitions)} partitions scanned, "
+                    f"{int(partitions['is_different'].sum())} of {len(partitions)} partitions are different"
+                )
+                st.dataframe(partitions, hide_index=True)
+
+            st.write("Checking primary keys and computing difference ratio...")
 
-            primary_keys_unique_table1, error_message_table1 = processor.run_query_check_primary_keys_unique(table="table1")
-            primary_keys_unique_table2, error_message_table2 = processor.run_query_check_primary_keys_unique(table="table2")
+            # Uniqueness, primary keys insight and ratios are computed with a single query
+            health_check = self.run_stage(
+                processor,
+                "health check",
+                processor.run_health_check,
+                selected_columns=st.session_state.columns_to_compare,
+                common_table_schema=st.session_state.common_table_schema,
+            )
 
-            if not primary_keys_unique_table1 or not primary_keys_unique_table2:
+            if not health_check.primary_keys_unique:
                 st.write("Primary keys are not unique for a given row ❌")
-                st.write(error_message_table1)
-                st.write(error_message_table2)
+                for error_message in health_check.get_error_messages():
+                    st.write(error_message)
                 st.stop()
-        
+
             st.write("Primary keys are unique for a given row ✅")
-            # Using BigQueryClient to run queries, output primary keys in common and exclusive to each table on streamlit : display rows in table format
-            st.write("Analyzing primary keys...")
-            results_primary_keys = processor.run_query_compare_primary_keys()
+            results_primary_keys = health_check.primary_keys
 
             st.dataframe(
                 style_percentage(
@@ -235,7 +599,11 @@ class DataDiff:
                 (
                     df_exlusive_table1,
                     df_exlusive_table2,
-                ) = processor.run_query_exclusive_primary_keys()
+                ) = self.run_stage(
+                    processor,
+                    "exclusive primary keys",
+                    processor.run_query_exclusive_primary_keys,
+                )
 
                 st.write("Exclusive to table 1 (showing first 500 rows) :")
                 st.dataframe(df_exlusive_table1)
@@ -243,11 +611,8 @@ class DataDiff:
                 st.write("Exclusive to table 2 (showing first 500 rows) :")
                 st.dataframe(df_exlusive_table2)
 
-            st.write("Computing difference ratio...")
-            results_ratio_per_column = processor.get_column_diff_ratios(
-                selected_columns=st.session_state.columns_to_compare,
-                common_table_schema=st.session_state.common_table_schema,
-            )
+            # The stored health check is reused by the next reruns, the selection column is added to a copy
+            results_ratio_per_column = health_check.column_ratios.copy()
 
             # Check if dataframe is empty meaning that the SQL queries entered are not returning rows
             if bool(results_ratio_per_column["ratio_not_null"].isna().all()):
@@ -287,14 +652,59 @@ class DataDiff:
 
                 st.write(f"Displaying rows where {columns_to_display} is different...")
 
-                query, dataset = processor.get_plain_diff(
-                    selected_columns=columns_to_display,
-                    common_table_schema=st.session_state.common_table_schema,
+                diff_mode = st.radio(
+                    "Diff mode",
+                    options=["Full join", "Fingerprint join", "Checksum bisection"]
+                    + (["Differing partitions"] if partitioning is not None else []),
+                    horizontal=True,
+                    help="Fingerprint join only joins primary keys and rows fingerprints to find the differing rows, cheaper on wide tables. "
+                    "Checksum bisection only joins the primary key segments whose checksums differ, cheaper on very large tables with few differences. "
+                    "Differing partitions only joins the partitions whose checksums differ, scanning only partitions modified since the last check",
                 )
 
-                if dataset.empty:
+                if diff_mode == "Differing partitions":
+                    partitions, _ = self.run_stage(
+                        processor,
+                        "partition checksums",
+                        partial(
+                            processor.get_partition_checksums,
+                            store=PartitionChecksumStore(PARTITION_CHECKSUMS_PATH),
+                        ),
+                        selected_columns=columns_to_display,
+                        common_table_schema=st.session_state.common_table_schema,
+                    )
+                    query = processor.get_query_plain_diff_partitions(
+                        common_table_schema=TableSchema(
+                            table_name="filtered_columns",
+                            columns=[
+                                st.session_state.common_table_schema.get_column(column)
+                                for column in columns_to_display
+                            ],
+                        ),
+                        partitioning=partitioning,
+                        partition_ids=partitions.loc[
+                            partitions["is_different"], "partition_id"
+                        ].tolist(),
+                    )
+                elif diff_mode == "Checksum bisection":
+                    query, _ = self.run_stage(
+                        processor,
+                        "bisection",
+                        processor.get_query_bisection_diff,
+                        selected_columns=columns_to_display,
+                        common_table_schema=st.session_state.common_table_schema,
+                    )
+                else:
+                    query = processor.get_query_plain_diff(
+                        selected_columns=columns_to_display,
+                        common_table_schema=st.session_state.common_table_schema,
+                        use_fingerprints=diff_mode == "Fingerprint join",
+                    )
+
+                diff_table, total_rows = self.materialize_diff(processor, query)
+
+                if total_rows == 0:
                     st.write("No difference found ✅")
-                    st.dataframe(dataset)
 
                 else:
                     top_menu = st.columns(3)
@@ -302,20 +712,23 @@ class DataDiff:
                         sort = st.radio(
                             "Sort Data", options=["Yes", "No"], horizontal=1, index=1
                         )
+                    sort_field, ascending = None, True
                     if sort == "Yes":
                         with top_menu[1]:
                             sort_field = st.selectbox(
-                                "Sort By", options=dataset.columns
+                                "Sort By",
+                                options=self.run_stage(
+                                    processor,
+                                    "diff sort columns",
+                                    processor.get_sort_columns,
+                                    table=diff_table,
+                                ),
                             )
                         with top_menu[2]:
                             sort_direction = st.radio(
                                 "Direction", options=["⬆️", "⬇️"], horizontal=True
                             )
-                        dataset = dataset.sort_values(
-                            by=sort_field,
-                            ascending=sort_direction == "⬆️",
-                            ignore_index=True,
-                        )
+                        ascending = sort_direction == "⬆️"
                     pagination = st.container()
 
                     bottom_menu = st.columns((4, 1, 1))
@@ -324,33 +737,40 @@ class DataDiff:
                             "Page Size", options=[25, 50, 100, 500]
                         )
                     with bottom_menu[1]:
-                        total_pages = (
-                            int(len(dataset) / batch_size)
-                            if int(len(dataset) / batch_size) > 0
-                            else 1
-                        )
+                        total_pages = max(-(-total_rows // batch_size), 1)
                         current_page = st.number_input(
                             "Page", min_value=1, max_value=total_pages, step=1
                         )
                     with bottom_menu[0]:
-                        st.markdown(f"Page **{current_page}** of **{total_pages}** ")
+                        st.markdown(
+                            f"Page **{current_page}** of **{total_pages}** ({total_rows} rows)"
+                        )
 
-                    pages = self.split_frame(dataset, batch_size)
-                    # pagination.dataframe(data=pages[current_page - 1], use_container_width=True)
+                    page = self.get_diff_page(
+                        processor,
+                        table=diff_table,
+                        page_number=current_page,
+                        page_size=batch_size,
+                        sort_column=sort_field,
+                        ascending=ascending,
+                    )
 
                     pagination.dataframe(
                         data=highlight_diff_dataset(
-                            pages[current_page - 1], columns=columns_to_display
+                            page.rows, columns=columns_to_display
                         ),
                         use_container_width=True,
                     )
 
                 st.title("Diff SQL query")
                 st.code(
-                    query.sql(pretty=True, dialect=processor.dialect), language="sql"
+                    get_query_sql(query, processor.dialect, pretty=True), language="sql"
                 )
 
 
 if __name__ == "__main__":
     dd = DataDiff()
-    dd.window()
+    try:
+        dd.window()
+    finally:
+        dd.waiting_status.empty()
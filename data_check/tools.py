@@ -1,13 +1,100 @@
-from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, List, Tuple
-
-from streamlit.runtime.scriptrunner import add_script_run_ctx
+import sys
+from concurrent.futures import (FIRST_COMPLETED, FIRST_EXCEPTION, Executor,
+                                Future, ThreadPoolExecutor, wait)
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 # Run a list of jobs in parallel using multithreading. We want to be able to pass dedicated arguments to each job.
-def run_multithreaded(jobs: List[Tuple[Callable, Tuple]], max_workers: int) -> List:
+def run_multithreaded(jobs: List[Tuple[Callable, Dict]], max_workers: int) -> List:
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [executor.submit(job[0], **job[1]) for job in jobs]
-        for t in executor._threads:
-            add_script_run_ctx(t)
+        # Threads need the Streamlit context to use Streamlit features, only when running in the app
+        if "streamlit" in sys.modules:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+            for t in executor._threads:
+                add_script_run_ctx(t)
     return [future.result() for future in futures]
+
+
+def then(future: Future, function: Callable[[Any], Any], executor: Executor) -> Future:
+    """Future of `function` applied to the result of `future`, run by the executor.
+
+    Cancelling the returned future cancels `future`.
+    """
+    chained = Future()
+
+    def on_done(done: Future) -> None:
+        if done.cancelled():
+            chained.cancel()
+        elif done.exception() is not None:
+            chained.set_exception(done.exception())
+        elif chained.set_running_or_notify_cancel():
+            executor.submit(_set_future_result, chained, function, done.result())
+
+    chained.add_done_callback(lambda chained: chained.cancelled() and future.cancel())
+    future.add_done_callback(on_done)
+    return chained
+
+
+def wait_for_results(
+    futures: List[Future],
+    on_wait: Optional[Callable[[], None]] = None,
+    interval_seconds: float = 1,
+) -> List:
+    """Wait for the results of futures, calling `on_wait` at each interval until they are done.
+
+    The futures are cancelled when one of them fails or when the wait is interrupted, by an exception raised by `on_wait`.
+    """
+    try:
+        while True:
+            done, not_done = wait(futures, timeout=interval_seconds, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+            if not not_done:
+                return [future.result() for future in futures]
+            if on_wait is not None:
+                on_wait()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def wait_for_submitted_results(
+    submit: Callable[[Any], Future],
+    values: List,
+    max_in_flight: int,
+    on_wait: Optional[Callable[[], None]] = None,
+    interval_seconds: float = 1,
+) -> List:
+    """Submit the values with at most `max_in_flight` futures running at a time, and wait for their results in order.
+
+    As with wait_for_results, the futures are cancelled when one of them fails or when the wait is interrupted.
+    """
+    futures: List[Future] = []
+    try:
+        while True:
+            in_flight = [future for future in futures if not future.done()]
+            while len(futures) < len(values) and len(in_flight) < max_in_flight:
+                future = submit(values[len(futures)])
+                futures.append(future)
+                in_flight.append(future)
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+            if not in_flight:
+                return [future.result() for future in futures]
+            done, _ = wait(in_flight, timeout=interval_seconds, return_when=FIRST_COMPLETED)
+            if not done and on_wait is not None:
+                on_wait()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _set_future_result(future: Future, function: Callable, value: Any) -> None:
+    try:
+        future.set_result(function(value))
+    except Exception as error:
+        future.set_exception(error)
@@ -0,0 +1,58 @@
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+from sqlglot.expressions import Select
+
+from data_check.models.table import TableSchema
+from data_check.query_client import QueryClient
+
+
+class FakeQueryClient(QueryClient):
+    """Client returning canned results, and recording the queries it runs.
+
+    Results are either returned in order (list) or by query SQL (dict).
+    """
+
+    def __init__(
+        self,
+        results: Optional[Union[List[pd.DataFrame], Dict[str, pd.DataFrame]]] = None,
+        schemas: Optional[Dict[str, TableSchema]] = None,
+        estimates: Optional[Dict[str, int]] = None,
+        last_modified: Optional[Dict[str, str]] = None,
+    ):
+        self.results = results if isinstance(results, dict) else list(results or [])
+        self.schemas = schemas or {}
+        self.estimates = estimates or {}
+        self.last_modified = last_modified or {}
+        self.dialect = "bigquery"
+        self.queries: List[Select] = []
+
+    def get_credentials(self):
+        return None
+
+    def init_client(self):
+        return None
+
+    def get_table(self, table: str):
+        raise NotImplementedError
+
+    def run_query_to_dataframe(self, query: Select) -> pd.DataFrame:
+        self.queries.append(query)
+        if isinstance(self.results, dict):
+            return self.results[query.sql()].copy()
+        return self.results.pop(0)
+
+    def get_table_schema_from_table(self, table: str) -> TableSchema:
+        return self.schemas[table]
+
+    def get_table_schema_from_sql(self, query: Select) -> TableSchema:
+        return self.schemas[query.sql()]
+
+    def materialize_query(self, query: Select) -> str:
+        raise NotImplementedError
+
+    def estimate_query_bytes(self, query: Select) -> Optional[int]:
+        return self.estimates.get(query.sql())
+
+    def get_table_last_modified(self, table: str) -> Optional[str]:
+        return self.last_modified.get(table)
@@ -1,11 +1,26 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
 import pytest
+from sqlglot import parse_one
 
 from data_check.models.table import ColumnSchema, TableSchema
 from data_check.processors.bigquery import BigQueryProcessor
+from tests.fake_client import FakeQueryClient
 
 QUERY_1 = "select * from `my-project.my_dataset.table1`"
 QUERY_2 = "select * from `my-project.my_dataset.table2`"
 
+COMMON_SCHEMA = TableSchema(
+    table_name="common",
+    columns=[
+        ColumnSchema(name="B", field_type="INTEGER", mode="NULLABLE"),
+        ColumnSchema(name="C", field_type="STRING", mode="NULLABLE"),
+    ],
+)
+
 # Create fixture for BigQueryProcessor
 @pytest.fixture
 def bigquery_processor() -> BigQueryProcessor:
@@ -54,10 +69,25 @@ def test_get_query_plain_diff_tables():
 
     assert (
         result.sql()
-        == f"""WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), inner_merged AS (SELECT table1.A, table1.B AS B__1, table2.B AS B__2, table1.C AS C__1, table2.C AS C__2 FROM table1 INNER JOIN table2 USING (A)), final_result AS (SELECT * FROM inner_merged WHERE COALESCE(CAST(B__1 AS TEXT), 'none') <> COALESCE(CAST(B__2 AS TEXT), 'none') OR COALESCE(C__1, 'none') <> COALESCE(C__2, 'none')) SELECT * FROM final_result"""
+        == f"""WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), inner_merged AS (SELECT table1.A, table1.B AS B__1, table2.B AS B__2, table1.C AS C__1, table2.C AS C__2 FROM table1 INNER JOIN table2 USING (A)), final_result AS (SELECT *, B__1 IS DISTINCT FROM B__2 AS B__diff, C__1 IS DISTINCT FROM C__2 AS C__diff FROM inner_merged WHERE B__1 IS DISTINCT FROM B__2 OR C__1 IS DISTINCT FROM C__2) SELECT * FROM final_result"""
     )
 
 
+def test_get_query_plain_diff_fingerprints():
+    processor = BigQueryProcessor("table1", "table2", client=FakeQueryClient())
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=100,
+    )
+
+    result = processor.get_query_plain_diff_fingerprints(common_table_schema=COMMON_SCHEMA)
+
+    assert (
+        result.sql()
+        == "WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), fingerprints1 AS (SELECT A, FARM_FINGERPRINT(JSON_FORMAT(STRUCT(B AS B, C AS C))) AS fingerprint FROM table1), fingerprints2 AS (SELECT A, FARM_FINGERPRINT(JSON_FORMAT(STRUCT(B AS B, C AS C))) AS fingerprint FROM table2), mismatched_keys AS (SELECT A FROM fingerprints1 INNER JOIN fingerprints2 USING (A) WHERE fingerprints1.fingerprint <> fingerprints2.fingerprint), inner_merged AS (SELECT table1.A, table1.B AS B__1, table2.B AS B__2, table1.C AS C__1, table2.C AS C__2 FROM (SELECT * FROM table1 WHERE A IN (SELECT A FROM mismatched_keys)) AS table1 INNER JOIN (SELECT * FROM table2 WHERE A IN (SELECT A FROM mismatched_keys)) AS table2 USING (A)), final_result AS (SELECT *, B__1 IS DISTINCT FROM B__2 AS B__diff, C__1 IS DISTINCT FROM C__2 AS C__diff FROM inner_merged WHERE B__1 IS DISTINCT FROM B__2 OR C__1 IS DISTINCT FROM C__2) SELECT * FROM final_result"
+    )
+
 def test_query_ratio_common_values_per_column():
 
     processor = BigQueryProcessor("table1", "table2")
@@ -80,9 +110,37 @@ def test_query_ratio_common_values_per_column():
 
     assert (
         result.sql()
-        == f"WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), count_diff AS (SELECT COUNT(A) AS count_common, COUNT_IF(NOT COALESCE(CAST(table1.A AS TEXT), CAST(table2.A AS TEXT)) IS NULL) AS A_count_not_null, COUNT_IF(COALESCE(CAST(table1.A AS TEXT), 'none') = COALESCE(CAST(table2.A AS TEXT), 'non')) AS A, COUNT_IF(NOT COALESCE(CAST(table1.B AS TEXT), CAST(table2.B AS TEXT)) IS NULL) AS B_count_not_null, COUNT_IF(COALESCE(CAST(table1.B AS TEXT), 'none') = COALESCE(CAST(table2.B AS TEXT), 'non')) AS B, COUNT_IF(NOT COALESCE(table1.C, table2.C) IS NULL) AS C_count_not_null, COUNT_IF(COALESCE(table1.C, 'none') = COALESCE(table2.C, 'non')) AS C FROM table1 INNER JOIN table2 USING (A)), final_result AS (SELECT STRUCT(CASE WHEN count_common <> 0 THEN A_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN A_count_not_null <> 0 THEN A / A_count_not_null ELSE NULL END AS ratio_equal) AS A, STRUCT(CASE WHEN count_common <> 0 THEN B_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN B_count_not_null <> 0 THEN B / B_count_not_null ELSE NULL END AS ratio_equal) AS B, STRUCT(CASE WHEN count_common <> 0 THEN C_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN C_count_not_null <> 0 THEN C / C_count_not_null ELSE NULL END AS ratio_equal) AS C FROM count_diff) SELECT * FROM final_result"
+        == f"WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), count_diff AS (SELECT COUNT(A) AS count_common, COUNT_IF(NOT COALESCE(table1.A, table2.A) IS NULL) AS A_count_not_null, COUNT_IF(table1.A = table2.A) AS A, COUNT_IF(NOT COALESCE(table1.B, table2.B) IS NULL) AS B_count_not_null, COUNT_IF(table1.B = table2.B) AS B, COUNT_IF(NOT COALESCE(table1.C, table2.C) IS NULL) AS C_count_not_null, COUNT_IF(table1.C = table2.C) AS C FROM table1 INNER JOIN table2 USING (A)), final_result AS (SELECT ratios.* FROM count_diff CROSS JOIN UNNEST(ARRAY(STRUCT('A' AS column_name, CASE WHEN count_common <> 0 THEN A_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN A_count_not_null <> 0 THEN A / A_count_not_null ELSE NULL END AS ratio_equal), STRUCT('B' AS column_name, CASE WHEN count_common <> 0 THEN B_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN B_count_not_null <> 0 THEN B / B_count_not_null ELSE NULL END AS ratio_equal), STRUCT('C' AS column_name, CASE WHEN count_common <> 0 THEN C_count_not_null / count_common ELSE NULL END AS ratio_not_null, CASE WHEN C_count_not_null <> 0 THEN C / C_count_not_null ELSE NULL END AS ratio_equal))) AS _t0(ratios)) SELECT * FROM final_result"
+    )
+
+
+def test_with_statement_query_sampled_by_primary_key_hash():
+    processor = BigQueryProcessor(QUERY_1, QUERY_2, client=FakeQueryClient())
+    processor.set_config_data(
+        primary_key="A", columns_to_compare=["B", "C"], sampling_rate=1
+    )
+
+    assert processor.is_sampling_allowed
+    assert not processor.is_table_sampling_allowed
+    assert (
+        processor.with_statement_query_sampled.select("*").from_("table1").sql()
+        == 'WITH table1 AS (SELECT * FROM (SELECT * FROM "my-project"."my_dataset"."table1") WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 10000) < 100), table2 AS (SELECT * FROM (SELECT * FROM "my-project"."my_dataset"."table2") WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 10000) < 100) SELECT * FROM table1'
+    )
+
+
+def test_with_statement_query_sampled_by_storage_blocks():
+    processor = BigQueryProcessor("table1", "table2", client=FakeQueryClient())
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=10,
+        sampling_method="tablesample",
     )
 
+    assert (
+        processor.with_statement_query_sampled.select("*").from_("table1").sql()
+        == "WITH table1 AS (SELECT * FROM table1 TABLESAMPLE SYSTEM (10 PERCENT)), table2 AS (SELECT * FROM table2 TABLESAMPLE SYSTEM (10 PERCENT)) SELECT * FROM table1"
+    )
 
 def test_get_query_check_primary_keys_unique(bigquery_processor: BigQueryProcessor):
     query1 = bigquery_processor.get_query_check_primary_keys_unique(table_name="table1")
@@ -100,3 +158,214 @@ def test_run_query_check_primary_keys_unique():
 
     result = processor.run_query_check_primary_keys_unique(table="table1")
     assert result == (True, "")
+
+
+def test_get_query_segment_checksums():
+    processor = BigQueryProcessor("table1", "table2", client=FakeQueryClient())
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=100,
+    )
+
+    result = processor.get_query_segment_checksums(
+        common_table_schema=COMMON_SCHEMA,
+        modulus=256,
+        parent_modulus=16,
+        parent_segments=[3, 7],
+    )
+
+    assert (
+        result.sql()
+        == "WITH table1 AS (SELECT * FROM table1), table2 AS (SELECT * FROM table2), checksums1 AS (SELECT ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 256) AS segment, COUNT(*) AS row_count, BIT_XOR(FARM_FINGERPRINT(JSON_FORMAT(STRUCT(B AS B, C AS C)))) AS checksum FROM table1 WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 16) IN (3, 7) GROUP BY segment), checksums2 AS (SELECT ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 256) AS segment, COUNT(*) AS row_count, BIT_XOR(FARM_FINGERPRINT(JSON_FORMAT(STRUCT(B AS B, C AS C)))) AS checksum FROM table2 WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 16) IN (3, 7) GROUP BY segment) SELECT segment, checksums1.row_count AS row_count_table1, checksums2.row_count AS row_count_table2 FROM checksums1 FULL OUTER JOIN checksums2 USING (segment) WHERE checksums1.checksum IS DISTINCT FROM checksums2.checksum OR checksums1.row_count IS DISTINCT FROM checksums2.row_count ORDER BY segment"
+    )
+
+
+def test_get_bisection_diff_only_recurses_into_differing_segments():
+    diff = pd.DataFrame({"A": [42], "B__1": [1], "B__2": [2], "C__1": ["x"], "C__2": ["x"]})
+    client = FakeQueryClient(
+        results=[
+            pd.DataFrame({"segment": [1], "row_count_table1": [1000], "row_count_table2": [1000]}),
+            pd.DataFrame({"segment": [5, 9], "row_count_table1": [60, 62], "row_count_table2": [60, 62]}),
+            diff,
+        ]
+    )
+    processor = BigQueryProcessor("table1", "table2", client=client)
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=100,
+    )
+
+    query, result = processor.get_bisection_diff(
+        selected_columns=["B", "C"],
+        common_table_schema=COMMON_SCHEMA,
+        segments_per_level=4,
+        max_rows=500,
+    )
+
+    assert len(client.queries) == 3
+    assert "% 4) AS segment" in client.queries[0].sql()
+    assert "FROM table1 GROUP BY segment" in client.queries[0].sql()
+    assert "WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 4) IN (1)" in client.queries[1].sql()
+    assert query.sql().count("WHERE ABS(FARM_FINGERPRINT(CAST(A AS TEXT)) % 16) IN (5, 9)") == 2
+    assert result.equals(diff)
+
+
+def test_get_bisection_diff_without_differences():
+    client = FakeQueryClient(
+        results=[pd.DataFrame(columns=["segment", "row_count_table1", "row_count_table2"])]
+    )
+    processor = BigQueryProcessor("table1", "table2", client=client)
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=100,
+    )
+
+    _, result = processor.get_bisection_diff(
+        selected_columns=["B", "C"],
+        common_table_schema=COMMON_SCHEMA,
+    )
+
+    assert len(client.queries) == 1
+    assert result.empty
+
+
+def test_run_queries_concurrently_keeps_order():
+    class SlowClient(FakeQueryClient):
+        def __init__(self):
+            super().__init__()
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.lock = threading.Lock()
+
+        def run_query_to_dataframe(self, query):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight -= 1
+            return pd.DataFrame({"query": [query.sql()]})
+
+    client = SlowClient()
+    processor = BigQueryProcessor("table1", "table2", client=client, max_workers=2)
+    queries = [parse_one(f"select {index}") for index in range(5)]
+
+    results = processor.run_queries_concurrently(queries)
+
+    assert [df["query"].iloc[0] for df in results] == [query.sql() for query in queries]
+    assert client.max_in_flight == 2
+
+
+def test_run_queries_concurrently_bounds_asynchronous_queries():
+    class AsynchronousClient(FakeQueryClient):
+        runs_queries_asynchronously = True
+
+        def __init__(self):
+            super().__init__()
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.lock = threading.Lock()
+
+        def submit_query(self, query):
+            future = Future()
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+            def finish():
+                with self.lock:
+                    self.in_flight -= 1
+                future.set_result(pd.DataFrame({"query": [query.sql()]}))
+
+            threading.Timer(0.05, finish).start()
+            return future
+
+    client = AsynchronousClient()
+    processor = BigQueryProcessor("table1", "table2", client=client, max_workers=2)
+    queries = [parse_one(f"select {index}") for index in range(5)]
+
+    results = processor.run_queries_concurrently(queries)
+
+    assert [df["query"].iloc[0] for df in results] == [query.sql() for query in queries]
+    assert client.max_in_flight == 2
+
+
+def test_run_query_exclusive_primary_keys():
+    schema = TableSchema(
+        table_name="table",
+        columns=[
+            ColumnSchema(name="A", field_type="INTEGER", mode="NULLABLE"),
+            ColumnSchema(name="B", field_type="STRING", mode="NULLABLE"),
+        ],
+    )
+    processor = BigQueryProcessor(
+        "table1", "table2", client=FakeQueryClient(schemas={"table1": schema, "table2": schema})
+    )
+    processor.set_config_data(primary_key="A", columns_to_compare=["B"], sampling_rate=100)
+    processor.client.results = {
+        processor.get_query_exclusive_primary_keys(exclusive_to="table1").sql(): pd.DataFrame({"A": [1], "B__1": ["x"]}),
+        processor.get_query_exclusive_primary_keys(exclusive_to="table2").sql(): pd.DataFrame({"A": [2], "B__2": ["y"]}),
+    }
+
+    df_exclusive_table1, df_exclusive_table2 = processor.run_query_exclusive_primary_keys()
+
+    assert df_exclusive_table1.index.tolist() == [1]
+    assert df_exclusive_table2.index.tolist() == [2]
+
+
+def test_estimate_stages_bytes():
+    client = FakeQueryClient()
+    processor = BigQueryProcessor(QUERY_1, QUERY_2, client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["B", "C"], sampling_rate=100)
+    stages_queries = processor.get_stages_queries(
+        selected_columns=["B", "C"], common_table_schema=COMMON_SCHEMA
+    )
+    client.estimates = {
+        stages_queries["uniqueness"][0].sql(): 100,
+        stages_queries["uniqueness"][1].sql(): 200,
+        stages_queries["profile"][0].sql(): 50,
+        stages_queries["profile"][1].sql(): 60,
+        stages_queries["key insight"][0].sql(): 300,
+        stages_queries["ratios"][0].sql(): 1000,
+        stages_queries["health check"][0].sql(): 400,
+        stages_queries["plain diff"][0].sql(): 1000,
+    }
+
+    df = processor.estimate_stages_bytes(
+        selected_columns=["B", "C"], common_table_schema=COMMON_SCHEMA
+    )
+
+    assert df["stage"].tolist() == ["uniqueness", "profile", "key insight", "ratios", "health check", "plain diff"]
+    # The health check fuses the key checks and the ratios of the columns in a single scan
+    assert df["bytes_processed"].tolist() == [300, 110, 300, 1000, 400, 1000]
+    assert client.queries == []
+
+
+def test_run_query_to_arrow_batches_default_fetches_dataframe():
+    client = FakeQueryClient(results=[pd.DataFrame({"A": [1, 2]})])
+
+    batches = list(client.run_query_to_arrow_batches(parse_one("select A from table1")))
+
+    assert sum(batch.num_rows for batch in batches) == 2
+
+
+def test_queries_are_memoized_by_configuration():
+    processor = BigQueryProcessor(QUERY_1, QUERY_2, client=FakeQueryClient())
+    processor.set_config_data(primary_key="A", columns_to_compare=["B", "C"], sampling_rate=100)
+    query = processor.get_query_plain_diff_tables(COMMON_SCHEMA)
+
+    # Streamlit reruns create a new processor with the same configuration
+    other_processor = BigQueryProcessor(QUERY_1, QUERY_2, client=FakeQueryClient())
+    other_processor.set_config_data(primary_key="A", columns_to_compare=["B", "C"], sampling_rate=100)
+    assert other_processor.get_query_plain_diff_tables(common_table_schema=COMMON_SCHEMA) is query
+
+    other_processor.set_config_data(primary_key="A", columns_to_compare=["B", "C"], sampling_rate=50)
+    sampled_query = other_processor.get_query_plain_diff_tables(COMMON_SCHEMA)
+    assert sampled_query is not query
+    assert "FARM_FINGERPRINT" in sampled_query.sql(dialect="bigquery").upper()
+
+    other_schema = TableSchema(table_name="common", columns=COMMON_SCHEMA.columns[:1])
+    assert "C__1" not in processor.get_query_plain_diff_tables(other_schema).sql()
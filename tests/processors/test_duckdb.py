@@ -0,0 +1,626 @@
+import json
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from data_check.models.comparison import ComparisonTolerance  # noqa: E402
+from data_check.models.partition import TimePartitioning  # noqa: E402
+from data_check.models.table import TableSchema  # noqa: E402
+from data_check.processors.duckdb import DuckDBProcessor  # noqa: E402
+from data_check.query.partition_store import PartitionChecksumStore  # noqa: E402
+from data_check.query.query_duckdb import QueryDuckDB  # noqa: E402
+
+TABLE_1 = pd.DataFrame(
+    {"A": [1, 2, 3, 4], "B": [10, 20, 30, 40], "C": ["a", "b", None, "d"]}
+)
+TABLE_2 = pd.DataFrame(
+    {"A": [1, 2, 3, 5], "B": [10, 21, 30, 50], "C": ["a", "b", None, "e"]}
+)
+
+
+@pytest.fixture
+def duckdb_processor() -> DuckDBProcessor:
+    client = QueryDuckDB()
+    client.register_dataframe("table_a", TABLE_1)
+    client.register_dataframe("table_b", TABLE_2)
+
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B", "C"],
+        sampling_rate=100,
+    )
+    return processor
+
+
+def test_duckdb_processor_compare_primary_keys(duckdb_processor: DuckDBProcessor):
+    df = duckdb_processor.run_query_compare_primary_keys()
+
+    assert df["total_rows"].iloc[0] == 5
+    assert df["missing_primary_keys_ratio"].iloc[0] == 0.4
+    assert duckdb_processor.run_query_check_primary_keys_unique(table="table1") == (True, "")
+
+
+def test_duckdb_processor_sampling_keeps_same_keys():
+    keys = list(range(1000))
+    client = QueryDuckDB()
+    client.register_dataframe("table_a", pd.DataFrame({"A": keys, "B": keys}))
+    client.register_dataframe("table_b", pd.DataFrame({"A": keys, "B": keys}))
+    processor = DuckDBProcessor("select * from table_a", "table_b", client=client)
+    processor.set_config_data(
+        primary_key="A", columns_to_compare=["B"], sampling_rate=10
+    )
+
+    df = processor.run_query_compare_primary_keys()
+
+    assert 50 < df["total_rows"].iloc[0] < 150
+    assert df["missing_primary_keys_ratio"].iloc[0] == 0
+
+def test_duckdb_processor_column_diff_ratios(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    df = duckdb_processor.get_column_diff_ratios(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    )
+
+    assert df.set_index("column")["ratio_equal"].to_dict() == {
+        "B": pytest.approx(2 / 3),
+        "C": 1.0,
+    }
+
+
+def test_duckdb_processor_column_diff_ratios_in_chunks(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    queries = duckdb_processor.get_queries_column_diff_ratios(
+        selected_columns=["A", "B", "C"],
+        common_table_schema=common_table_schema,
+        chunk_size=2,
+    )
+    df = duckdb_processor.get_column_diff_ratios(
+        selected_columns=["A", "B", "C"],
+        common_table_schema=common_table_schema,
+        chunk_size=2,
+    )
+
+    assert len(queries) == 2
+    assert df.columns.tolist() == [
+        "column",
+        "ratio_not_null",
+        "ratio_equal",
+        "percentage_diff_values",
+    ]
+    assert df["column"].iloc[0] == "B"
+    assert sorted(df["column"]) == ["A", "B", "C"]
+
+
+def test_duckdb_processor_column_profiling(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    df = duckdb_processor.run_column_profiling(
+        selected_columns=["A", "B", "C"], common_table_schema=common_table_schema
+    ).set_index("column")
+
+    assert df.loc["B", "count_distinct__1"] == 4
+    assert df.loc["C", "ratio_null__1"] == 0.25
+    assert df.loc["C", "top_values_overlap"] == pytest.approx(2 / 4)
+    assert list(df.loc["A", "quantiles__2"]) == ["1", "1", "2", "3", "5"]
+    assert df["is_different"].to_dict() == {"A": True, "B": True, "C": True}
+    assert df["same_min_max"].to_dict() == {"A": False, "B": False, "C": False}
+
+
+def test_duckdb_processor_column_profiling_sampled_without_primary_key():
+    client = QueryDuckDB()
+    table = pd.DataFrame({"A": range(1000), "B": [index % 7 for index in range(1000)]})
+    client.register_dataframe("table_a", table)
+    client.register_dataframe("table_b", table)
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key=[], columns_to_compare=["B"], sampling_rate=50)
+
+    df = processor.run_column_profiling(
+        selected_columns=["A", "B"],
+        common_table_schema=processor.get_common_schema_from_tables(),
+    ).set_index("column")
+
+    # The same rows are sampled in both tables
+    assert 300 < df.loc["A", "count_rows__1"] < 700
+    assert df.loc["A", "count_rows__1"] == df.loc["A", "count_rows__2"]
+    assert not df["is_different"].any()
+
+
+def test_compare_column_profiles_missing_column():
+    profile = pd.DataFrame(
+        {
+            "column_name": ["B"],
+            "count_rows": [10],
+            "count_distinct": [5],
+            "ratio_null": [0.0],
+            "min_value": ["1"],
+            "max_value": ["9"],
+            "quantiles": [["1", "5", "9"]],
+            "top_values": [["1"]],
+        }
+    )
+    other_profile = profile.assign(column_name="C")
+
+    df = DuckDBProcessor.compare_column_profiles(profile, other_profile)
+
+    assert df["column"].tolist() == ["B", "C"]
+    assert df["is_different"].tolist() == [True, True]
+    assert df["top_values_overlap"].tolist() == [0.0, 0.0]
+
+
+def test_duckdb_processor_plain_and_bisection_diff(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    _, plain_diff = duckdb_processor.get_plain_diff(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    )
+    _, bisection_diff = duckdb_processor.get_bisection_diff(
+        selected_columns=["B", "C"],
+        common_table_schema=common_table_schema,
+        segments_per_level=2,
+        max_rows=1,
+    )
+    _, fingerprints_diff = duckdb_processor.get_plain_diff(
+        selected_columns=["B", "C"],
+        common_table_schema=common_table_schema,
+        use_fingerprints=True,
+    )
+
+    assert plain_diff["A"].tolist() == [2]
+    assert bisection_diff["A"].tolist() == [2]
+    pd.testing.assert_frame_equal(fingerprints_diff, plain_diff)
+
+
+def test_duckdb_processor_with_parquet_files(tmp_path):
+    TABLE_1.to_parquet(tmp_path / "table_a.parquet")
+    TABLE_2.to_parquet(tmp_path / "table_b.parquet")
+
+    processor = DuckDBProcessor(
+        str(tmp_path / "table_a.parquet"), str(tmp_path / "table_b.parquet")
+    )
+
+    assert processor.table1 == "table_a"
+    assert processor.get_table_columns() == (["A", "B", "C"], ["A", "B", "C"])
+
+
+def test_duckdb_processor_health_check(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    health_check = duckdb_processor.run_health_check(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    )
+
+    assert health_check.primary_keys_unique
+    assert health_check.get_error_messages() == []
+    assert health_check.primary_keys.to_dict("records") == duckdb_processor.run_query_compare_primary_keys().to_dict("records")
+    assert health_check.column_ratios.to_dict("records") == duckdb_processor.get_column_diff_ratios(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    ).to_dict("records")
+
+
+def test_duckdb_processor_health_check_wider_than_one_chunk():
+    columns = [f"column_{index}" for index in range(5)]
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "table_a", pd.DataFrame({"A": [1, 2], **{column: [1, 2] for column in columns}})
+    )
+    client.register_dataframe(
+        "table_b", pd.DataFrame({"A": [1, 2], **{column: [1, 3] for column in columns}})
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=columns, sampling_rate=100)
+    common_table_schema = processor.get_common_schema_from_tables()
+
+    health_check = processor.run_health_check(
+        selected_columns=columns, common_table_schema=common_table_schema, chunk_size=2
+    )
+
+    assert health_check.primary_keys_unique
+    assert sorted(health_check.column_ratios["column"]) == columns
+    assert health_check.column_ratios["ratio_equal"].tolist() == [0.5] * 5
+    # Only the first chunk of columns is fused in the health check query
+    health_check_query, *ratio_queries = processor.get_queries_health_check(
+        selected_columns=columns, common_table_schema=common_table_schema, chunk_size=2
+    )
+    assert "column_1" in health_check_query.sql() and "column_2" not in health_check_query.sql()
+    assert len(ratio_queries) == 2
+
+
+def test_duckdb_processor_health_check_duplicated_keys():
+    client = QueryDuckDB()
+    client.register_dataframe("table_a", pd.concat([TABLE_1, TABLE_1.iloc[[1, 2]]]))
+    client.register_dataframe("table_b", TABLE_2)
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["B"],
+        sampling_rate=100,
+    )
+
+    health_check = processor.run_health_check(
+        selected_columns=["B"],
+        common_table_schema=processor.get_common_schema_from_tables(),
+        sample_size=1,
+    )
+
+    assert not health_check.primary_keys_unique
+    assert health_check.duplicated_keys_table1 == 2
+    assert health_check.duplicated_keys_table2 == 0
+    assert len(health_check.duplicated_keys_sample_table1) == 1
+    assert health_check.duplicated_keys_sample_table1[0] in ["2", "3"]
+    assert health_check.duplicated_keys_sample_table2 == []
+
+
+def test_duckdb_processor_health_check_empty_tables():
+    client = QueryDuckDB()
+    for table in ["table_a", "table_b"]:
+        client.register_dataframe(table, TABLE_1.iloc[:0])
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["B"], sampling_rate=100)
+
+    health_check = processor.run_health_check(
+        selected_columns=["B"], common_table_schema=processor.get_common_schema_from_tables()
+    )
+
+    assert health_check.primary_keys_unique
+    assert health_check.duplicated_keys_sample_table1 == []
+    assert health_check.primary_keys["total_rows"].tolist() == [0]
+    assert health_check.primary_keys["missing_primary_key_in_table1"].tolist() == [0]
+
+
+def test_duckdb_processor_stream_and_export_plain_diff(duckdb_processor: DuckDBProcessor, tmp_path):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+
+    _, batches = duckdb_processor.iter_plain_diff(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    )
+    assert sum(batch.num_rows for batch in batches) == 1
+
+    for path in [tmp_path / "diff.parquet", tmp_path / "diff.csv"]:
+        total_rows = duckdb_processor.export_plain_diff(
+            str(path), selected_columns=["B", "C"], common_table_schema=common_table_schema
+        )
+        assert total_rows == 1
+
+    assert pd.read_parquet(tmp_path / "diff.parquet")["A"].tolist() == [2]
+    assert pd.read_csv(tmp_path / "diff.csv")["B__2"].tolist() == [21]
+
+
+def test_duckdb_processor_stream_exclusive_primary_keys(duckdb_processor: DuckDBProcessor):
+    batches = list(duckdb_processor.iter_exclusive_primary_keys(exclusive_to="table2"))
+
+    assert [key for batch in batches for key in batch.column("A").to_pylist()] == [5]
+
+
+def test_duckdb_processor_exclusive_primary_keys_without_exclusive_rows(duckdb_processor: DuckDBProcessor):
+    duckdb_processor.client.register_dataframe("table_b", TABLE_1)
+
+    df_exclusive_table1, df_exclusive_table2 = duckdb_processor.run_query_exclusive_primary_keys(limit=1)
+
+    assert df_exclusive_table1.empty
+    assert df_exclusive_table2.index.name == "A"
+
+
+def test_duckdb_processor_keyset_pagination():
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "diff",
+        pd.DataFrame({"A": [1, 2, 3, 4, 5], "B": [30, None, 10, 30, 20]}),
+    )
+    processor = DuckDBProcessor("diff", "diff", client=client)
+    processor.set_config_data(
+        primary_key="A", columns_to_compare=["B"], sampling_rate=100
+    )
+
+    assert processor.count_rows("diff") == 5
+
+    pages, cursor = [], None
+    for _ in range(3):
+        page = processor.get_page("diff", page_size=2, sort_column="B", cursor=cursor)
+        pages.append(page.rows["A"].tolist())
+        cursor = page.next_cursor
+    assert pages == [[3, 5], [1, 4], [2]]
+    assert cursor is None
+
+    # Reading at an offset gives the same page as seeking from a cursor
+    page = processor.get_page("diff", page_size=2, sort_column="B", offset=2)
+    assert page.rows["A"].tolist() == [1, 4]
+
+    page = processor.get_page("diff", page_size=2, ascending=False)
+    assert page.rows["A"].tolist() == [5, 4]
+    page = processor.get_page(
+        "diff", page_size=2, ascending=False, cursor=page.next_cursor
+    )
+    assert page.rows["A"].tolist() == [3, 2]
+
+
+def test_duckdb_processor_materialize_plain_diff(duckdb_processor: DuckDBProcessor):
+    common_table_schema = duckdb_processor.get_common_schema_from_tables()
+    query = duckdb_processor.get_query_plain_diff(
+        selected_columns=["B", "C"], common_table_schema=common_table_schema
+    )
+
+    table = duckdb_processor.materialize_query(query)
+
+    assert duckdb_processor.count_rows(table) == 1
+    page = duckdb_processor.get_page(table, page_size=10)
+    assert page.rows["A"].tolist() == [2]
+    assert page.next_cursor is None
+
+
+def test_duckdb_processor_sort_page_by_diff_column():
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "table_a", pd.DataFrame({"A": [1, 2, 3], "B": [10, 20, 30], "L": [[1], [2], [3]]})
+    )
+    client.register_dataframe(
+        "table_b", pd.DataFrame({"A": [1, 2, 3], "B": [11, 5, 31], "L": [[1], [2], [3]]})
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["B", "L"], sampling_rate=100)
+    query = processor.get_query_plain_diff(
+        selected_columns=["B", "L"],
+        common_table_schema=processor.get_common_schema_from_tables(),
+    )
+    table = processor.materialize_query(query)
+
+    sort_columns = processor.get_sort_columns(table)
+    page = processor.get_page(table, page_size=10, sort_column="B__2", ascending=False)
+
+    assert sort_columns == ["A", "B__1", "B__2"]
+    assert page.rows["A"].tolist() == [3, 1, 2]
+
+
+class PartitionedQueryDuckDB(QueryDuckDB):
+    """Tables partitioned by day on column D, with partitions last modification set by the tests"""
+
+    def __init__(self):
+        super().__init__()
+        self.partitions = {}
+
+    def get_table_time_partitioning(self, table: str) -> TimePartitioning:
+        return TimePartitioning(column="D", partition_type="DAY", field_type="DATE")
+
+    def get_table_partitions(self, table: str) -> pd.DataFrame:
+        return self.partitions[table]
+
+
+def test_duckdb_processor_incremental_partition_checksums(tmp_path):
+    dates = pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]).date
+    client = PartitionedQueryDuckDB()
+    client.register_dataframe("table_a", pd.DataFrame({"A": [1, 2, 3], "D": dates, "B": [10, 20, 30]}))
+    client.register_dataframe("table_b", pd.DataFrame({"A": [1, 2, 3], "D": dates, "B": [10, 21, 30]}))
+    partitions = pd.DataFrame(
+        {"partition_id": ["20240101", "20240102", "20240103"], "last_modified_time": ["t0", "t0", "t0"]}
+    )
+    client.partitions = {"table_a": partitions, "table_b": partitions.copy()}
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["B"], sampling_rate=100)
+    common_table_schema = processor.get_common_schema_from_tables()
+    store = PartitionChecksumStore(tmp_path / "partitions.json")
+
+    df, scanned = processor.get_partition_checksums(["A", "B"], common_table_schema, store)
+    assert scanned == ["20240101", "20240102", "20240103"]
+    assert df.set_index("partition_id")["is_different"].to_dict() == {
+        "20240101": False,
+        "20240102": True,
+        "20240103": False,
+    }
+
+    df_again, scanned = processor.get_partition_checksums(["A", "B"], common_table_schema, store)
+    assert scanned == []
+    pd.testing.assert_frame_equal(df_again, df)
+
+    client.register_dataframe("table_b", pd.DataFrame({"A": [1, 2, 3], "D": dates, "B": [11, 21, 30]}))
+    client.partitions["table_b"] = partitions.assign(last_modified_time=["t1", "t0", "t0"])
+    df, scanned = processor.get_partition_checksums(["A", "B"], common_table_schema, store)
+    assert scanned == ["20240101"]
+    assert df[df["is_different"]]["partition_id"].tolist() == ["20240101", "20240102"]
+
+    query = processor.get_query_plain_diff_partitions(
+        common_table_schema=TableSchema(table_name="common", columns=[common_table_schema.get_column("B")]),
+        partitioning=processor.get_time_partitioning(),
+        partition_ids=["20240102"],
+    )
+    assert client.run_query_to_dataframe(query)["A"].tolist() == [2]
+
+
+def test_duckdb_processor_composite_primary_key():
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "table_a",
+        pd.DataFrame({"K1": [1, 1, 2, 2], "K2": ["x", "y", "x", None], "B": [10, 20, 30, 40]}),
+    )
+    client.register_dataframe(
+        "table_b",
+        pd.DataFrame({"K1": [1, 1, 2, 3], "K2": ["x", "y", "x", "x"], "B": [10, 21, 30, 50]}),
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key=["K1", "K2"], columns_to_compare=["B"], sampling_rate=100)
+    common_table_schema = processor.get_common_schema_from_tables()
+
+    health_check = processor.run_health_check(
+        selected_columns=["B"], common_table_schema=common_table_schema
+    )
+    _, plain_diff = processor.get_plain_diff(
+        selected_columns=["B"], common_table_schema=common_table_schema
+    )
+    _, bisection_diff = processor.get_bisection_diff(
+        selected_columns=["B"],
+        common_table_schema=common_table_schema,
+        segments_per_level=2,
+        max_rows=1,
+    )
+    exclusive_table1, exclusive_table2 = processor.run_query_exclusive_primary_keys()
+
+    assert health_check.primary_keys_unique
+    assert health_check.primary_keys["total_rows"].iloc[0] == 5
+    assert health_check.primary_keys["missing_primary_keys_ratio"].iloc[0] == 0.4
+    assert plain_diff[["K1", "K2", "B__1", "B__2"]].values.tolist() == [[1, "y", 20, 21]]
+    assert bisection_diff[["K1", "K2"]].values.tolist() == [[1, "y"]]
+    assert exclusive_table1.index.names == ["K1", "K2"]
+    assert exclusive_table1.index.get_level_values("K1").tolist() == [2]
+    assert exclusive_table2.index.tolist() == [(3, "x")]
+
+
+def test_duckdb_processor_composite_primary_key_duplicates():
+    client = QueryDuckDB()
+    table = pd.DataFrame({"K1": [1, 1, 1], "K2": ["x", "y", "y"], "B": [1, 2, 3]})
+    client.register_dataframe("table_a", table)
+    client.register_dataframe("table_b", table)
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key=["K1", "K2"], columns_to_compare=["B"], sampling_rate=100)
+
+    health_check = processor.run_health_check(
+        selected_columns=["B"], common_table_schema=processor.get_common_schema_from_tables()
+    )
+
+    assert health_check.duplicated_keys_table1 == 1
+    assert [json.loads(key) for key in health_check.duplicated_keys_sample_table1] == [
+        {"K1": 1, "K2": "y"}
+    ]
+
+
+def test_duckdb_processor_native_comparisons():
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "table_a",
+        pd.DataFrame({"A": [1, 2, 3], "S": ["none", None, "x"], "N": [1, 2, 3]}),
+    )
+    client.register_dataframe(
+        "table_b",
+        pd.DataFrame({"A": [1, 2, 3], "S": [None, None, "x"], "N": ["1", "2", "4"]}),
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["S", "N"], sampling_rate=100)
+    common_table_schema = processor.get_common_schema_from_tables()
+
+    _, plain_diff = processor.get_plain_diff(
+        selected_columns=["S", "N"], common_table_schema=common_table_schema
+    )
+    ratios = processor.get_column_diff_ratios(
+        selected_columns=["S", "N"], common_table_schema=common_table_schema
+    )
+
+    # The string 'none' is different from NULL, NULL values are equal to each other
+    assert plain_diff.set_index("A")[["S__diff", "N__diff"]].to_dict("index") == {
+        1: {"S__diff": True, "N__diff": False},
+        3: {"S__diff": False, "N__diff": True},
+    }
+    # Columns of different types are compared as strings
+    assert common_table_schema.get_column("N").field_type == "ANY"
+    assert ratios.set_index("column")["ratio_equal"].to_dict() == {
+        "S": 0.5,
+        "N": pytest.approx(2 / 3),
+    }
+
+
+def test_duckdb_processor_comparison_tolerance():
+    client = QueryDuckDB()
+    client.register_dataframe(
+        "table_a",
+        pd.DataFrame(
+            {
+                "A": [1, 2, 3],
+                "F": [1.0, 2.0, None],
+                "S": ["Paris", "Lyon", "Nice"],
+                "T": pd.to_datetime(["2024-01-01 10:00:00.1", "2024-01-01 10:00:00.0", "2024-01-01 00:00:00.0"]),
+            }
+        ),
+    )
+    client.register_dataframe(
+        "table_b",
+        pd.DataFrame(
+            {
+                "A": [1, 2, 3],
+                "F": [1.0005, 2.1, 3.0],
+                "S": ["paris", "Lyon", "Nice"],
+                "T": pd.to_datetime(["2024-01-01 10:00:00.9", "2024-01-01 10:00:01.0", "2024-01-01 00:00:00.0"]),
+            }
+        ),
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    columns = ["F", "S", "T"]
+    common_table_schema = processor.get_common_schema_from_tables()
+
+    processor.set_config_data(primary_key="A", columns_to_compare=columns, sampling_rate=100)
+    _, exact_diff = processor.get_plain_diff(
+        selected_columns=columns, common_table_schema=common_table_schema
+    )
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=columns,
+        sampling_rate=100,
+        tolerance=ComparisonTolerance(
+            float_epsilon=0.001, timestamp_truncation="second", case_insensitive_strings=True
+        ),
+    )
+    _, tolerant_diff = processor.get_plain_diff(
+        selected_columns=columns, common_table_schema=common_table_schema
+    )
+    _, tolerant_fingerprints_diff = processor.get_plain_diff(
+        selected_columns=columns,
+        common_table_schema=common_table_schema,
+        use_fingerprints=True,
+    )
+
+    assert exact_diff["A"].tolist() == [1, 2, 3]
+    assert tolerant_diff.set_index("A")[["F__diff", "S__diff", "T__diff"]].to_dict("index") == {
+        2: {"F__diff": True, "S__diff": False, "T__diff": True},
+        3: {"F__diff": True, "S__diff": False, "T__diff": False},
+    }
+    assert tolerant_fingerprints_diff["A"].tolist() == [2, 3]
+
+
+def test_duckdb_processor_compares_arrays_and_structs_by_fingerprint():
+    client = QueryDuckDB()
+    client.client.execute(
+        "create table table_a as select * from (values"
+        " (1, [1, 2, 3], {'x': 1, 'y': 'a'}),"
+        " (2, [1, 2], {'x': 2, 'y': 'b'}),"
+        " (3, [1, 1, 2], {'x': 3, 'y': 'c'})"
+        ") as t(A, L, S)"
+    )
+    client.client.execute(
+        "create table table_b as select * from (values"
+        " (1, [3, 1, 2], {'x': 1, 'y': 'a'}),"
+        " (2, [1, 2], {'x': 2, 'y': 'B'}),"
+        " (3, [1, 2, 2], {'x': 3, 'y': 'c'})"
+        ") as t(A, L, S)"
+    )
+    processor = DuckDBProcessor("table_a", "table_b", client=client)
+    processor.set_config_data(primary_key="A", columns_to_compare=["L", "S"], sampling_rate=100)
+    common_table_schema = processor.get_common_schema_from_tables()
+
+    _, plain_diff = processor.get_plain_diff(
+        selected_columns=["L", "S"], common_table_schema=common_table_schema
+    )
+    health_check = processor.run_health_check(
+        selected_columns=["L", "S"], common_table_schema=common_table_schema
+    )
+
+    # Arrays are equal whatever the order of their elements, not whatever their duplicates
+    assert plain_diff.set_index("A")[["L__diff", "S__diff"]].to_dict("index") == {
+        2: {"L__diff": False, "S__diff": True},
+        3: {"L__diff": True, "S__diff": False},
+    }
+    assert health_check.column_ratios.set_index("column")["ratio_equal"].to_dict() == {
+        "L": pytest.approx(2 / 3),
+        "S": pytest.approx(2 / 3),
+    }
+    assert processor.get_schema_warnings() == []
+
+    processor.set_config_data(
+        primary_key="A",
+        columns_to_compare=["L"],
+        sampling_rate=100,
+        tolerance=ComparisonTolerance(ignore_array_duplicates=True),
+    )
+    _, plain_diff = processor.get_plain_diff(
+        selected_columns=["L"], common_table_schema=common_table_schema
+    )
+    assert plain_diff.empty
@@ -0,0 +1,103 @@
+import json
+
+import pandas as pd
+import pytest
+
+from data_check.batch import get_diff_configs, load_manifest, main
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    pd.DataFrame({"A": [1, 2, 3], "B": [10, 20, 30]}).to_parquet(tmp_path / "users_1.parquet")
+    pd.DataFrame({"A": [1, 2, 4], "B": [10, 21, 40]}).to_parquet(tmp_path / "users_2.parquet")
+    manifest = {
+        "max_workers": 2,
+        "defaults": {"engine": "duckdb", "primary_key": "A"},
+        "diffs": [
+            {"name": "same", "table1": str(tmp_path / "users_1.parquet"), "table2": str(tmp_path / "users_1.parquet")},
+            {"name": "different", "table1": str(tmp_path / "users_1.parquet"), "table2": str(tmp_path / "users_2.parquet")},
+            {"name": "missing", "table1": str(tmp_path / "users_1.parquet"), "table2": "missing_table"},
+        ],
+    }
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest))
+    return path
+
+
+def test_batch_writes_reports(manifest_path, tmp_path):
+    output_dir = tmp_path / "reports"
+
+    exit_code = main([str(manifest_path), "--output-dir", str(output_dir)])
+
+    assert exit_code == 1
+    summary = json.loads((output_dir / "summary.json").read_text())
+    assert [(report["name"], report["status"]) for report in summary] == [
+        ("same", "ok"),
+        ("different", "ok"),
+        ("missing", "error"),
+    ]
+    report = json.loads((output_dir / "different.json").read_text())
+    assert report["columns"] == ["B"]
+    assert report["key_insight"]["missing_primary_keys_ratio"] == 0.5
+    assert report["differing_columns"] == ["B"]
+    assert [row["A"] for row in report["sample_diff"]] == [2]
+    assert json.loads((output_dir / "same.json").read_text())["has_differences"] is False
+
+
+def test_batch_exports_differing_rows(manifest_path, tmp_path):
+    output_dir = tmp_path / "reports"
+
+    main([str(manifest_path), "--output-dir", str(output_dir), "--export-format", "csv"])
+
+    report = json.loads((output_dir / "different.json").read_text())
+    assert report["exported_rows"] == 1
+    assert pd.read_csv(report["export_path"])["B__2"].tolist() == [21]
+    assert [row["A"] for row in report["sample_diff"]] == [2]
+    assert not (output_dir / "same.csv").exists()
+
+
+def test_batch_empty_tables(tmp_path):
+    pd.DataFrame({"A": pd.Series([], dtype="int64"), "B": pd.Series([], dtype="int64")}).to_parquet(
+        tmp_path / "empty.parquet"
+    )
+    manifest_path = tmp_path / "manifest.json"
+    manifest_path.write_text(json.dumps({
+        "defaults": {"engine": "duckdb", "primary_key": "A"},
+        "diffs": [{"name": "empty", "table1": str(tmp_path / "empty.parquet"), "table2": str(tmp_path / "empty.parquet")}],
+    }))
+
+    exit_code = main([str(manifest_path), "--output-dir", str(tmp_path / "reports"), "--fail-on-diff"])
+
+    report = json.loads((tmp_path / "reports" / "empty.json").read_text())
+    assert (report["status"], report["has_differences"]) == ("ok", False)
+    assert exit_code == 0
+
+
+def test_batch_reports_unknown_columns(manifest_path, tmp_path):
+    manifest = json.loads(manifest_path.read_text())
+    manifest["diffs"] = [{**manifest["diffs"][1], "columns": ["B", "D"]}]
+    manifest_path.write_text(json.dumps(manifest))
+
+    main([str(manifest_path), "--output-dir", str(tmp_path / "reports")])
+
+    report = json.loads((tmp_path / "reports" / "different.json").read_text())
+    assert report["status"] == "error"
+    assert report["error"] == "ValueError: Columns not found in both tables: D"
+
+
+def test_get_diff_configs_rejects_unknown_keys():
+    with pytest.raises(ValueError, match="Unknown keys for diff users: primary_keys"):
+        get_diff_configs({"diffs": [{"name": "users", "table1": "a", "table2": "b", "primary_keys": "id"}]})
+
+
+def test_load_yaml_manifest(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "manifest.yml"
+    path.write_text("diffs:\n  - table1: a\n    table2: b\n    primary_key: id\n")
+
+    configs = get_diff_configs(load_manifest(str(path)))
+
+    assert configs[0].name == "a vs b"
+    assert configs[0].sampling_rate == 100
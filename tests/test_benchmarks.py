@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("duckdb")
+
+from benchmarks.pipeline import main, run_benchmark  # noqa: E402
+from benchmarks.synthetic import SyntheticTables  # noqa: E402
+from data_check.query.query_duckdb import QueryDuckDB  # noqa: E402
+
+
+def test_synthetic_tables_diff_rate():
+    client = QueryDuckDB()
+    tables = SyntheticTables(rows=10_000, columns=5, diff_rate=0.1)
+    tables.create(client)
+    (changed_rows,) = client.client.execute(
+        "select count(*) from table_a join table_b using (id)"
+        " where table_a.integer_0 != table_b.integer_0"
+    ).fetchone()
+    assert 800 < changed_rows < 1200
+
+
+def test_run_benchmark_times_each_stage():
+    results = run_benchmark(rows=1000, columns=5, diff_rate=0.01)
+    assert [result["stage"] for result in results] == [
+        "table generation",
+        "schema diff",
+        "query generation",
+        "health check",
+        "ratios",
+        "plain diff",
+        "formatting",
+    ]
+    assert all(result["seconds"] >= 0 for result in results)
+
+
+def test_main_writes_results(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--rows", "100", "--columns", "2", "--output", str(output)])
+    assert output.exists()
+
+
+def test_query_generation_benchmark():
+    from benchmarks.query_generation import run_benchmark as run_query_generation_benchmark
+
+    results = run_query_generation_benchmark(columns=20)
+    assert [result["run"] for result in results] == ["cold", "memoized"]
+
+
+def test_comparison_benchmark():
+    from benchmarks.comparison import run_benchmark as run_comparison_benchmark
+
+    results = run_comparison_benchmark(rows=1000, columns=7, diff_rate=0.1)
+    assert [(result["comparison"], result["stage"]) for result in results] == [
+        ("strings", "ratios"),
+        ("strings", "plain diff"),
+        ("native", "ratios"),
+        ("native", "plain diff"),
+    ]
@@ -1,3 +1,13 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import bigquery
+from sqlglot import parse_one
+
+from data_check.cache import TTLCache
+from data_check.query.budget import BudgetExceededError, BytesBudget
 from data_check.query.query_bq import QueryBigQuery
 
 
@@ -9,3 +19,94 @@ def test_bigquery_query_timeout():
     )
 
     assert df.shape[0] == 1000
+
+
+@pytest.fixture
+def anonymous_client(monkeypatch) -> bigquery.Client:
+    """BigQuery client without credentials, API calls are faked by the tests using it"""
+    client = bigquery.Client(credentials=AnonymousCredentials(), project="my-project")
+    monkeypatch.setattr(QueryBigQuery, "init_client", lambda self: client)
+    return client
+
+
+def test_get_table_schema_from_sql_uses_cached_dry_run(monkeypatch, anonymous_client):
+    client = QueryBigQuery(schema_cache=TTLCache())
+    job_configs = []
+
+    def fake_query(query, job_config=None):
+        job_configs.append(job_config)
+        return SimpleNamespace(schema=[bigquery.SchemaField("A", "INTEGER")])
+
+    monkeypatch.setattr(client.client, "query", fake_query)
+
+    query = parse_one("select A from `my-project.my_dataset.table1`", dialect="bigquery")
+    schema = client.get_table_schema_from_sql(query)
+    client.get_table_schema_from_sql(
+        parse_one("SELECT A\n  FROM `my-project.my_dataset.table1`", dialect="bigquery")
+    )
+
+    assert schema.columns_names == ["A"]
+    assert len(job_configs) == 1
+    assert job_configs[0].dry_run
+
+
+def test_get_table_schema_from_table_is_cached(monkeypatch, anonymous_client):
+    client = QueryBigQuery(schema_cache=TTLCache())
+    tables = []
+
+    def fake_get_table(table):
+        tables.append(table)
+        return SimpleNamespace(table_id="table1", schema=[bigquery.SchemaField("A", "INTEGER")])
+
+    monkeypatch.setattr(client.client, "get_table", fake_get_table)
+
+    client.get_table_schema_from_table("my-project.my_dataset.table1")
+    client.get_table_schema_from_table("my-project.my_dataset.table1")
+
+    assert tables == ["my-project.my_dataset.table1"]
+
+
+def test_run_query_to_dataframe_refuses_queries_above_budget(monkeypatch, anonymous_client):
+    client = QueryBigQuery(budget=BytesBudget(max_bytes_per_query=1000, max_bytes_per_diff=1500))
+    monkeypatch.setattr(client, "_estimate_query_bytes", lambda query: 800)
+    monkeypatch.setattr(client, "_run_query_to_dataframe", lambda query, timeout_seconds: pd.DataFrame())
+
+    client.run_query_to_dataframe(parse_one("select 1"))
+    with pytest.raises(BudgetExceededError, match="limit per diff"):
+        client.run_query_to_dataframe(parse_one("select 2"))
+
+    monkeypatch.setattr(client, "_estimate_query_bytes", lambda query: 2000)
+    with pytest.raises(BudgetExceededError, match="limit per query"):
+        client.run_query_to_dataframe(parse_one("select 3"))
+
+    assert client.budget.bytes_spent == 800
+
+
+def test_diff_deadline_is_anchored_to_the_start_of_the_diff(anonymous_client):
+    client = QueryBigQuery(diff_timeout_seconds=60, diff_started_at=100)
+
+    assert client.diff_deadline == 160
+
+
+def test_get_table_partitions_runs_within_the_budget(monkeypatch, anonymous_client):
+    client = QueryBigQuery(budget=BytesBudget(max_bytes_per_diff=1000))
+    queries = []
+    monkeypatch.setattr(
+        client,
+        "get_table",
+        lambda table: SimpleNamespace(project="my-project", dataset_id="my_dataset", table_id="table1"),
+    )
+    monkeypatch.setattr(client, "_estimate_query_bytes", lambda query: 100)
+    monkeypatch.setattr(
+        client,
+        "_run_query_to_dataframe",
+        lambda query, timeout_seconds: queries.append(query) or pd.DataFrame(),
+    )
+
+    client.get_table_partitions("my-project.my_dataset.table1")
+
+    assert queries == [
+        "SELECT partition_id, CAST(last_modified_time AS STRING) AS last_modified_time"
+        " FROM `my-project`.my_dataset.INFORMATION_SCHEMA.PARTITIONS WHERE table_name = 'table1'"
+    ]
+    assert client.budget.bytes_spent == 100
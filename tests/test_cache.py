@@ -0,0 +1,107 @@
+from sqlglot import select
+
+from data_check.cache import (StageResultStore, TTLCache, get_query_sql,
+                              memoize_query)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl_seconds=60, clock=clock)
+    cache.set("A", 1)
+
+    clock.now = 59
+    assert cache.get("A") == 1
+
+    clock.now = 61
+    assert cache.get("A") is None
+    assert "A" not in cache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("A", 1)
+    cache.set("B", 2)
+    cache.get("A")
+    cache.set("C", 3)
+
+    assert "A" in cache
+    assert "B" not in cache
+    assert "C" in cache
+
+
+def test_ttl_cache_get_or_set():
+    cache = TTLCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_set("A", compute) == "value"
+    assert cache.get_or_set("A", compute) == "value"
+    assert len(calls) == 1
+
+
+class FakeProcessor:
+    def get_query_cache_key(self):
+        return "fake processor"
+
+    @memoize_query
+    def get_query(self, table: str):
+        return select("a").from_(table)
+
+
+def test_get_query_sql_is_memoized_for_memoized_queries():
+    query = FakeProcessor().get_query("table1")
+
+    assert get_query_sql(query, "bigquery") == "SELECT a FROM table1"
+    assert get_query_sql(query, "bigquery") is get_query_sql(query, "bigquery")
+    assert get_query_sql(query.limit(1), "bigquery") == "SELECT a FROM table1 LIMIT 1"
+
+
+def test_get_query_sql_of_other_queries_is_not_stale():
+    query = select("a").from_("table1")
+
+    assert get_query_sql(query, "bigquery") == "SELECT a FROM table1"
+    query.where("a > 1", copy=False)
+    assert get_query_sql(query, "bigquery") == "SELECT a FROM table1 WHERE a > 1"
+
+
+def test_stage_result_store_runs_each_stage_once():
+    store = StageResultStore()
+    runs = []
+
+    def run():
+        runs.append(1)
+        return len(runs)
+
+    assert store.get_or_run("health check", "config", run, columns=["A"]) == 1
+    assert store.get_or_run("health check", "config", run, columns=["A"]) == 1
+    assert store.get_or_run("health check", "config", run, columns=["B"]) == 2
+    assert store.get_or_run("health check", "other config", run, columns=["A"]) == 3
+    assert len(runs) == 3
+
+
+def test_stage_result_store_invalidate():
+    store = StageResultStore()
+    for stage in ["schemas", "health check", "diff page"]:
+        store.get_or_run(stage, "config", lambda: stage)
+
+    store.invalidate("diff page")
+    assert "diff page" not in store
+    assert "health check" in store
+
+    store.invalidate(keep=["schemas"])
+    assert "schemas" in store
+    assert "health check" not in store
+
+    store.invalidate()
+    assert "schemas" not in store
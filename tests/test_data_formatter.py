@@ -0,0 +1,29 @@
+import pandas as pd
+
+from data_check.data_formatter import DIFF_COLOR, highlight_diff_dataset
+
+
+def test_highlight_diff_dataset_uses_diff_flags():
+    data = pd.DataFrame(
+        {
+            "A": [1, 2],
+            "B__1": [10, None],
+            "B__2": [10, 20],
+            "C__1": ["a", "b"],
+            "C__2": ["a", "c"],
+            "B__diff": [False, True],
+            "C__diff": [False, None],
+        }
+    )
+
+    styler = highlight_diff_dataset(data, columns=["B", "C"])
+    styler._compute()
+
+    assert list(styler.data.columns) == ["A", "B__1", "B__2", "C__1", "C__2"]
+    highlighted = {
+        (row, styler.data.columns[col])
+        for (row, col), css in styler.ctx.items()
+        if css
+    }
+    assert highlighted == {(1, "B__1"), (1, "B__2")}
+    assert styler.ctx[(1, 1)] == [tuple(DIFF_COLOR.split(": "))]
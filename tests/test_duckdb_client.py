@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from sqlglot import parse_one
+
+pytest.importorskip("duckdb")
+
+from data_check.query.query_duckdb import QueryDuckDB  # noqa: E402
+
+
+def test_duckdb_run_query_to_dataframe():
+    client = QueryDuckDB()
+    client.register_dataframe("my_table", pd.DataFrame({"A": [1, 2, 3]}))
+
+    df = client.run_query_to_dataframe(
+        parse_one("select countif(A > 1) as total_rows from my_table", dialect="bigquery")
+    )
+
+    assert df["total_rows"].iloc[0] == 2
+
+
+def test_duckdb_get_table_schema_from_sql():
+    client = QueryDuckDB()
+    schema = client.get_table_schema_from_sql(
+        parse_one("select 1 as A, 'a' as B, [cast(1.5 as float64)] as C, struct(1 as x) as D", dialect="bigquery")
+    )
+
+    assert [(column.name, column.field_type, column.mode) for column in schema.columns] == [
+        ("A", "INTEGER", "NULLABLE"),
+        ("B", "STRING", "NULLABLE"),
+        ("C", "FLOAT", "REPEATED"),
+        ("D", "RECORD", "NULLABLE"),
+    ]
+
+
+def test_duckdb_register_file(tmp_path):
+    path = tmp_path / "my-table.csv"
+    pd.DataFrame({"A": [1, 2], "B": ["x", "y"]}).to_csv(path, index=False)
+
+    client = QueryDuckDB()
+    name = client.register_file(str(path))
+
+    assert name == "my_table"
+    assert client.get_table_schema_from_table(name).columns_names == ["A", "B"]
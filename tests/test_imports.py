@@ -0,0 +1,46 @@
+import json
+import subprocess
+import sys
+
+# Modules of the core library, usable without the Streamlit app
+CORE_MODULES = [
+    "data_check.batch",
+    "data_check.data_formatter",
+    "data_check.data_processor",
+    "data_check.processors.bigquery",
+    "data_check.processors.duckdb",
+    "data_check.query.query_bq",
+    "data_check.query.result_cache",
+]
+UI_MODULES = ["streamlit", "seaborn", "matplotlib"]
+
+# Generous bound, importing the core library used to take seconds because of Streamlit
+MAX_IMPORT_SECONDS = 3
+
+
+def import_in_subprocess(modules):
+    """Import modules in a fresh interpreter, returns the loaded modules and the import time"""
+    code = f"""
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_core_modules_do_not_import_ui_dependencies():
+    result = import_in_subprocess(CORE_MODULES)
+
+    assert [module for module in UI_MODULES if module in result["modules"]] == []
+    assert result["seconds"] < MAX_IMPORT_SECONDS
+
+
+def test_processors_do_not_import_bigquery_client():
+    result = import_in_subprocess(["data_check.processors.bigquery"])
+
+    assert "google.cloud.bigquery" not in result["modules"]
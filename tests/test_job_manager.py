@@ -0,0 +1,199 @@
+import threading
+from concurrent.futures import CancelledError, Future
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions
+
+from data_check.query.job_manager import BigQueryJobManager, is_transient_error
+from data_check.tools import wait_for_results
+
+job_ids = count()
+
+
+class FakeQueryJob:
+    def __init__(self, sql: str, polls_to_finish: int = 1, error_result=None):
+        self.sql = sql
+        self.job_id = f"job_{next(job_ids)}"
+        self.location = "EU"
+        self.polls_to_finish = polls_to_finish
+        self.error_result = None
+        self.errors = None
+        self._error_result = error_result
+
+    def done(self):
+        self.polls_to_finish -= 1
+        if self.polls_to_finish > 0:
+            return False
+        if self._error_result:
+            self.error_result = self._error_result
+            self.errors = [self._error_result]
+        return True
+
+
+class FakeBigQueryClient:
+    """Starts the jobs given by `jobs(sql, attempt)`, and records the cancelled jobs"""
+
+    def __init__(self, jobs=lambda sql, attempt: FakeQueryJob(sql)):
+        self.jobs = jobs
+        self.started = []
+        self.cancelled = []
+
+    def query(self, sql, job_config=None):
+        job = self.jobs(sql, len([job for job in self.started if job.sql == sql]))
+        self.started.append(job)
+        return job
+
+    def cancel_job(self, job_id, location=None):
+        self.cancelled.append(job_id)
+        return SimpleNamespace(job_id=job_id, slot_millis=1500)
+
+
+def test_jobs_are_polled_by_a_single_thread():
+    client = FakeBigQueryClient(jobs=lambda sql, attempt: FakeQueryJob(sql, polls_to_finish=3))
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01)
+    threads = threading.active_count()
+
+    futures = [manager.submit(f"select {index}") for index in range(50)]
+
+    assert threading.active_count() <= threads + 1
+    assert [future.result(timeout=5).sql for future in futures] == [
+        f"select {index}" for index in range(50)
+    ]
+
+
+def test_transient_errors_are_retried():
+    client = FakeBigQueryClient(
+        jobs=lambda sql, attempt: FakeQueryJob(
+            sql, error_result={"reason": "backendError", "message": "Retry"} if attempt < 2 else None
+        )
+    )
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01, backoff_seconds=0.01)
+
+    job = manager.submit("select 1").result(timeout=5)
+
+    assert job is client.started[-1]
+    assert len(client.started) == 3
+
+
+def test_errors_fail_after_max_attempts():
+    error_result = {"reason": "backendError", "message": "Retry"}
+    client = FakeBigQueryClient(
+        jobs=lambda sql, attempt: FakeQueryJob(sql, error_result=error_result)
+    )
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01, backoff_seconds=0, max_attempts=2)
+
+    with pytest.raises(exceptions.InternalServerError, match="Retry"):
+        manager.submit("select 1").result(timeout=5)
+    assert len(client.started) == 2
+
+
+def test_invalid_queries_are_not_retried():
+    client = FakeBigQueryClient(
+        jobs=lambda sql, attempt: FakeQueryJob(
+            sql, error_result={"reason": "invalidQuery", "message": "Syntax error"}
+        )
+    )
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01, backoff_seconds=0)
+
+    with pytest.raises(exceptions.BadRequest, match="Syntax error"):
+        manager.submit("select").result(timeout=5)
+    assert len(client.started) == 1
+
+
+def test_jobs_are_cancelled_past_their_deadline():
+    client = FakeBigQueryClient(jobs=lambda sql, attempt: FakeQueryJob(sql, polls_to_finish=10**9))
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01)
+
+    late = manager.submit("select 1", timeout_seconds=0.05)
+    diff_deadline = manager.submit(
+        "select 2", timeout_seconds=60, deadline=manager.clock() + 0.05
+    )
+
+    for future in (late, diff_deadline):
+        with pytest.raises(TimeoutError):
+            future.result(timeout=5)
+    assert sorted(client.cancelled) == sorted(job.job_id for job in client.started)
+
+
+def test_cancelled_futures_cancel_their_job():
+    client = FakeBigQueryClient(jobs=lambda sql, attempt: FakeQueryJob(sql, polls_to_finish=10**9))
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01)
+
+    future = manager.submit("select 1")
+    assert future.cancel()
+    manager.poll()
+
+    assert set(client.cancelled) == {client.started[0].job_id}
+    assert len(manager) == 0
+
+
+def test_is_transient_error():
+    assert is_transient_error(exceptions.ServiceUnavailable("Unavailable"))
+    assert is_transient_error(
+        exceptions.Forbidden("Quota", errors=[{"reason": "rateLimitExceeded"}])
+    )
+    assert not is_transient_error(
+        exceptions.Forbidden("Denied", errors=[{"reason": "accessDenied"}])
+    )
+    assert not is_transient_error(ValueError())
+
+
+def test_superseded_jobs_are_cancelled_and_reported():
+    client = FakeBigQueryClient(jobs=lambda sql, attempt: FakeQueryJob(sql, polls_to_finish=10**9))
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01)
+
+    old = manager.submit("select 1", scope=("session", "config 1"))
+    other_session = manager.submit("select 2", scope=("other session", "config 1"))
+    current = manager.submit("select 3", scope=("session", "config 2"))
+    manager.cancel_jobs(lambda scope: scope[0] == "session" and scope[1] != "config 2")
+
+    with pytest.raises(CancelledError):
+        old.result(timeout=5)
+    assert not other_session.done() and not current.done()
+    assert manager.count_jobs(lambda scope: scope[0] == "session") == 1
+
+    cancelled_jobs = manager.get_cancelled_jobs(lambda scope: scope[0] == "session")
+    assert [(job.job_id, job.reason, job.slot_millis) for job in cancelled_jobs] == [
+        (client.started[0].job_id, "superseded", 1500)
+    ]
+    assert manager.get_cancelled_jobs(lambda scope: scope[0] == "other session") == []
+
+
+def test_interrupted_wait_cancels_futures():
+    futures = [Future(), Future()]
+
+    def on_wait():
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        wait_for_results(futures, on_wait=on_wait, interval_seconds=0.01)
+    assert all(future.cancelled() for future in futures)
+
+
+def test_unexpected_errors_do_not_stop_the_poller():
+    class FailingQueryJob(FakeQueryJob):
+        def done(self):
+            raise RuntimeError("Unexpected")
+
+    class FailingCancelClient(FakeBigQueryClient):
+        def cancel_job(self, job_id, location=None):
+            raise exceptions.RetryError("Deadline exceeded", cause=None)
+
+    client = FailingCancelClient(
+        jobs=lambda sql, attempt: {
+            "select 1": FailingQueryJob(sql),
+            "select 2": FakeQueryJob(sql, polls_to_finish=10**9),
+        }.get(sql, FakeQueryJob(sql))
+    )
+    manager = BigQueryJobManager(client, poll_interval_seconds=0.01)
+
+    failing = manager.submit("select 1")
+    late = manager.submit("select 2", timeout_seconds=0.05)
+
+    with pytest.raises(RuntimeError, match="Unexpected"):
+        failing.result(timeout=5)
+    with pytest.raises(TimeoutError):
+        late.result(timeout=5)
+    assert manager.submit("select 3").result(timeout=5).sql == "select 3"
@@ -0,0 +1,18 @@
+from data_check.models.partition import TimePartitioning
+
+
+def test_get_query_partitions_filter():
+    partitioning = TimePartitioning(column="created_at", partition_type="MONTH", field_type="TIMESTAMP")
+
+    assert partitioning.get_query_partitions_filter(["202412", "__NULL__"], prefix="t.") == (
+        "(t.created_at >= timestamp '2024-12-01 00:00:00' and t.created_at < timestamp '2025-01-01 00:00:00')"
+        " or t.created_at is null"
+    )
+    assert partitioning.get_query_partitions_filter([]) == "false"
+
+
+def test_get_query_partition_id():
+    partitioning = TimePartitioning(column="day", partition_type="DAY", field_type="DATE")
+
+    assert partitioning.get_query_partition_id() == "coalesce(format_timestamp('%Y%m%d', cast(day as timestamp)), '__NULL__')"
+    assert partitioning.get_query_partitions_filter(["20240229"]) == "(day >= date '2024-02-29' and day < date '2024-03-01')"
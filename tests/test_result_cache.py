@@ -0,0 +1,100 @@
+import os
+
+import pandas as pd
+from sqlglot import parse_one
+
+from data_check.cache import TTLCache
+from data_check.query.result_cache import (CachedQueryClient, ResultCache,
+                                           get_referenced_tables,
+                                           is_deterministic)
+from tests.fake_client import FakeQueryClient
+
+QUERY = parse_one(
+    "with table1 as (select * from `my-project.my_dataset.table1`) select * from table1 join my_dataset.table2 using (A)",
+    dialect="bigquery",
+)
+
+
+def test_get_referenced_tables():
+    assert get_referenced_tables(QUERY) == ["my-project.my_dataset.table1", "my_dataset.table2"]
+
+
+def test_is_deterministic():
+    assert is_deterministic(QUERY)
+    assert not is_deterministic(parse_one("select current_date() as d from table1", dialect="bigquery"))
+    assert not is_deterministic(parse_one("select * from table1 where rand() < 0.1", dialect="bigquery"))
+    assert not is_deterministic(
+        parse_one("select * from table1 tablesample system (10 percent)", dialect="bigquery")
+    )
+    assert not is_deterministic(parse_one("select now() as n from table1", dialect="duckdb"))
+
+
+def test_cached_query_client_serves_unchanged_tables_from_disk(tmp_path):
+    df = pd.DataFrame({"A": [1, 2], "B": ["x", "y"]})
+    client = FakeQueryClient(
+        results=[df, df],
+        last_modified={"my-project.my_dataset.table1": "2024-01-01", "my_dataset.table2": "2024-01-01"},
+    )
+    now = [0]
+    last_modified_cache = TTLCache(ttl_seconds=30, clock=lambda: now[0])
+    cached_client = CachedQueryClient(client, ResultCache(str(tmp_path)), last_modified_cache)
+
+    first = cached_client.run_query_to_dataframe(QUERY)
+    second = CachedQueryClient(
+        client, ResultCache(str(tmp_path)), last_modified_cache
+    ).run_query_to_dataframe(QUERY)
+    assert len(client.queries) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+    # Last modifications are memoized for a short time
+    client.last_modified["my_dataset.table2"] = "2024-01-02"
+    cached_client.run_query_to_dataframe(QUERY)
+    assert len(client.queries) == 1
+
+    now[0] = 31
+    cached_client.run_query_to_dataframe(QUERY)
+    assert len(client.queries) == 2
+
+
+def test_cached_query_client_skips_tables_without_freshness(tmp_path):
+    df = pd.DataFrame({"A": [1]})
+    client = FakeQueryClient(results=[df, df])
+    cached_client = CachedQueryClient(client, ResultCache(str(tmp_path)), TTLCache())
+
+    cached_client.run_query_to_dataframe(QUERY)
+    cached_client.run_query_to_dataframe(QUERY)
+
+    assert len(client.queries) == 2
+    assert list(tmp_path.glob("*.parquet")) == []
+
+
+def test_cached_query_client_skips_non_deterministic_queries(tmp_path):
+    df = pd.DataFrame({"A": [1]})
+    client = FakeQueryClient(
+        results=[df, df], last_modified={"my-project.my_dataset.table1": "2024-01-01"}
+    )
+    cached_client = CachedQueryClient(client, ResultCache(str(tmp_path)), TTLCache())
+    query = parse_one(
+        "select A from `my-project.my_dataset.table1` where date(updated_at) = current_date()",
+        dialect="bigquery",
+    )
+
+    cached_client.run_query_to_dataframe(query)
+    cached_client.run_query_to_dataframe(query)
+
+    assert len(client.queries) == 2
+    assert list(tmp_path.glob("*.parquet")) == []
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    df = pd.DataFrame({"A": range(1000)})
+    cache = ResultCache(str(tmp_path))
+    cache.set("old", df)
+    cache.set("new", df)
+    os.utime(cache.get_path("old"), (0, 0))
+
+    cache.max_size_bytes = cache.get_path("new").stat().st_size
+    cache.evict()
+
+    assert cache.get("old") is None
+    assert cache.get("new") is not None